@@ -0,0 +1,137 @@
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# Gold palette used by the scan strip check
+# 1. #B47834 -> RGB(180, 120, 52)
+# 2. #C17E25 -> RGB(193, 126, 37)
+GOLD_TARGETS = ((180, 120, 52), (193, 126, 37))
+GOLD_TOLERANCE = 15
+
+
+def card_grid_view(grid, rows, cols, card_h, card_w, pitch_y, pitch_x):
+    # Strided (rows, cols, card_h, card_w, channels) view over a captured grid.
+    # Card (0, 0) sits at the grid origin and the others follow at a fixed pitch,
+    # so no pixel data is copied.
+    grid_h, grid_w = grid.shape[:2]
+    if (rows - 1) * pitch_y + card_h > grid_h or (cols - 1) * pitch_x + card_w > grid_w:
+        raise ValueError(f"grid {grid_w}x{grid_h} too small for {rows}x{cols} cards")
+
+    stride_y, stride_x = grid.strides[:2]
+    shape = (rows, cols, card_h, card_w) + grid.shape[2:]
+    strides = (pitch_y * stride_y, pitch_x * stride_x) + grid.strides
+    return as_strided(grid, shape=shape, strides=strides, writeable=False)
+
+
+def card_brightness(cards):
+    # Average brightness over the last three axes (h, w, channel).
+    # Works for a single card or a whole (rows, cols, ...) view.
+    return cards.mean(axis=(-3, -2, -1))
+
+
+def scan_strip(cards, y_start, y_end, channel_axis=True):
+    # Rows [y_start, y_end) of every card, clamped to the card height
+    h_axis = -3 if channel_axis else -2
+    h = cards.shape[h_axis]
+    rows = slice(min(y_start, h), min(y_end, h))
+    return cards[..., rows, :, :] if channel_axis else cards[..., rows, :]
+
+
+def gold_pixel_counts(cards, y_start, y_end, targets=GOLD_TARGETS, tolerance=GOLD_TOLERANCE):
+    # Count palette pixels inside the scan strip [y_start, y_end) of every card
+    # with per-channel range masks (see palette.py for the lookup table path)
+    strip = scan_strip(cards, y_start, y_end)
+    combined_mask = np.zeros(strip.shape[:-1], dtype=bool)
+
+    for target in targets:
+        lower = np.array([max(0, c - tolerance) for c in target], dtype=np.uint8)
+        upper = np.array([min(255, c + tolerance) for c in target], dtype=np.uint8)
+        combined_mask |= np.all((strip >= lower) & (strip <= upper), axis=-1)
+
+    return combined_mask.sum(axis=(-2, -1))
+
+
+class GridAnalysis:
+    # Per-card result arrays for one frame, each shaped (rows, cols).
+    # palette_counts maps palette name -> scan strip pixel counts.
+    # analyze_grid(out=...) refills one from frame to frame. Its scratch:
+    # work, the cards widened to int32 (sums without numpy's cast buffers,
+    # allocated on first use for the card size), and sums, the cards' pixel
+    # sums. Runs of cards only touch their own views of both, so threads
+    # analyzing disjoint runs can share one GridAnalysis.
+    __slots__ = ('brightness', 'palette_counts', 'work', 'sums')
+
+    def __init__(self, brightness, palette_counts):
+        self.brightness = brightness
+        self.palette_counts = palette_counts
+        self.work = None
+        self.sums = np.zeros(brightness.shape, dtype=np.int32)
+
+    @classmethod
+    def empty(cls, shape, names):
+        return cls(np.zeros(shape), {name: np.zeros(shape, dtype=np.int64) for name in names})
+
+    def clear(self):
+        self.brightness.fill(0)
+        for counts in self.palette_counts.values():
+            counts.fill(0)
+
+    def prepare(self, cards):
+        # Scratch for this card size, before any run is analyzed
+        if self.work is None or self.work.shape != cards.shape:
+            self.work = np.empty(cards.shape, dtype=np.int32)
+
+    @property
+    def gold_counts(self):
+        return self.palette_counts['gold']
+
+
+def card_runs(active, shape):
+    # (row, first col, end col) of each run of cards to analyze, row-major:
+    # whole rows, or the runs of consecutive cards set in the active mask
+    rows, cols = shape
+    if active is None:
+        return [(r, 0, cols) for r in range(rows)]
+    runs = []
+    for r, row in enumerate(active.tolist()):
+        start = None
+        for c, on in enumerate(row + [False]):
+            if on and start is None:
+                start = c
+            elif not on and start is not None:
+                runs.append((r, start, c))
+                start = None
+    return runs
+
+
+def analyze_grid(cards, packed_cards, scan_y_start, scan_y_end, classifier, active=None, out=None):
+    # Whole-grid analysis: a handful of vectorized passes per run of cards
+    # (see card_runs) instead of one Python iteration per card. Frame-to-frame
+    # stability lives in stability.py.
+    # packed_cards is the same view over 0x??RRGGBB packed pixels.
+    # active: optional (rows, cols) mask, other cards read as 0
+    # out: GridAnalysis to refill (see GridAnalysis.empty), nothing is
+    # allocated then
+    strip = scan_strip(packed_cards, scan_y_start, scan_y_end, channel_axis=False)
+    if out is None:
+        out = GridAnalysis.empty(cards.shape[:2], classifier.names)
+    out.clear()
+    out.prepare(cards)
+    analyze_runs(cards, strip, classifier, card_runs(active, cards.shape[:2]), out)
+    return out
+
+
+def analyze_runs(cards, strip, classifier, runs, out):
+    # Fill out's entries for the (row, first col, end col) runs of cards.
+    # Threads analyzing disjoint runs may share out (prepared for cards),
+    # each with its own classifier (see ColorClassifier.fork).
+    size = math.prod(cards.shape[2:])
+    for r, c0, c1 in runs:
+        work = out.work[r, c0:c1]
+        sums = out.sums[r, c0:c1]
+        np.copyto(work, cards[r, c0:c1])
+        np.add.reduce(work, axis=(-3, -2, -1), out=sums)
+        np.divide(sums, size, out=out.brightness[r, c0:c1])
+        classifier.counts(strip[r, c0:c1],
+                          out={name: counts[r, c0:c1] for name, counts in out.palette_counts.items()})
@@ -0,0 +1,724 @@
+import argparse
+import functools
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+from mss.screenshot import ScreenShot
+from PIL import Image
+
+from analysis import GridAnalysis, analyze_grid, card_grid_view, gold_pixel_counts, scan_strip
+from calibration import calibrate, scale_preset
+from capture import screenshot_to_bgra
+from cardstate import SETTLED, TRANSITIONING
+from frames import ArrayFrameSource, FrameSource, NpyFrameSource, SyntheticFrameSource, crop_region
+from geometry import PRESETS, GridGeometry
+from instrument import Instrumentation
+from palette import PALETTES, ColorClassifier, Palette, packed_bgra
+from parallel import ParallelAnalyzer, available_cpus
+from profiles import Profile
+from recognition import CardIndex, CardRecognizer, dhash
+from recording import SessionReader, SessionRecorder
+from render import CardRenderer
+from scheduler import FrameScheduler
+from stability import StabilityTracker
+from tests.helpers import (BufferSource, FakeCanvas, FakePhoto, FakeTk, HeadlessOverlay, alloc_boards,
+                           board_layouts, detection_score, event_addresses, event_clients, fake_desktop, fresh_import,
+                           headless_tracker, run_pipeline, run_process_pipeline, trace_frames, track_boards)
+from tracker import CardTracker
+
+
+def grid_size(preset):
+    # Size of the captured grid rectangle for a resolution preset
+    monitor = GridGeometry.from_preset(preset).monitor
+    return monitor['width'], monitor['height']
+
+
+def fake_screenshot(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    data = bytearray(rng.integers(0, 256, width * height * 4, dtype=np.uint8).tobytes())
+    return ScreenShot.from_size(data, width, height)
+
+
+def capture_pil(shot):
+    # Legacy path: bgra bytes -> PIL RGB image -> numpy copy
+    bgra = shot.bgra
+    img = Image.frombytes("RGB", shot.size, bgra, "raw", "BGRX")
+    arr = np.array(img)
+    copied = len(bgra) + img.width * img.height * 3 + arr.nbytes
+    return arr, copied
+
+
+def capture_zero_copy(shot):
+    arr = screenshot_to_bgra(shot)[..., :3]
+    raw = np.frombuffer(shot.raw, dtype=np.uint8)
+    copied = 0 if np.shares_memory(arr, raw) else arr.nbytes
+    return arr, copied
+
+
+def time_per_frame(fn, arg, frames):
+    fn(arg)
+    start = time.perf_counter()
+    for _ in range(frames):
+        fn(arg)
+    return (time.perf_counter() - start) / frames
+
+
+def bench_capture(args):
+    print(f"{'preset':<6} {'grid':>11} {'mode':<10} {'copied/frame':>14} {'ms/frame':>9}")
+    for name, preset in PRESETS.items():
+        w, h = grid_size(preset)
+        shot = fake_screenshot(w, h)
+        for mode, fn in (('pil', capture_pil), ('zero-copy', capture_zero_copy)):
+            _, copied = fn(shot)
+            ms = time_per_frame(fn, shot, args.frames) * 1000
+            print(f"{name:<6} {w:>5}x{h:<5} {mode:<10} {copied:>12,} B {ms:>9.3f}")
+
+
+def bench_pipeline(args):
+    print(f"{'preset':<6} {'frames':>6} {'fps':>8} {'p50 ms':>7} {'p90 ms':>7} {'p99 ms':>7}  detection")
+    failed = False
+    for name, preset in PRESETS.items():
+        if args.preset and name not in args.preset:
+            continue
+        synth = SyntheticFrameSource(preset, seed=args.seed)
+        source = synth
+        if args.npy:
+            np.save(args.npy, synth.render_stack())
+            source = NpyFrameSource(args.npy)
+        frames = args.frames or len(synth)
+
+        instrumentation = Instrumentation(enabled=args.stages)
+        tracker, lat = run_pipeline(preset, source, frames, instrumentation)
+        p50, p90, p99 = np.percentile(lat, [50, 90, 99]) * 1000
+        hits, false_pos, missed = detection_score(tracker, synth.gold_cards)
+        ok = false_pos == 0 and missed == 0
+        failed |= not ok
+        print(f"{name:<6} {len(lat):>6} {len(lat) / lat.sum():>8.1f} {p50:>7.2f} {p90:>7.2f} {p99:>7.2f}  "
+              f"{'OK' if ok else 'FAIL'} {hits}/{len(synth.gold_cards)} gold, {false_pos} false, {missed} missed")
+        if args.stages:
+            print(instrumentation.format_table().split('\n', 1)[1])
+    return 1 if failed else 0
+
+
+class FullDiffStability:
+    # Previous stability check: uint8 mean abs diff over the whole card crop
+    def __init__(self, diff_threshold=5.0, stable_frames=2):
+        self.diff_threshold = diff_threshold
+        self.stable_frames = stable_frames
+        self.prev = None
+        self.counts = None
+
+    def update(self, cards):
+        if self.prev is None:
+            self.counts = np.zeros(cards.shape[:2], dtype=np.int32)
+        else:
+            diff = np.mean(np.abs(cards - self.prev), axis=(-3, -2, -1))
+            self.counts = np.where(diff < self.diff_threshold, self.counts + 1, 0)
+        self.prev = cards
+        return self.counts >= self.stable_frames
+
+
+def bench_stability(args):
+    print(f"{'preset':<6} {'method':<10} {'ms/frame':>9} {'false stable':>13} {'missed stable':>14}")
+    for name, preset in PRESETS.items():
+        geometry = HeadlessOverlay(preset).card_geometry
+        monitor = geometry.monitor
+
+        synth = SyntheticFrameSource(preset, noise=args.noise, seed=args.seed, loop=False)
+        frames = [synth.grab(monitor)[..., :3] for _ in range(len(synth))]
+        # A card should read stable once its pose has been unchanged for two frame steps.
+        # False stable readings only matter while the face is showing (they could
+        # let a half-flipped card through to gold analysis).
+        phase = synth.phase
+        expected = np.zeros(phase.shape, dtype=bool)
+        expected[2:] = (phase[2:] == phase[1:-1]) & (phase[1:-1] == phase[:-2])
+        face_showing = phase >= 0.5
+
+        for method, checker in (('full-diff', FullDiffStability()), ('signature', StabilityTracker())):
+            elapsed = 0.0
+            false_stable = missed = 0
+            for f, frame in enumerate(frames):
+                cards = card_grid_view(frame, *geometry.layout)
+                start = time.perf_counter()
+                stable = checker.update(cards)
+                elapsed += time.perf_counter() - start
+                false_stable += np.count_nonzero(stable & ~expected[f] & face_showing[f])
+                missed += np.count_nonzero(expected[f] & ~stable)
+            ms = elapsed / len(frames) * 1000
+            print(f"{name:<6} {method:<10} {ms:>9.3f} {false_stable:>13} {missed:>14}")
+
+
+def bench_palette(args):
+    # Scan strip classification: per-channel range masks vs the lookup table
+    # (that they agree is checked in tests/test_palette.py). Extra palettes
+    # stand in for other card rarities, their tables go to a scratch
+    # directory rather than the user's cache.
+    cache = tempfile.TemporaryDirectory()
+    extra = [
+        Palette('bench-silver', [(150, 160, 160)], 15),
+        Palette('bench-purple', [(140, 70, 180)], 15),
+        Palette('bench-blue', [(60, 110, 200)], 15),
+    ]
+    print(f"{'preset':<6} {'palettes':>8} {'mask ms':>8} {'table ms':>9} {'speedup':>8}")
+    for name, preset in PRESETS.items():
+        geometry = HeadlessOverlay(preset).card_geometry
+        y0, y1 = geometry.scan_y_start, geometry.scan_y_end
+        synth = SyntheticFrameSource(preset, seed=args.seed)
+        # A frame with every card face up
+        frame = crop_region(synth.render_pose(1.0), (0, 0), geometry.monitor)
+        cards = card_grid_view(frame[..., :3], *geometry.layout)
+        packed = scan_strip(card_grid_view(packed_bgra(frame), *geometry.layout), y0, y1, channel_axis=False)
+
+        for palettes in ([PALETTES['gold']], [PALETTES['gold']] + extra):
+            classifier = ColorClassifier(palettes, cache.name)
+            bgr = [(tuple(t[::-1] for t in p.targets), p.tolerance) for p in palettes]
+
+            def masks():
+                return [gold_pixel_counts(cards, y0, y1, targets, tol)
+                        for targets, tol in bgr]
+
+            def table():
+                return classifier.counts(packed)
+
+            mask_ms = time_per_frame(lambda _: masks(), None, args.frames) * 1000
+            table_ms = time_per_frame(lambda _: table(), None, args.frames) * 1000
+            print(f"{name:<6} {len(palettes):>8} {mask_ms:>8.3f} {table_ms:>9.3f} {mask_ms / table_ms:>7.1f}x")
+    cache.cleanup()
+
+
+def bench_schedule(args):
+    # Real-time run of the tracking loop: CPU spent on an idle board and
+    # during play, fixed 30 FPS pacing vs the adaptive scheduler
+    print(f"{'preset':<6} {'board':<6} {'pacing':<9} {'frames':>7} {'fps':>6} {'missed':>7} {'cpu s':>7} {'cpu %':>6}")
+    for name, preset in PRESETS.items():
+        synth = SyntheticFrameSource(preset, seed=args.seed)
+        idle = ArrayFrameSource(synth.render_pose(0.0)[None].copy())
+        for board, source in (('idle', idle), ('play', synth)):
+            for pacing, idle_fps in (('fixed', 30), ('adaptive', 5)):
+                tracker = headless_tracker(preset, source)
+                tracker.scheduler = FrameScheduler(30, idle_fps)
+                tracker.running = True
+                worker = threading.Thread(target=tracker.run_loop, daemon=True)
+
+                cpu = time.process_time()
+                worker.start()
+                time.sleep(args.seconds)
+                tracker.stop()
+                worker.join()
+                cpu = time.process_time() - cpu
+
+                stats = tracker.scheduler.stats()
+                print(f"{name:<6} {board:<6} {pacing:<9} {stats['frames']:>7} {stats['fps']:>6.1f} "
+                      f"{stats['missed']:>7} {cpu:>7.2f} {cpu / args.seconds * 100:>5.0f}%")
+
+
+class LegacyRenderer:
+    # Previous update_card_image: one after() callback, one PhotoImage and a
+    # delete/create on the canvas for every update
+    def __init__(self, canvas, schedule, photo_factory):
+        self.canvas = canvas
+        self.schedule = schedule
+        self.photo_factory = photo_factory
+        self.images = {}
+        self.callbacks = 0
+        self.photos_created = 0
+
+    def post(self, updates):
+        for key, image, x, y in updates:
+            def _update(key=key, image=image, x=x, y=y):
+                self.callbacks += 1
+                self.photos_created += 1
+                self.images[key] = self.photo_factory(image)
+                self.canvas.delete(f'card_img_{key[0]}_{key[1]}')
+                self.canvas.create_image(x, y, image=self.images[key], anchor='nw')
+            self.schedule(_update)
+
+
+def bench_render(args):
+    # Flicker: every card re-posts its overlay image each tracker frame while
+    # the Tk thread only gets a turn every --tk-every frames
+    image = Image.new('RGBA', (137, 39))
+    keys = [(r, c) for r in range(3) for c in range(6)]
+    print(f"{'renderer':<9} {'callbacks/frame':>16} {'photos/frame':>13} {'items/frame':>12} {'max queued':>11}")
+    for name, cls in (('legacy', LegacyRenderer), ('coalesced', CardRenderer)):
+        tk = FakeTk()
+        canvas = FakeCanvas()
+        renderer = cls(canvas, tk.after, FakePhoto)
+        for frame in range(args.frames):
+            renderer.post([(key, image, 0, 0) for key in keys])
+            if frame % args.tk_every == 0:
+                tk.pump()
+        tk.pump()
+        n = args.frames
+        print(f"{name:<9} {renderer.callbacks / n:>16.2f} {renderer.photos_created / n:>13.2f} "
+              f"{canvas.created / n:>12.2f} {tk.max_queue:>11}")
+
+
+def bench_processes(args):
+    # Throughput on a replayed synthetic game: tracker thread in this process
+    # vs the capture/analysis processes, unpaced and paced at --fps. "main
+    # cpu" is what the GUI process itself spends. Detection through the
+    # processes is checked in tests/test_processes.py.
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'preset':<6} {'mode':<12} {'captured/s':>11} {'analyzed/s':>11} {'main cpu':>9}")
+    for name, preset in PRESETS.items():
+        factory = functools.partial(SyntheticFrameSource, preset, seed=args.seed)
+
+        def row(mode, captured, analyzed, cpu):
+            print(f"{name:<6} {mode:<12} {captured:>11.1f} {analyzed:>11.1f} {cpu:>8.0%}")
+
+        source = factory()
+        tracker = headless_tracker(preset, source)
+        frames = 0
+        cpu = time.process_time()
+        start = time.perf_counter()
+        while time.perf_counter() - start < args.seconds:
+            tracker.process_frame(source)
+            frames += 1
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        row('thread', frames / elapsed, frames / elapsed, cpu / elapsed)
+
+        row('process', *run_process_pipeline(preset, factory, args.seconds, None)[:3])
+        game_seconds = len(factory()) / args.fps
+        row(f'process@{args.fps}', *run_process_pipeline(preset, factory, game_seconds, args.fps)[:3])
+
+
+def bench_calibrate(args):
+    # Auto-calibration time on synthetic desktops with face-down boards at
+    # known offsets and scales, and how far the fit is off (accuracy is
+    # checked in tests/test_calibration.py)
+    rng = np.random.default_rng(args.seed)
+    width, height = args.screen
+    reference = PRESETS['FHD']
+    cases = [(name, preset) for name, preset in PRESETS.items()]
+    cases += [(f'x{scale:g}', scale_preset(reference, scale)) for scale in args.scale]
+    print(f"screen {width}x{height}")
+    print(f"{'board':<7} {'offset':>11} {'card':>9} {'found':>9} {'err px':>7} {'ms':>7}")
+    for name, preset in cases + [('none', None)]:
+        screen = fake_desktop(width, height, rng)
+        truth = None
+        if preset is not None:
+            margin = round(preset['cell_w'] * 0.25)
+            board = SyntheticFrameSource(preset, origin=(margin, margin), seed=args.seed)
+            image = board.render_pose(0.0)
+            h, w = image.shape[:2]
+            if w > width or h > height:
+                print(f"{name:<7} board {w}x{h} does not fit, skipped")
+                continue
+            x, y = int(rng.integers(0, width - w + 1)), int(rng.integers(0, height - h + 1))
+            screen[y:y + h, x:x + w] = image
+            truth = (x + board.card_x, y + board.card_y, board.card_w, board.card_h, board.pitch_x, board.pitch_y)
+        if args.noise:
+            jitter = rng.integers(-args.noise, args.noise + 1, size=(height, width, 3), dtype=np.int16)
+            screen[:, :, :3] = np.clip(screen[:, :, :3] + jitter, 0, 255)
+
+        start = time.perf_counter()
+        fit = calibrate(screen, reference)
+        ms = (time.perf_counter() - start) * 1000
+        offset = f"{truth[0]},{truth[1]}" if truth else '-'
+        card = f"{truth[2]}x{truth[3]}" if truth else '-'
+        if fit is None:
+            found, error = '-', None
+        else:
+            found = f"{fit.card_w}x{fit.card_h}"
+            got = (fit.left, fit.top, fit.card_w, fit.card_h, fit.pitch_x, fit.pitch_y)
+            error = max(abs(a - b) for a, b in zip(got, truth)) if truth else None
+        print(f"{name:<7} {offset:>11} {card:>9} {found:>9} {'-' if error is None else error:>7} {ms:>7.1f}")
+
+
+def bench_incremental(args):
+    # Replays the same games through the tracker with every card analyzed
+    # every frame and with the incremental state machine (that both detect
+    # the same is checked in tests/test_incremental.py). Analysis cost is the
+    # stability plus classify stages. --idle-frames stretches the pauses
+    # between turns toward real play, where most cards sit still most of the
+    # time.
+    print(f"{'preset':<6} {'seed':>4} {'noise':>5} {'mode':<12} {'cards/frame':>12} {'analysis ms':>12} "
+          f"{'frame ms':>9}")
+    for name, preset in PRESETS.items():
+        for seed in range(args.seed, args.seed + args.games):
+            for mode in ('full', 'incremental'):
+                synth = SyntheticFrameSource(preset, idle_frames=args.idle_frames, noise=args.noise,
+                                             seed=seed, loop=False)
+                index = CardIndex(
+                    (f'card-{pair}', dhash(face[..., :3])) for (pair, _), face in synth.pair_faces.items()
+                )
+                instrumentation = Instrumentation(enabled=True)
+                tracker = headless_tracker(preset, synth, instrumentation)
+                tracker.incremental = mode == 'incremental'
+                tracker.recognizer = CardRecognizer(index)
+                analyzed = frames = 0
+                while tracker.process_frame(synth):
+                    frames += 1
+                    states = tracker.card_machine.states
+                    analyzed += tracker.stability.counts.size if not tracker.incremental else int(np.count_nonzero(
+                        (states == TRANSITIONING) | (states == SETTLED) | tracker.card_machine.fired))
+
+                stages = instrumentation.snapshot()['stages']
+                analysis_ms = stages['stability']['mean_ms'] + stages['classify']['mean_ms']
+                print(f"{name:<6} {seed:>4} {args.noise:>5} {mode:<12} {analyzed / frames:>12.1f} {analysis_ms:>12.3f} "
+                      f"{stages['frame']['mean_ms']:>9.3f}")
+
+
+def bench_alloc(args):
+    # tracemalloc over --frames tracker frames after one warm-up pass: peak
+    # bytes allocated within a frame (Python objects such as array views are
+    # unavoidable, frame or card sized buffers are not, see tests/test_alloc.py)
+    # and traced memory growth over the run. Overlay images made for new gold
+    # detections are warm-up work, replayed games don't improve on them.
+    print(f"{'preset':<6} {'board':<5} {'mode':<12} {'peak B/frame':>13} {'median':>7} {'growth B':>9} {'gc runs':>8}")
+    for name, preset in PRESETS.items():
+        for board, frames in alloc_boards(preset, args.seed):
+            for mode in ('full', 'incremental'):
+                source = BufferSource(frames)
+                tracker = headless_tracker(preset, source)
+                tracker.incremental = mode == 'incremental'
+                for _ in range(len(frames) + 5):
+                    tracker.process_frame(source)
+                peaks, growth, collections = trace_frames(tracker, source, args.frames, args.settle)
+                print(f"{name:<6} {board:<5} {mode:<12} {peaks.max():>13,} {int(np.median(peaks)):>7,} {growth:>9,} "
+                      f"{collections:>8}")
+
+
+def bench_events(args):
+    # Frame and publish() times with stand-in clients (see event_clients,
+    # what they receive is checked in tests/test_events.py). Handing an
+    # event over may wait for the GIL (one switch interval), never for a
+    # client.
+    preset = PRESETS[args.preset]
+    # Frame times without a publisher, for comparison
+    synth = SyntheticFrameSource(preset, noise=2, seed=args.seed, loop=False)
+    _, latencies = run_pipeline(preset, synth, len(synth))
+    print(f"no events: frame p99 {np.percentile(latencies, 99) * 1000:.2f} ms, "
+          f"switch interval {sys.getswitchinterval() * 1e6:.0f} us")
+    print(f"{'transport':<9} {'frame p99 ms':>12} {'publish p50/max us':>18} {'events':>6} {'flood us/event':>14} "
+          f"{'stalled got':>11} {'dropped':>7}")
+    for address in event_addresses():
+        run = event_clients(address, preset, args.seed, args.queue, args.flood)
+        publish_times = run.publish_times
+        seqs = len(run.stalled) - 1
+        transport = 'unix' if isinstance(address, str) else 'tcp'
+        publish = f'{np.median(publish_times) * 1e6:.0f}/{max(publish_times) * 1e6:.0f}'
+        print(f"{transport:<9} {np.percentile(run.frame_times, 99) * 1000:>12.2f} {publish:>18} {run.game_seq:>6} "
+              f"{run.flood_time / args.flood * 1e6:>14.1f} {seqs:>11} {run.final_seq - seqs:>7}")
+
+
+class TimedSource(FrameSource):
+    # Wraps a source and remembers how long the last grab took
+    def __init__(self, source):
+        self.source = source
+        self.last = 0.0
+
+    def grab(self, region):
+        start = time.perf_counter()
+        frame = self.source.grab(region)
+        self.last = time.perf_counter() - start
+        return frame
+
+
+def tracker_costs(tracker, source, scheduler=None):
+    # Per-frame process_frame time without the capture itself, in ms
+    costs = []
+    while True:
+        start = time.perf_counter()
+        if not tracker.process_frame(source):
+            break
+        costs.append((time.perf_counter() - start - source.last) * 1000)
+        if scheduler is not None:
+            scheduler.wait(True)
+    return np.array(costs)
+
+
+def bench_record(args):
+    # Records a noisy synthetic game through the tracker at --fps: size
+    # against raw captures, tracker cost per frame with and without the
+    # recorder (capture excluded), frames the writer dropped and
+    # reconstruction error against the same game re-rendered. Replay, seeks
+    # and unclosed files are checked in tests/test_recording.py.
+    path = os.path.join(tempfile.mkdtemp(), 'session.rec')
+    print(f"frame budget {1000 / args.fps:.1f} ms")
+    print(f"{'preset':<6} {'frames':>6} {'MB/s':>6} {'raw MB/s':>8} {'ratio':>6} {'record p99':>10} "
+          f"{'p99 off/on ms':>13} {'dropped':>7} {'max err':>7}")
+    for name, preset in PRESETS.items():
+        game = functools.partial(SyntheticFrameSource, preset, noise=args.noise, seed=args.seed, loop=False)
+        source = TimedSource(game())
+        off = tracker_costs(headless_tracker(preset, source), source)
+
+        source = TimedSource(game())
+        instrumentation = Instrumentation(enabled=True)
+        tracker = headless_tracker(preset, source, instrumentation)
+        recorder = tracker.recorder = SessionRecorder(path, compress=not args.raw)
+        on = tracker_costs(tracker, source, FrameScheduler(args.fps, args.fps))
+        recorder.close()
+        stats = recorder.stats()
+        record_p99 = instrumentation.snapshot()['stages']['record']['p99_ms']
+
+        with SessionReader(path) as reader:
+            # Against the same game rendered again (same seed, same noise)
+            replay = game()
+            geometry = HeadlessOverlay(preset).card_geometry
+            max_err = 0
+            for i in range(len(reader)):
+                original = replay.grab(geometry.monitor)
+                max_err = max(max_err, int(np.abs(reader.read(i).astype(np.int16) - original).max()))
+            frames = len(reader)
+
+        seconds = frames / args.fps
+        print(f"{name:<6} {frames:>6} {stats['bytes'] / seconds / 1e6:>6.2f} {stats['raw_bytes'] / seconds / 1e6:>8.1f} "
+              f"{stats['raw_bytes'] / stats['bytes']:>5.0f}x {record_p99:>10.2f} "
+              f"{f'{np.percentile(off, 99):.1f}/{np.percentile(on, 99):.1f}':>13} {stats['dropped']:>7} {max_err:>7}")
+    os.remove(path)
+
+
+def bench_parallel(args):
+    # Card analysis on game frames: serial (analyze_grid) against the thread
+    # pool forced on and in auto mode, per worker count. Every card active
+    # (first frames, full-grid mode) and --sparse random cards per frame (the
+    # incremental tracker's usual load). Auto should not come out much slower
+    # than the better of the two. That results match serial is checked in
+    # tests/test_parallel.py.
+    cpus = available_cpus()
+    print(f"{cpus} CPUs available")
+    print(f"{'preset':<6} {'cards':>5} {'workers':>7} {'serial ms':>10} {'parallel ms':>12} {'auto ms':>8} "
+          f"{'auto from':>9}")
+    rng = np.random.default_rng(args.seed)
+    for name, preset in PRESETS.items():
+        geometry = GridGeometry.from_preset(preset, start=(50, 50))
+        synth = SyntheticFrameSource(preset, noise=args.noise, seed=args.seed)
+        frames = [np.array(synth.grab(geometry.monitor)) for _ in range(args.frames)]
+        views = [(card_grid_view(f[..., :3], *geometry.layout), card_grid_view(packed_bgra(f), *geometry.layout))
+                 for f in frames]
+        grid = views[0][0].shape[:2]
+        masks = [None] * len(views)
+        sparse = []
+        for _ in views:
+            mask = np.zeros(grid, dtype=bool)
+            mask.flat[rng.choice(mask.size, args.sparse, replace=False)] = True
+            sparse.append(mask)
+
+        for label, actives in ((grid[0] * grid[1], masks), (args.sparse, sparse)):
+            for workers in args.workers:
+                classifier = ColorClassifier([PALETTES['gold']])
+                analyzers = {
+                    mode: ParallelAnalyzer(classifier, workers, mode) for mode in ('parallel', 'auto')
+                }
+                expected = GridAnalysis.empty(grid, classifier.names)
+                outs = {mode: GridAnalysis.empty(grid, classifier.names) for mode in analyzers}
+                times = {mode: [] for mode in ('serial',) + tuple(analyzers)}
+                for _ in range(2): # the first pass warms up (and lets auto measure)
+                    for (cards, packed), active in zip(views, actives):
+                        start = time.perf_counter()
+                        analyze_grid(cards, packed, geometry.scan_y_start, geometry.scan_y_end, classifier,
+                                     active, out=expected)
+                        times['serial'].append(time.perf_counter() - start)
+                        for mode, analyzer in analyzers.items():
+                            start = time.perf_counter()
+                            analyzer.analyze(cards, packed, geometry.scan_y_start, geometry.scan_y_end,
+                                             active, outs[mode])
+                            times[mode].append(time.perf_counter() - start)
+                for analyzer in analyzers.values():
+                    analyzer.close()
+
+                ms = {mode: np.median(t[len(views):]) * 1000 for mode, t in times.items()}
+                print(f"{name:<6} {label:>5} {workers:>7} {ms['serial']:>10.3f} {ms['parallel']:>12.3f} "
+                      f"{ms['auto']:>8.3f} {analyzers['auto'].min_cards or '-':>9}")
+
+
+def bench_boards(args):
+    # Several boards on one desktop, merged grabs against one tracker per
+    # board (see track_boards, that both track the same is checked in
+    # tests/test_boards.py)
+    preset = PRESETS[args.preset]
+    print(f"{'layout':<9} {'boards':>6} {'grabs/tick':>11} {'MPx/tick':>13} {'covered':>8} {'ms/tick':>13}")
+    for layout, boards in board_layouts(preset).items():
+        shared = track_boards(preset, boards, True, args.noise, args.seed)
+        separate = track_boards(preset, boards, False, args.noise, args.seed)
+        print(f"{layout:<9} {len(boards):>6} {shared.grabs:>5.0f} / {separate.grabs:<3.0f} "
+              f"{shared.pixels / 1e6:>5.2f} / {separate.pixels / 1e6:<5.2f} {shared.covered / 1e6:>8.2f} "
+              f"{shared.seconds * 1000:>5.1f} / {separate.seconds * 1000:<5.1f}")
+
+
+def bench_profiles(args):
+    # Session start from a saved profile (compiled classifier table
+    # memory-mapped) against building the classifier the old way, in a
+    # scratch directory. Round trips, unreadable files and caches and
+    # resolutions added as data are checked in tests/test_profiles.py.
+    def timed(fn):
+        start = time.perf_counter()
+        result = fn()
+        return result, (time.perf_counter() - start) * 1000
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = os.path.join(directory, 'cache')
+        gold = [PALETTES['gold']]
+        _, first_ms = timed(lambda: ColorClassifier(gold, cache))
+        rebuild_ms = min(timed(lambda: ColorClassifier(gold, cache))[1] for _ in range(args.runs))
+        _, compile_ms = timed(lambda: ColorClassifier.load(gold, cache))
+        load_ms = min(timed(lambda: ColorClassifier.load(gold, cache))[1] for _ in range(args.runs + 1))
+        print(f"classifier: first build {first_ms:.1f} ms, from palette caches {rebuild_ms:.1f} ms, "
+              f"compile + save {compile_ms:.1f} ms, memory-mapped {load_ms:.2f} ms "
+              f"({rebuild_ms / load_ms:.0f}x faster than rebuilding)")
+
+        # Session start: profile file, geometry and classifier
+        profiles = os.path.join(directory, 'profiles')
+        saved = Profile('board-1', PRESETS['QHD'], 'QHD', (3, 2), 3, 6, (412, 230),
+                        {'brightness': 24}, gold)
+        saved.save(profiles)
+        ColorClassifier.load(saved.palettes, cache)
+
+        def session():
+            profile = Profile.load('board-1', profiles)
+            return profile, profile.geometry(), profile.classifier(cache)
+        start_ms = min(timed(session)[1] for _ in range(args.runs + 1))
+        print(f"session start {start_ms:.2f} ms")
+
+
+def bench_imports(args):
+    # Startup import time per entry point and which heavy modules come with
+    # it (what each may load is checked in tests/test_imports.py)
+    print(f"{'module':<9} {'ms':>6}  loaded")
+    for module in ('tracker', 'headless', 'pipeline', 'main'):
+        runs = [fresh_import(module) for _ in range(args.runs)]
+        print(f"{module:<9} {np.median([ms for ms, _ in runs]):>6.1f}  {' '.join(runs[-1][1]) or '-'}")
+
+
+def bench_recognition(args):
+    # Identify the cards of a noisy synthetic game from an index built on
+    # the clean faces; count how many hashes that took (that every card is
+    # identified is checked in tests/test_recognition.py)
+    print(f"{'preset':<6} {'frames':>6} {'hashed':>7} {'identified':>11} {'wrong':>6} {'pairs':>6}")
+    for name, preset in PRESETS.items():
+        synth = SyntheticFrameSource(preset, noise=args.noise, seed=args.seed, loop=False)
+        index = CardIndex(
+            (f'card-{pair}', dhash(face[..., :3])) for (pair, _), face in synth.pair_faces.items()
+        )
+        overlay = HeadlessOverlay(preset)
+        tracker = CardTracker(overlay, overlay, synth)
+        tracker.recognizer = CardRecognizer(index)
+        frames = 0
+        while tracker.process_frame(synth):
+            frames += 1
+
+        names = tracker.recognizer.names
+        wrong = sum(1 for key, card in names.items() if card != f'card-{synth.card_ids[key]}')
+        pairs = len(tracker.recognizer.pairs())
+        print(f"{name:<6} {frames:>6} {tracker.recognizer.hashed:>7} {len(names):>6}/{len(synth.card_ids):<4} "
+              f"{wrong:>6} {pairs:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Card tracker benchmarks")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('alloc', help="tracker allocations per frame and memory growth (tracemalloc)")
+    p.add_argument('--frames', type=int, default=1000)
+    p.add_argument('--settle', type=int, default=2500)
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=bench_alloc)
+
+    p = sub.add_parser('boards', help="several boards from one capture: merged grabs vs one tracker per board")
+    p.add_argument('--preset', choices=sorted(PRESETS), default='FHD')
+    p.add_argument('--noise', type=int, default=2, help="capture noise amplitude")
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=bench_boards)
+
+    p = sub.add_parser('calibrate', help="grid auto-calibration accuracy and time on synthetic desktops")
+    p.add_argument('--screen', type=int, nargs=2, default=(3840, 2160), metavar=('W', 'H'))
+    p.add_argument('--scale', type=float, action='append', help="extra board scales vs FHD (default: 0.67 1.17 1.5 2)")
+    p.add_argument('--noise', type=int, default=2, help="capture noise amplitude")
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=bench_calibrate)
+
+    p = sub.add_parser('capture', help="bytes copied per frame, mss buffer -> numpy")
+    p.add_argument('--frames', type=int, default=200)
+    p.set_defaults(func=bench_capture)
+
+    p = sub.add_parser('incremental', help="analysis work and detections, full grid vs per-card state machine")
+    p.add_argument('--games', type=int, default=1, help="games per preset, seeds from --seed")
+    p.add_argument('--idle-frames', type=int, default=30, help="still frames between turns")
+    p.add_argument('--noise', type=int, default=2, help="capture noise amplitude")
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=bench_incremental)
+
+    p = sub.add_parser('events', help="event stream with stand-in clients: one keeping up, one stalled, one late")
+    p.add_argument('--preset', choices=sorted(PRESETS), default='FHD')
+    p.add_argument('--queue', type=int, default=256, help="per-client event backlog")
+    p.add_argument('--flood', type=int, default=50000, help="events published after the game")
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=bench_events)
+
+    p = sub.add_parser('imports', help="startup import time and heavy modules per entry point")
+    p.add_argument('--runs', type=int, default=5)
+    p.set_defaults(func=bench_imports)
+
+    p = sub.add_parser('palette', help="scan strip color classification, masks vs lookup table")
+    p.add_argument('--frames', type=int, default=200)
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=bench_palette)
+
+    p = sub.add_parser('profiles', help="session start from saved profiles and compiled tables")
+    p.add_argument('--runs', type=int, default=5)
+    p.set_defaults(func=bench_profiles)
+
+    p = sub.add_parser('recognition', help="card identification on a noisy synthetic game")
+    p.add_argument('--noise', type=int, default=2, help="capture noise amplitude")
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=bench_recognition)
+
+    p = sub.add_parser('record', help="session recording size, cost and replay fidelity")
+    p.add_argument('--fps', type=int, default=30, help="recording rate, and the frame budget")
+    p.add_argument('--noise', type=int, default=2, help="capture noise amplitude")
+    p.add_argument('--raw', action='store_true', help="record without compression")
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=bench_record)
+
+    p = sub.add_parser('render', help="overlay callbacks and allocations per frame under flicker")
+    p.add_argument('--frames', type=int, default=300)
+    p.add_argument('--tk-every', type=int, default=3, help="frames between mainloop turns")
+    p.set_defaults(func=bench_render)
+
+    p = sub.add_parser('stability', help="stability check cost and accuracy on animated flips")
+    p.add_argument('--noise', type=int, default=2, help="capture noise amplitude")
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=bench_stability)
+
+    p = sub.add_parser('schedule', help="real-time CPU use, fixed vs adaptive frame pacing")
+    p.add_argument('--seconds', type=float, default=5.0)
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=bench_schedule)
+
+    p = sub.add_parser('processes', help="throughput, tracker thread vs capture/analysis processes")
+    p.add_argument('--seconds', type=float, default=5.0)
+    p.add_argument('--fps', type=int, default=30, help="capture rate of the paced run")
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=bench_processes)
+
+    p = sub.add_parser('parallel', help="card analysis, serial vs thread pool, across worker counts")
+    p.add_argument('--frames', type=int, default=60)
+    p.add_argument('--workers', type=int, nargs='+', default=[2, 4, 8])
+    p.add_argument('--sparse', type=int, default=3, help="active cards per frame in the sparse run")
+    p.add_argument('--noise', type=int, default=2, help="capture noise amplitude")
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=bench_parallel)
+
+    p = sub.add_parser('pipeline', help="headless tracker throughput and detection on synthetic games")
+    p.add_argument('--preset', action='append', choices=sorted(PRESETS), help="default: all presets")
+    p.add_argument('--frames', type=int, default=0, help="default: one full scripted game")
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--stages', action='store_true', help="print per-stage timings")
+    p.add_argument('--npy', metavar='PATH', help="replay through a memory-mapped .npy frame stack written to PATH")
+    p.set_defaults(func=bench_pipeline)
+
+    args = parser.parse_args()
+    if args.command == 'calibrate' and not args.scale:
+        args.scale = [0.67, 1.17, 1.5, 2.0]
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,174 @@
+import time
+
+from frames import FrameSource, MssFrameSource
+from instrument import Instrumentation
+from scheduler import FrameScheduler
+
+
+def region_area(region):
+    return region['width'] * region['height']
+
+
+def bounding_region(a, b):
+    left = min(a['left'], b['left'])
+    top = min(a['top'], b['top'])
+    right = max(a['left'] + a['width'], b['left'] + b['width'])
+    bottom = max(a['top'] + a['height'], b['top'] + b['height'])
+    return {'top': top, 'left': left, 'width': right - left, 'height': bottom - top}
+
+
+def contains(outer, inner):
+    return (outer['left'] <= inner['left'] and outer['top'] <= inner['top']
+            and inner['left'] + inner['width'] <= outer['left'] + outer['width']
+            and inner['top'] + inner['height'] <= outer['top'] + outer['height'])
+
+
+def merge_regions(regions):
+    # Fewest grabs covering every region without grabbing more pixels than
+    # separate grabs would: two grabs merge into their bounding box while
+    # the box is no larger than both together, i.e. they overlap or abut
+    # enough to pay for the corners it adds.
+    # Returns [(grab region, [indices of the regions inside it])]
+    groups = [(dict(region), [i]) for i, region in enumerate(regions)]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(groups)):
+            for j in range(i + 1, len(groups)):
+                box = bounding_region(groups[i][0], groups[j][0])
+                if region_area(box) <= region_area(groups[i][0]) + region_area(groups[j][0]):
+                    groups[i] = (box, groups[i][1] + groups[j][1])
+                    del groups[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return groups
+
+
+class SharedCapture(FrameSource):
+    # One tick's grabs, handed to every board. grab(region) returns a view of
+    # the grab covering region (no copy), or grabs region from the source if
+    # none does: the board's geometry changed after the tick was planned.
+    def __init__(self, source):
+        self.source = source
+        self.grabs = [] # (region, frame)
+        self.extra = 0
+
+    def capture(self, regions):
+        # Grab every planned region, False once a finite source runs out
+        self.grabs = []
+        for region in regions:
+            frame = self.source.grab(region)
+            if frame is None:
+                return False
+            self.grabs.append((region, frame))
+        return True
+
+    def grab(self, region):
+        for outer, frame in self.grabs:
+            if contains(outer, region):
+                y = region['top'] - outer['top']
+                x = region['left'] - outer['left']
+                return frame[y:y + region['height'], x:x + region['width']]
+        self.extra += 1
+        return self.source.grab(region)
+
+
+class BoardScheduler:
+    # Tracks several boards from one capture source on one thread. A board
+    # is a CardTracker with its own config (geometry), sink (overlay) and
+    # state. Each tick the boards' capture rectangles are merged
+    # (merge_regions) and grabbed once each, and every board analyzes its
+    # part of a grab, so capture cost follows the screen area covered rather
+    # than the number of boards. The tick rate follows the busiest board.
+    #
+    # Boards may be added or removed from another thread, each tick works on
+    # a snapshot of the list. CardTracker's own source and scheduler are not
+    # used.
+    #
+    # instrumentation times one frame per tick, the shared capture plus every
+    # board's stages; boards given the same Instrumentation add their laps to
+    # the tick instead of counting frames of their own.
+    def __init__(self, boards=(), source=None, active_fps=30, idle_fps=5, instrumentation=None):
+        self.boards = list(boards)
+        # FrameSource to capture from; None opens a live mss source in run_loop
+        self.source = source
+        self.scheduler = FrameScheduler(active_fps, idle_fps)
+        self.instrumentation = instrumentation or Instrumentation()
+        self.running = False
+        self.motion = False
+        self.ticks = 0
+        self.grabs = 0
+        self.grabbed_pixels = 0
+        self.capture_time = 0.0
+
+    def add(self, tracker):
+        self.boards = self.boards + [tracker]
+        return tracker
+
+    def remove(self, tracker):
+        self.boards = [board for board in self.boards if board is not tracker]
+
+    def plan(self, boards=None):
+        boards = self.boards if boards is None else boards
+        return merge_regions([board.config.card_geometry.monitor for board in boards])
+
+    def reset(self):
+        for board in self.boards:
+            board.reset()
+
+    def start(self):
+        self.running = True
+        self.run_loop()
+
+    def stop(self):
+        self.running = False
+        self.scheduler.interrupt()
+
+    def run_loop(self):
+        source = self.source or MssFrameSource()
+        self.scheduler.reset()
+        with source:
+            while self.running:
+                if not self.process_tick(source):
+                    self.running = False
+                    break
+                self.scheduler.wait(self.motion)
+                self.instrumentation.dropped = self.scheduler.missed
+
+        for board in self.boards:
+            if board.analyzer is not None:
+                board.analyzer.close()
+
+    def process_tick(self, source):
+        # Capture once for every board and run each board's frame.
+        # Returns False once a finite source runs out of frames.
+        instr = self.instrumentation
+        instr.tick_start()
+        boards = self.boards
+        plan = self.plan(boards)
+        capture = SharedCapture(source)
+        start = time.perf_counter()
+        if not capture.capture([region for region, _ in plan]):
+            return False
+        self.capture_time += time.perf_counter() - start
+        instr.lap('capture')
+        motion = False
+        for board in boards:
+            if not board.process_frame(capture):
+                return False
+            motion |= board.motion
+        instr.tick_end()
+        self.motion = motion
+        self.ticks += 1
+        self.grabs += len(plan) + capture.extra
+        self.grabbed_pixels += sum(region_area(region) for region, _ in plan)
+        return True
+
+    def stats(self):
+        ticks = max(self.ticks, 1)
+        stats = self.scheduler.stats()
+        stats.update(boards=len(self.boards), ticks=self.ticks, grabs_per_tick=self.grabs / ticks,
+                     pixels_per_tick=self.grabbed_pixels / ticks, capture_ms=self.capture_time / ticks * 1000)
+        return stats
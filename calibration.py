@@ -0,0 +1,268 @@
+import numpy as np
+
+# Pixels whose B + G + R sum is below this count as face-down card back
+# (the tracker's BRIGHTNESS_THRESHOLD of 20, per channel)
+DARK_SUM = 60
+
+# Search pyramid: dark-pixel fractions pooled over MEDIUM x MEDIUM blocks,
+# and those pooled again into COARSE x COARSE blocks
+COARSE = 16
+MEDIUM = 4
+# Card scales searched on the coarse level, relative to the reference preset
+MIN_SCALE = 0.5
+MAX_SCALE = 2.5
+SCALE_STEP = 1.02
+# Coarse candidates carried to the medium level, and the scales tried there
+CANDIDATES = 6
+FINE_SCALES = np.linspace(-0.025, 0.025, 11)
+# Minimum contrast for a fit: dark fraction inside the cards minus around them
+MIN_SCORE = 0.5
+
+
+class GridFit:
+    # Card grid found on screen: top-left of card (0, 0) in screen
+    # coordinates, card size and pitch in pixels, and the preset whose card
+    # proportions were searched for
+    __slots__ = ('left', 'top', 'card_w', 'card_h', 'pitch_x', 'pitch_y', 'score', 'reference')
+
+    def __init__(self, left, top, card_w, card_h, pitch_x, pitch_y, score, reference):
+        self.left = left
+        self.top = top
+        self.card_w = card_w
+        self.card_h = card_h
+        self.pitch_x = pitch_x
+        self.pitch_y = pitch_y
+        self.score = score
+        self.reference = reference
+
+    def __repr__(self):
+        return (f'GridFit(left={self.left}, top={self.top}, card={self.card_w}x{self.card_h}, '
+                f'pitch={self.pitch_x}x{self.pitch_y}, score={self.score:.2f})')
+
+    def preset(self, presets):
+        # Resolution preset for this grid. A known preset is used as is when
+        # it matches within a pixel, anything else is scaled from the reference.
+        for preset in presets.values():
+            if (abs(preset['cell_w'] - self.pitch_x) <= 1 and abs(preset['cell_h'] - self.pitch_y) <= 1
+                    and abs(_card_size(preset)[0] - self.card_w) <= 1
+                    and abs(_card_size(preset)[1] - self.card_h) <= 1):
+                return dict(preset)
+        ref_w, ref_h = _card_size(self.reference)
+        return scale_preset(self.reference, self.card_w / ref_w, self.card_h / ref_h,
+                            (self.pitch_x - self.card_w) // 2, (self.pitch_y - self.card_h) // 2)
+
+    def gap(self, preset):
+        # Grid gaps that, with the preset's cells, give the measured pitch
+        return self.pitch_x - preset['cell_w'], self.pitch_y - preset['cell_h']
+
+
+def _card_size(preset):
+    return (preset['cell_w'] - 2 * preset['padding'],
+            preset['cell_h'] - 2 * preset.get('padding_y', preset['padding']))
+
+
+def scale_preset(preset, sx, sy=None, padding_x=None, padding_y=None):
+    # Preset for cards sx (and sy) times the size of `preset`'s. The scan
+    # strip follows the card height, the gold threshold the strip area.
+    sy = sx if sy is None else sy
+    card_w, card_h = _card_size(preset)
+    if padding_x is None:
+        padding_x = round(preset['padding'] * sx)
+    if padding_y is None:
+        padding_y = round(preset.get('padding_y', preset['padding']) * sy)
+    scan_y_start = round(preset['scan_y_start'] * sy)
+    scaled = {
+        'cell_w': round(card_w * sx) + 2 * padding_x,
+        'cell_h': round(card_h * sy) + 2 * padding_y,
+        'padding': padding_x,
+        'scan_y_start': scan_y_start,
+        'scan_y_end': max(scan_y_start + 1, round(preset['scan_y_end'] * sy)),
+        'gold_threshold': max(1, round(preset['gold_threshold'] * sx * sy)),
+    }
+    if padding_y != padding_x:
+        scaled['padding_y'] = padding_y
+    return scaled
+
+
+def dark_mask(frame):
+    # (h, w) bool, pixels dark enough to be a face-down card
+    return frame[..., :3].sum(axis=-1, dtype=np.uint16) < DARK_SUM
+
+
+def pool(fraction, block):
+    # Mean over block x block tiles, trailing partial tiles dropped
+    h, w = fraction.shape[0] // block, fraction.shape[1] // block
+    tiles = fraction[:h * block, :w * block].reshape(h, block, w, block)
+    return tiles.mean(axis=(1, 3), dtype=np.float32)
+
+
+def _integral(a):
+    # Summed-area table with a zero first row and column
+    table = np.zeros((a.shape[0] + 1, a.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(a, axis=0, dtype=np.float64), axis=1, out=table[1:, 1:])
+    return table
+
+
+def _box_sums(table, h, w):
+    # Sum of every h x w box, indexed by its top-left corner
+    return table[h:, w:] - table[:-h, w:] - table[h:, :-w] + table[:-h, :-w]
+
+
+def _grid_scores(table, rows, cols, card_w, card_h, pitch_x, pitch_y, padding):
+    # Score of a rows x cols grid of dark cards at every position of a pooled
+    # map (sizes in map pixels): mean darkness inside the cards minus the
+    # mean darkness of a `padding` wide ring around each. Positions are the
+    # top-left of cell (0, 0), i.e. card (0, 0) minus padding.
+    # Returns None if the grid does not fit.
+    cw, ch = max(1, round(card_w)), max(1, round(card_h))
+    pad = max(1, round(padding))
+    oys = [round(r * pitch_y) for r in range(rows)]
+    oxs = [round(c * pitch_x) for c in range(cols)]
+    ny = table.shape[0] - (oys[-1] + ch + 2 * pad)
+    nx = table.shape[1] - (oxs[-1] + cw + 2 * pad)
+    if ny <= 0 or nx <= 0:
+        return None
+
+    inner = _box_sums(table, ch, cw)
+    outer = _box_sums(table, ch + 2 * pad, cw + 2 * pad)
+    inside = np.zeros((ny, nx))
+    around = np.zeros((ny, nx))
+    for oy in oys:
+        for ox in oxs:
+            inside += inner[oy + pad:oy + pad + ny, ox + pad:ox + pad + nx]
+            around += outer[oy:oy + ny, ox:ox + nx]
+    around -= inside
+    n = rows * cols
+    return inside / (n * cw * ch) - around / (n * ((cw + 2 * pad) * (ch + 2 * pad) - cw * ch))
+
+
+def _edges(profile, expected, window):
+    # Rising and falling edge positions of a dark-fraction profile near the
+    # expected (start, end) of one card
+    diff = np.diff(profile)
+    start, end = expected
+    a0, a1 = max(0, start - window), min(len(diff), start + window)
+    b0, b1 = max(0, end - window), min(len(diff), end + window)
+    if a0 >= a1 or b0 >= b1:
+        return None
+    return a0 + 1 + int(np.argmax(diff[a0:a1])), b0 + 1 + int(np.argmin(diff[b0:b1]))
+
+
+def _fit_axis(edges, card_size):
+    # Card size, pitch and first card position from per-card edges,
+    # or None if the cards are not evenly spaced
+    starts = np.array([e[0] for e in edges], dtype=np.float64)
+    sizes = np.array([e[1] - e[0] for e in edges])
+    size = int(np.median(sizes))
+    if size <= 0 or np.abs(sizes - size).max() > max(2, card_size // 20):
+        return None
+    index = np.arange(len(starts))
+    pitch = int(round(np.polyfit(index, starts, 1)[0])) if len(starts) > 1 else size
+    first = int(round(np.mean(starts - index * pitch)))
+    if np.abs(starts - (first + index * pitch)).max() > 2:
+        return None
+    return size, pitch, first
+
+
+def calibrate(frame, reference, origin=(0, 0), rows=3, cols=6):
+    # Find a rows x cols grid of face-down cards in a BGRA/BGR screen grab.
+    # Card proportions come from the `reference` preset; any scale between
+    # MIN_SCALE and MAX_SCALE of it is searched, coarse to fine:
+    #   1. every scale and position on COARSE-pooled darkness, keeping the
+    #      best CANDIDATES places
+    #   2. nearby scales and positions on MEDIUM-pooled darkness
+    #   3. card edges from full resolution column/row profiles
+    # origin: screen position of frame[0, 0]. Returns a GridFit or None.
+    ref_w, ref_h = _card_size(reference)
+    ref_pad_x = (reference['cell_w'] - ref_w) / 2
+    ref_pad_y = (reference['cell_h'] - ref_h) / 2
+
+    def shape(scale, block):
+        # Card and pitch sizes at a scale, in pixels of a map pooled by block
+        return (ref_w * scale / block, ref_h * scale / block,
+                reference['cell_w'] * scale / block, reference['cell_h'] * scale / block,
+                min(ref_pad_x, ref_pad_y) * scale / block)
+
+    dark = dark_mask(frame)
+    medium = pool(dark, MEDIUM)
+    coarse = pool(medium, COARSE // MEDIUM)
+
+    # 1. Coarse: best position per scale, then the best distinct places
+    table = _integral(coarse)
+    found = []
+    scale = MIN_SCALE
+    while scale <= MAX_SCALE:
+        scores = _grid_scores(table, rows, cols, *shape(scale, COARSE))
+        if scores is None:
+            break
+        y, x = np.unravel_index(int(np.argmax(scores)), scores.shape)
+        found.append((float(scores[y, x]), scale, int(y), int(x)))
+        scale *= SCALE_STEP
+    candidates = []
+    for score, scale, y, x in sorted(found, reverse=True):
+        if len(candidates) == CANDIDATES:
+            break
+        pitch = reference['cell_w'] * scale / COARSE
+        if all(abs(x - cx) > pitch / 2 or abs(y - cy) > pitch / 2 for _, _, cy, cx in candidates):
+            candidates.append((score, scale, y, x))
+
+    # 2. Medium: scales around each candidate, positions within two coarse
+    # blocks of it
+    ratio = COARSE // MEDIUM
+    reach = 2 * ratio
+    best = None
+    for _, coarse_scale, cy, cx in candidates:
+        y0 = max(0, cy * ratio - reach)
+        x0 = max(0, cx * ratio - reach)
+        card_w, card_h, pitch_x, pitch_y, pad = shape(coarse_scale * (1 + FINE_SCALES[-1]), MEDIUM)
+        y1 = cy * ratio + reach + round((rows - 1) * pitch_y + card_h + 2 * pad) + 2
+        x1 = cx * ratio + reach + round((cols - 1) * pitch_x + card_w + 2 * pad) + 2
+        table = _integral(medium[y0:y1, x0:x1])
+        for step in FINE_SCALES:
+            scale = coarse_scale * (1 + step)
+            scores = _grid_scores(table, rows, cols, *shape(scale, MEDIUM))
+            if scores is None:
+                continue
+            scores = scores[:2 * reach + 1, :2 * reach + 1]
+            y, x = np.unravel_index(int(np.argmax(scores)), scores.shape)
+            if best is None or scores[y, x] > best[0]:
+                best = (float(scores[y, x]), scale, y0 + int(y), x0 + int(x))
+    if best is None or best[0] < MIN_SCORE:
+        return None
+
+    # 3. Full resolution: card edges from darkness profiles across the grid
+    score, scale, my, mx = best
+    card_w, card_h, pitch_x, pitch_y, pad = shape(scale, 1)
+    pad = max(MEDIUM, round(pad / MEDIUM) * MEDIUM)
+    top = my * MEDIUM + pad
+    left = mx * MEDIUM + pad
+    window = MEDIUM * 2 + 2
+    # Rows through the middle of each card row / columns through each card column
+    row_band = np.concatenate([np.arange(round(top + r * pitch_y + card_h / 4), round(top + r * pitch_y + card_h * 3 / 4))
+                               for r in range(rows)])
+    col_band = np.concatenate([np.arange(round(left + c * pitch_x + card_w / 4), round(left + c * pitch_x + card_w * 3 / 4))
+                               for c in range(cols)])
+    row_band = row_band[row_band < dark.shape[0]]
+    col_band = col_band[col_band < dark.shape[1]]
+    x_profile = dark[row_band].mean(axis=0)
+    y_profile = dark[:, col_band].mean(axis=1)
+
+    x_edges = [_edges(x_profile, (round(left + c * pitch_x), round(left + c * pitch_x + card_w)), window)
+               for c in range(cols)]
+    y_edges = [_edges(y_profile, (round(top + r * pitch_y), round(top + r * pitch_y + card_h)), window)
+               for r in range(rows)]
+    if None in x_edges or None in y_edges:
+        return None
+    x_fit = _fit_axis(x_edges, round(card_w))
+    y_fit = _fit_axis(y_edges, round(card_h))
+    if x_fit is None or y_fit is None:
+        return None
+    card_w, pitch_x, left = x_fit
+    card_h, pitch_y, top = y_fit
+    return GridFit(origin[0] + left, origin[1] + top, card_w, card_h, pitch_x, pitch_y, score, reference)
+
+
+def grab_screen(source):
+    # Whole virtual screen from an MssFrameSource, as (frame, origin)
+    monitor = source.sct.monitors[0]
+    return source.grab(monitor), (monitor['left'], monitor['top'])
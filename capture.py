@@ -0,0 +1,19 @@
+import numpy as np
+
+
+def screenshot_to_bgra(screenshot):
+    # (h, w, 4) BGRA view straight over the mss buffer, no copy.
+    # The view keeps the screenshot's bytearray alive.
+    w, h = screenshot.size
+    return np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(h, w, 4)
+
+
+def grab_bgra(sct, region):
+    # mss region: {'top': y, 'left': x, 'width': w, 'height': h}
+    return screenshot_to_bgra(sct.grab(region))
+
+
+def bgr_to_rgb(arr):
+    # Reorder channels only for the pixels that leave the analysis path
+    # (e.g. overlay crops). Drops the X channel if present.
+    return np.ascontiguousarray(arr[..., 2::-1])
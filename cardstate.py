@@ -0,0 +1,150 @@
+import numpy as np
+
+from analysis import GridAnalysis
+
+# Per-card tracking states
+IDLE, TRANSITIONING, SETTLED, RESOLVED = range(4)
+STATE_NAMES = ('idle', 'transitioning', 'settled', 'resolved')
+
+
+class CardStateMachine:
+    # Decides which cards need full analysis each frame.
+    #
+    #   TRANSITIONING -> IDLE      stable and face down
+    #   TRANSITIONING -> SETTLED   stable and face up
+    #   SETTLED       -> RESOLVED  after resolve_frames analyzed frames
+    #   SETTLED       -> TRANSITIONING  no longer stable
+    #   IDLE/RESOLVED -> TRANSITIONING  probe fired
+    #
+    # IDLE and RESOLVED cards only get a probe: every probe_step-th pixel in
+    # both directions compared with the samples taken when the card entered
+    # the state. It fires once min_pixels samples moved by more than
+    # pixel_diff (summed over channels), which capture noise does not reach.
+    #
+    # Arrays are allocated for the first frame (or a new grid) and updated in
+    # place; the masks probe() and update() return are reused every frame.
+    def __init__(self, probe_step=16, pixel_diff=24, min_pixels=3, resolve_frames=3):
+        self.probe_step = probe_step
+        self.pixel_diff = pixel_diff
+        self.min_pixels = min_pixels
+        self.resolve_frames = resolve_frames
+        self.reset()
+
+    def reset(self):
+        self.states = None
+        self.settled_frames = None
+        self.reference = None
+        self.fired = None
+
+    def _samples(self, cards):
+        return cards[..., ::self.probe_step, ::self.probe_step, :]
+
+    def _allocate(self, shape):
+        grid = shape[:2]
+        self.states = np.full(grid, TRANSITIONING, dtype=np.int8)
+        self.settled_frames = np.zeros(grid, dtype=np.int32)
+        self.reference = np.empty(shape, dtype=np.int16)
+        self.work = np.empty(shape, dtype=np.int16)
+        self.pixel_moves = np.empty(shape[:-1], dtype=np.int16)
+        self.pixel_moved = np.empty(shape[:-1], dtype=bool)
+        self.moved_counts = np.zeros(grid, dtype=np.int16)
+        self.fired = np.zeros(grid, dtype=bool)
+        self.active = np.ones(grid, dtype=bool)
+        self.settled = np.zeros(grid, dtype=bool)
+        self.down = np.zeros(grid, dtype=bool)
+        self.resting = np.zeros(grid, dtype=bool)
+        self.mask = np.zeros(grid, dtype=bool)
+
+    def probe(self, cards):
+        # Returns the (rows, cols) mask of cards to analyze this frame.
+        # Cards whose probe fired are in it, and in `fired`.
+        samples = self._samples(cards)
+        if self.states is None or self.reference.shape != samples.shape:
+            # First frame or geometry changed: analyze everything
+            self._allocate(samples.shape)
+            np.copyto(self.reference, samples)
+            return self.active
+
+        resting, mask = self.resting, self.mask
+        np.equal(self.states, IDLE, out=resting)
+        np.equal(self.states, RESOLVED, out=mask)
+        np.logical_or(resting, mask, out=resting)
+
+        # Samples that moved by more than pixel_diff, counted per card
+        work = self.work
+        np.copyto(work, samples)
+        np.subtract(work, self.reference, out=work)
+        np.abs(work, out=work)
+        np.add.reduce(work, axis=-1, out=self.pixel_moves)
+        np.greater(self.pixel_moves, self.pixel_diff, out=self.pixel_moved)
+        np.copyto(self.pixel_moves, self.pixel_moved)
+        np.add.reduce(self.pixel_moves, axis=(-2, -1), out=self.moved_counts)
+        np.greater_equal(self.moved_counts, self.min_pixels, out=self.fired)
+        np.logical_and(self.fired, resting, out=self.fired)
+        np.copyto(self.states, TRANSITIONING, where=self.fired)
+
+        np.logical_not(resting, out=self.active)
+        np.logical_or(self.active, self.fired, out=self.active)
+        return self.active
+
+    def update(self, cards, active, stable, face_up):
+        # Feed the analysis of the active cards. Returns the mask of cards
+        # settled face up this frame (what the old full-grid check called
+        # stable and flipped).
+        settled, down, mask = self.settled, self.down, self.mask
+        np.logical_and(active, stable, out=mask)
+        np.logical_and(mask, face_up, out=settled)
+        np.logical_not(face_up, out=down)
+        np.logical_and(down, mask, out=down)
+        # Active but not stable
+        np.logical_not(mask, out=mask)
+        np.logical_and(mask, active, out=mask)
+        np.copyto(self.states, TRANSITIONING, where=mask)
+
+        np.copyto(self.states, IDLE, where=down)
+        np.copyto(self.states, SETTLED, where=settled)
+        # Consecutive settled frames, anything else starts over
+        np.add(self.settled_frames, 1, out=self.settled_frames)
+        np.logical_not(settled, out=mask)
+        np.copyto(self.settled_frames, 0, where=mask)
+        resolved = mask
+        np.greater_equal(self.settled_frames, self.resolve_frames, out=resolved)
+        np.logical_and(resolved, settled, out=resolved)
+        np.copyto(self.states, RESOLVED, where=resolved)
+
+        # New probe references for cards coming to rest
+        resting = self.resting
+        np.logical_or(down, resolved, out=resting)
+        if resting.any():
+            np.copyto(self.reference, self._samples(cards), where=resting[..., None, None, None])
+        return settled
+
+    def counts(self):
+        # {state name: number of cards}
+        if self.states is None:
+            return {}
+        return {name: int(np.count_nonzero(self.states == state)) for state, name in enumerate(STATE_NAMES)}
+
+
+class CardBuffers:
+    # The tracker's per-card arrays for one (rows, cols) grid: the best gold
+    # count seen on each card, and masks rebuilt in place every frame
+    __slots__ = ('best_gold', 'face_up', 'settled', 'candidates', 'improved', 'tried', 'pending', 'analysis',
+                 'resting_up', 'was_settled', 'at_rest', 'changes')
+
+    def __init__(self, shape, palette_names):
+        self.best_gold = np.zeros(shape, dtype=np.int64)
+        self.face_up = np.zeros(shape, dtype=bool)
+        self.settled = np.zeros(shape, dtype=bool)
+        self.candidates = np.zeros(shape, dtype=bool)
+        self.improved = np.zeros(shape, dtype=bool)
+        # Identification attempts in the current settle, and new ones
+        self.tried = np.zeros(shape, dtype=bool)
+        self.pending = np.zeros(shape, dtype=bool)
+        self.analysis = GridAnalysis.empty(shape, palette_names)
+        # Card events (tracker.events): face at the last rest, last frame's
+        # settled mask, and scratch
+        self.resting_up = np.zeros(shape, dtype=bool)
+        self.was_settled = np.zeros(shape, dtype=bool)
+        self.at_rest = np.zeros(shape, dtype=bool)
+        self.changes = np.zeros(shape, dtype=bool)
@@ -0,0 +1,253 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import stat
+import threading
+import time
+from collections import deque
+
+# Per-subscriber event backlog; the oldest events go first when it is full
+QUEUE_SIZE = 256
+# Bytes the transport may hold for a subscriber before the backlog fills up
+WRITE_BUFFER = 16 * 1024
+DEFAULT_ADDRESS = '127.0.0.1:8765'
+
+
+def parse_address(text):
+    # 'host:port' (localhost TCP), anything else is a Unix socket path
+    host, sep, port = text.rpartition(':')
+    if sep and port.isdigit():
+        return (host or '127.0.0.1', int(port))
+    return text
+
+
+def _encode(message):
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode()
+
+
+class Subscriber:
+    __slots__ = ('queue', 'ready', 'dropped', 'sent')
+
+    def __init__(self, size):
+        self.queue = deque(maxlen=size)
+        self.ready = asyncio.Event()
+        self.dropped = 0
+        self.sent = 0
+
+
+class EventPublisher:
+    # Streams card events to local clients as JSON lines:
+    #
+    #   {"seq":7,"t":1700000000.123,"type":"gold","r":0,"c":3,"count":42}
+    #
+    # Types: flip (up: true/false, a card came to rest showing the other
+    # face), settle (card face up and still), gold (count: best gold pixel
+    # count so far), name (name: identified card) and reset. seq counts every
+    # event published, so a gap means the client fell behind and lost events.
+    # A client first receives a snapshot with the seq it is current to:
+    #
+    #   {"seq":6,"type":"snapshot","cards":[{"r":0,"c":3,"up":true,"gold":42}]}
+    #
+    # The server runs on its own thread and event loop. publish() only hands
+    # the event to that loop, so it never waits on a client; each client has
+    # a backlog of queue_size events that drops the oldest when it overflows.
+    #
+    # address: ('127.0.0.1', port) or a Unix socket path (not on Windows),
+    # port 0 picks a free port, see `address` once started
+    def __init__(self, address=DEFAULT_ADDRESS, queue_size=QUEUE_SIZE):
+        self.address = parse_address(address) if isinstance(address, str) else address
+        self.queue_size = queue_size
+        self.loop = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.error = None
+
+        # Event loop thread only
+        self.seq = 0
+        self.cards = {} # (row, col) -> snapshot fields
+        self.subscribers = set()
+        self.clients = set() # connection handler tasks
+        self.dropped = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='card-events', daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def close(self):
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._stop.set)
+            except RuntimeError:
+                pass # already closed
+            self.thread.join(timeout=2)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def publish(self, kind, row=None, col=None, **fields):
+        # Any thread, returns at once
+        event = {'t': round(time.time(), 3), 'type': kind}
+        if row is not None:
+            event['r'] = row
+            event['c'] = col
+        event.update(fields)
+        loop = self.loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._dispatch, event)
+        except RuntimeError:
+            pass # publisher closed
+
+    def stats(self):
+        return {'published': self.seq, 'subscribers': len(self.subscribers), 'dropped': self.dropped}
+
+    def _run(self):
+        try:
+            asyncio.run(self._serve())
+        except Exception as e:
+            self.error = e
+        finally:
+            self.loop = None
+            self.ready.set()
+
+    async def _serve(self):
+        self._stop = asyncio.Event()
+        if isinstance(self.address, str):
+            # A socket file left behind by an earlier run would fail the bind
+            if os.path.exists(self.address) and stat.S_ISSOCK(os.stat(self.address).st_mode):
+                os.unlink(self.address)
+            server = await asyncio.start_unix_server(self._client, self.address)
+        else:
+            server = await asyncio.start_server(self._client, *self.address)
+            self.address = server.sockets[0].getsockname()[:2]
+        self.loop = asyncio.get_running_loop()
+        self.ready.set()
+        async with server:
+            await self._stop.wait()
+            # Let connection handlers close their clients before the loop goes
+            await asyncio.gather(*self.clients, return_exceptions=True)
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def _dispatch(self, event):
+        self.seq += 1
+        message = {'seq': self.seq}
+        message.update(event)
+        self._apply(message)
+        data = _encode(message)
+        for sub in self.subscribers:
+            if len(sub.queue) == sub.queue.maxlen:
+                sub.dropped += 1
+                self.dropped += 1
+            sub.queue.append(data)
+            sub.ready.set()
+
+    def _apply(self, event):
+        # Keep the per-card state the snapshot reports
+        kind = event['type']
+        if kind == 'reset':
+            self.cards.clear()
+            return
+        if 'r' not in event:
+            return
+        card = self.cards.setdefault((event['r'], event['c']), {'r': event['r'], 'c': event['c']})
+        if kind == 'flip':
+            card['up'] = event['up']
+        elif kind == 'settle':
+            card['up'] = True
+        elif kind == 'gold':
+            card['gold'] = event['count']
+        elif kind == 'name':
+            card['name'] = event['name']
+
+    def _snapshot(self):
+        cards = [dict(card) for _, card in sorted(self.cards.items())]
+        return _encode({'seq': self.seq, 'type': 'snapshot', 'cards': cards})
+
+    async def _client(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=WRITE_BUFFER)
+        # Snapshot and registration in one loop step, nothing published in between
+        writer.write(self._snapshot())
+        sub = Subscriber(self.queue_size)
+        self.subscribers.add(sub)
+        self.clients.add(asyncio.current_task())
+        sender = asyncio.ensure_future(self._send(sub, writer))
+        # Clients don't send anything, reading only notices them leaving
+        closed = asyncio.ensure_future(self._wait_closed(reader))
+        stopped = asyncio.ensure_future(self._stop.wait())
+        try:
+            await asyncio.wait((sender, closed, stopped), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.subscribers.discard(sub)
+            self.clients.discard(asyncio.current_task())
+            for task in (sender, closed, stopped):
+                task.cancel()
+            writer.close()
+
+    async def _send(self, sub, writer):
+        try:
+            while True:
+                await sub.ready.wait()
+                sub.ready.clear()
+                while sub.queue:
+                    writer.write(sub.queue.popleft())
+                    sub.sent += 1
+                    # Waits while this client's socket is full, events meanwhile
+                    # pile up (and drop) in its queue only
+                    await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+
+    @staticmethod
+    async def _wait_closed(reader):
+        try:
+            while await reader.read(4096):
+                pass
+        except (ConnectionError, OSError):
+            pass
+
+
+def connect(address, timeout=None):
+    # Blocking socket to a publisher, address as for EventPublisher
+    if isinstance(address, str):
+        address = parse_address(address)
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(address)
+        return sock
+    return socket.create_connection(address, timeout=timeout)
+
+
+def subscribe(address, timeout=None):
+    # Blocking client: yields events as dicts, the snapshot first, until the
+    # publisher goes away
+    with connect(address, timeout) as sock, sock.makefile('rb') as stream:
+        for line in stream:
+            yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the card events a tracker publishes")
+    parser.add_argument('address', nargs='?', default=DEFAULT_ADDRESS, help="host:port or Unix socket path")
+    args = parser.parse_args()
+    try:
+        for event in subscribe(args.address):
+            print(json.dumps(event, separators=(',', ':')), flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
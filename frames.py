@@ -0,0 +1,248 @@
+import numpy as np
+
+from capture import grab_bgra
+
+# Synthetic board colors (BGR, the order of the raw capture buffer)
+BOARD_BGR = (34, 36, 40)
+FACE_DOWN_BGR = (1, 0, 4) # #040001
+GOLD_BGR = (37, 126, 193) # #C17E25
+SILVER_BGR = (160, 160, 150)
+
+
+class FrameSource:
+    # Supplies frames for a screen region as (h, w, 4) BGRA uint8 arrays.
+    # region: {'top': y, 'left': x, 'width': w, 'height': h}
+    # grab() returns None once a finite source runs out of frames.
+    def grab(self, region):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MssFrameSource(FrameSource):
+    # Live screen capture. mss handles are per thread, so create this in
+    # the thread that grabs.
+    def __init__(self):
+        import mss
+        self.sct = mss.mss()
+
+    def grab(self, region):
+        return grab_bgra(self.sct, region)
+
+    def close(self):
+        self.sct.close()
+
+
+def crop_region(frame, origin, region):
+    # Copy a screen region out of a frame whose top-left is at `origin`
+    x = region['left'] - origin[0]
+    y = region['top'] - origin[1]
+    w, h = region['width'], region['height']
+    if x < 0 or y < 0 or x + w > frame.shape[1] or y + h > frame.shape[0]:
+        raise ValueError(f"region {region} outside of frame {frame.shape[1]}x{frame.shape[0]} at {origin}")
+    # Fresh buffer per grab, like mss
+    return np.array(frame[y:y + h, x:x + w])
+
+
+class ArrayFrameSource(FrameSource):
+    # Replays a (n, h, w, 4) stack of frames. Each grab advances one frame.
+    def __init__(self, frames, origin=(0, 0), loop=True):
+        self.frames = frames
+        self.origin = origin
+        self.loop = loop
+        self.index = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def grab(self, region):
+        if self.index >= len(self.frames):
+            if not self.loop:
+                return None
+            self.index = 0
+        frame = self.frames[self.index]
+        self.index += 1
+        return crop_region(frame, self.origin, region)
+
+
+class NpyFrameSource(ArrayFrameSource):
+    # Memory-mapped .npy frame stack, pages are read on demand
+    def __init__(self, path, origin=(0, 0), loop=True):
+        super().__init__(np.load(path, mmap_mode='r'), origin, loop)
+
+
+class SyntheticFrameSource(FrameSource):
+    # Renders a rows x cols board at preset geometry and plays a scripted game:
+    # cards are flipped face up two at a time (animated), held, then flipped
+    # back down, until every card has been seen once. Like the real game the
+    # board holds pairs of identical faces (card_ids maps each position to its
+    # pair); gold pairs carry the gold palette in their scan strip. noise adds
+    # +/- that much capture noise to every grabbed pixel.
+    FLIP_FRAMES = 6
+
+    def __init__(self, preset, origin=(50, 50), rows=3, cols=6, gold_cards=None,
+                 hold_frames=8, idle_frames=4, noise=0, seed=0, loop=True):
+        rng = np.random.default_rng(seed)
+        self.rng = rng
+        self.noise = noise
+        self.rows = rows
+        self.cols = cols
+        self.loop = loop
+        self.origin = origin
+
+        padding = preset['padding']
+        self.pitch_x = preset['cell_w']
+        self.pitch_y = preset['cell_h']
+        self.card_w = preset['cell_w'] - 2 * padding
+        self.card_h = preset['cell_h'] - 2 * padding
+        self.card_x = origin[0] + padding
+        self.card_y = origin[1] + padding
+
+        # Screen covers the whole grid plus a margin
+        width = origin[0] + cols * self.pitch_x + origin[0]
+        height = origin[1] + rows * self.pitch_y + origin[1]
+        self.screen = np.empty((height, width, 4), dtype=np.uint8)
+        self.screen[:, :, :3] = BOARD_BGR
+        self.screen[:, :, 3] = 255
+
+        cards = [(r, c) for r in range(rows) for c in range(cols)]
+        pair_count = len(cards) // 2
+        ids = rng.permutation(np.arange(len(cards)) // 2)
+        self.card_ids = {card: int(i) for card, i in zip(cards, ids)}
+        if gold_cards is None:
+            gold_pairs = set(rng.choice(pair_count, size=pair_count // 3, replace=False).tolist())
+            gold_cards = {card for card in cards if self.card_ids[card] in gold_pairs}
+        self.gold_cards = set(gold_cards)
+
+        self.back = np.empty((self.card_h, self.card_w, 4), dtype=np.uint8)
+        self.back[:, :, :3] = FACE_DOWN_BGR
+        self.back[:, :, 3] = 255
+        # One face per pair (gold decided per card when overridden)
+        self.pair_faces = {}
+        self.faces = {}
+        for card in cards:
+            key = (self.card_ids[card], card in self.gold_cards)
+            if key not in self.pair_faces:
+                self.pair_faces[key] = self._render_face(rng, preset, key[1])
+            self.faces[card] = self.pair_faces[key]
+
+        self.phase = self._make_script(rng, cards, hold_frames, idle_frames)
+        self.poses = np.full((rows, cols), -1.0)
+        self.index = 0
+
+    def __len__(self):
+        return len(self.phase)
+
+    def _render_face(self, rng, preset, gold):
+        h, w = self.card_h, self.card_w
+        face = np.empty((h, w, 4), dtype=np.uint8)
+        # Card art: a random bright base with a vertical gradient and a few
+        # colored shapes above the scan strip
+        base = rng.integers(70, 200, size=3)
+        shade = np.linspace(0.8, 1.2, h)[:, None, None]
+        face[:, :, :3] = np.clip(base * shade, 0, 255).astype(np.uint8)
+        face[:, :, 3] = 255
+
+        y0, y1 = preset['scan_y_start'], preset['scan_y_end']
+        for _ in range(6):
+            x_a, x_b = np.sort(rng.integers(0, w, size=2))
+            y_a, y_b = np.sort(rng.integers(0, y0 - 8, size=2))
+            face[y_a:y_b + 8, x_a:x_b + 8, :3] = rng.integers(40, 230, size=3)
+
+        strip = face[y0:y1, :, :3]
+        if gold:
+            # Gold trim with slight variation, inside the palette tolerance
+            strip[:] = GOLD_BGR
+            strip += rng.integers(0, 8, size=strip.shape, dtype=np.uint8)
+            strip[:, ::5] = (90, 90, 90) # engraving gaps
+        else:
+            strip[:] = SILVER_BGR
+        # Name plate under the strip
+        face[y1:, :, :3] = (face[y1:, :, :3] // 2)
+        return face
+
+    def _make_script(self, rng, cards, hold_frames, idle_frames):
+        # phase[f, r, c]: 0 face down, 1 face up, in between mid-flip
+        flip = self.FLIP_FRAMES
+        turn = 3 * flip + 2 * hold_frames + idle_frames
+        order = rng.permutation(len(cards))
+        turns = (len(cards) + 1) // 2
+        phase = np.zeros((turns * turn, self.rows, self.cols), dtype=np.float32)
+        ramp = np.arange(1, flip + 1, dtype=np.float32) / flip
+
+        for t in range(turns):
+            f0 = t * turn
+            pair = [cards[i] for i in order[2 * t:2 * t + 2]]
+            down_at = f0 + 2 * flip + 2 * hold_frames
+            for k, (r, c) in enumerate(pair):
+                up_at = f0 + k * (flip + hold_frames)
+                phase[up_at:up_at + flip, r, c] = ramp
+                phase[up_at + flip:down_at, r, c] = 1.0
+                phase[down_at:down_at + flip, r, c] = 1.0 - ramp
+        return phase
+
+    def _draw_card(self, r, c, pose):
+        x = self.card_x + c * self.pitch_x
+        y = self.card_y + r * self.pitch_y
+        dst = self.screen[y:y + self.card_h, x:x + self.card_w]
+        if pose <= 0.0:
+            dst[:] = self.back
+            return
+        if pose >= 1.0:
+            dst[:] = self.faces[(r, c)]
+            return
+
+        # Mid-flip: squeeze horizontally, back first then face
+        img = self.back if pose < 0.5 else self.faces[(r, c)]
+        w = self.card_w
+        new_w = max(1, int(round(w * abs(np.cos(np.pi * pose)))))
+        cols = ((np.arange(new_w) + 0.5) * w / new_w).astype(np.intp)
+        left = (w - new_w) // 2
+        dst[:, :, :3] = BOARD_BGR
+        dst[:, left:left + new_w] = img[:, cols]
+
+    def render(self):
+        # Advance one frame, redrawing only cards whose pose changed
+        if self.index >= len(self.phase):
+            if not self.loop:
+                return None
+            self.index = 0
+        phase = self.phase[self.index]
+        self.index += 1
+        for r, c in zip(*np.nonzero(phase != self.poses)):
+            self._draw_card(r, c, phase[r, c])
+        self.poses[:] = phase
+        return self.screen
+
+    def render_pose(self, pose):
+        # Draw every card at the same pose, outside of the script
+        for r in range(self.rows):
+            for c in range(self.cols):
+                self._draw_card(r, c, pose)
+        self.poses[:] = pose
+        return self.screen
+
+    def grab(self, region):
+        screen = self.render()
+        if screen is None:
+            return None
+        frame = crop_region(screen, (0, 0), region)
+        if self.noise:
+            jitter = self.rng.integers(-self.noise, self.noise + 1, size=frame.shape[:2] + (3,), dtype=np.int16)
+            frame[:, :, :3] = np.clip(frame[:, :, :3] + jitter, 0, 255)
+        return frame
+
+    def render_stack(self, frames=None):
+        # Pre-render frames into a (n, h, w, 4) stack, e.g. for np.save
+        frames = len(self) if frames is None else frames
+        stack = np.empty((frames,) + self.screen.shape, dtype=np.uint8)
+        for i in range(frames):
+            stack[i] = self.render()
+        return stack
@@ -0,0 +1,120 @@
+from dataclasses import dataclass, field
+
+# Resolution Presets
+PRESETS = {
+    'FHD': {
+        'cell_w': 151, 'cell_h': 232,
+        'padding': 7,
+        'scan_y_start': 168, 'scan_y_end': 179,
+        'gold_threshold': 10
+    },
+    'QHD': {
+        'cell_w': 202, 'cell_h': 310,
+        'padding': 9, # 7 * 1.33
+        'scan_y_start': 224, 'scan_y_end': 239, # 168*1.336, 179*1.336
+        'gold_threshold': 18 # 10 * 1.78 (area ratio)
+    }
+}
+# Card proportions auto-calibration searches for, at any scale
+CALIBRATION_REFERENCE = 'FHD'
+
+
+@dataclass(frozen=True)
+class GridGeometry:
+    # Immutable snapshot of the card grid in screen coordinates.
+    # The overlay publishes a new one whenever its window or configuration
+    # changes; the tracker reads one per frame without touching Tk.
+    origin_x: int # screen position of the overlay canvas
+    origin_y: int
+    start_x: int # grid offset inside the canvas
+    start_y: int
+    cell_w: int
+    cell_h: int
+    gap_x: int
+    gap_y: int
+    padding_x: int
+    padding_y: int
+    scan_y_start: int
+    scan_y_end: int
+    gold_threshold: int
+    rows: int = 3
+    cols: int = 6
+
+    # Derived, precomputed in __post_init__
+    monitor: dict = field(init=False, repr=False, compare=False)
+    card_slices: tuple = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # Capture rectangle from the top-left of card (0, 0) to the
+        # bottom-right of the last card
+        left = self.origin_x + self.start_x + self.padding_x
+        top = self.origin_y + self.start_y + self.padding_y
+        monitor = {
+            'top': top,
+            'left': left,
+            'width': (self.cols - 1) * self.pitch_x + self.card_w,
+            'height': (self.rows - 1) * self.pitch_y + self.card_h,
+        }
+        # (y slice, x slice) of every card inside the capture rectangle
+        slices = tuple(
+            tuple(
+                (slice(r * self.pitch_y, r * self.pitch_y + self.card_h),
+                 slice(c * self.pitch_x, c * self.pitch_x + self.card_w))
+                for c in range(self.cols)
+            )
+            for r in range(self.rows)
+        )
+        object.__setattr__(self, 'monitor', monitor)
+        object.__setattr__(self, 'card_slices', slices)
+
+    @property
+    def card_w(self):
+        return self.cell_w - 2 * self.padding_x
+
+    @property
+    def card_h(self):
+        return self.cell_h - 2 * self.padding_y
+
+    @property
+    def pitch_x(self):
+        return self.cell_w + self.gap_x
+
+    @property
+    def pitch_y(self):
+        return self.cell_h + self.gap_y
+
+    @property
+    def layout(self):
+        # Arguments for analysis.card_grid_view after the grid array
+        return (self.rows, self.cols, self.card_h, self.card_w, self.pitch_y, self.pitch_x)
+
+    def card_region(self, row, col):
+        # Global screen coordinates for a card
+        ys, xs = self.card_slices[row][col]
+        return {'top': self.monitor['top'] + ys.start, 'left': self.monitor['left'] + xs.start,
+                'width': self.card_w, 'height': self.card_h}
+
+    def canvas_position(self, row, col):
+        # Top-left of a card inside the overlay canvas
+        ys, xs = self.card_slices[row][col]
+        return self.start_x + self.padding_x + xs.start, self.start_y + self.padding_y + ys.start
+
+    @classmethod
+    def from_preset(cls, preset, origin=(0, 0), start=(50, 50), gap=(0, 0), rows=3, cols=6):
+        return cls(
+            origin_x=origin[0], origin_y=origin[1],
+            start_x=start[0], start_y=start[1],
+            cell_w=preset['cell_w'], cell_h=preset['cell_h'],
+            gap_x=gap[0], gap_y=gap[1],
+            padding_x=preset['padding'], padding_y=preset.get('padding_y', preset['padding']),
+            scan_y_start=preset['scan_y_start'], scan_y_end=preset['scan_y_end'],
+            gold_threshold=preset['gold_threshold'],
+            rows=rows, cols=cols,
+        )
+
+    @classmethod
+    def from_card_origin(cls, preset, card_origin, gap=(0, 0), rows=3, cols=6):
+        # Grid with card (0, 0) at card_origin on screen, no overlay window around it
+        padding_y = preset.get('padding_y', preset['padding'])
+        origin = (card_origin[0] - preset['padding'], card_origin[1] - padding_y)
+        return cls.from_preset(preset, origin=origin, start=(0, 0), gap=gap, rows=rows, cols=cols)
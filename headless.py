@@ -0,0 +1,190 @@
+import argparse
+import sys
+import time
+
+from frames import MssFrameSource, NpyFrameSource, SyntheticFrameSource
+from geometry import CALIBRATION_REFERENCE, GridGeometry
+from profiles import Profile, load_presets, load_profile, profile_dir
+from boards import BoardScheduler
+from tracker import CardTracker, ResultSink, TrackerConfig
+
+
+class PrintSink(ResultSink):
+    # Prints tracker results as they arrive, one line per event, timed from
+    # the start of the run, after prefix (which board)
+    def __init__(self, prefix="", out=None):
+        self.prefix = prefix
+        self.out = out or sys.stdout
+        self.start = time.perf_counter()
+
+    def _print(self, text):
+        print(f"{time.perf_counter() - self.start:8.3f}s  {self.prefix}{text}", file=self.out, flush=True)
+
+    def update_card_images(self, updates):
+        for row, col, _, _ in updates:
+            self._print(f"gold   {row},{col}")
+
+    def update_card_labels(self, labels):
+        self._print("names  " + "  ".join(f"{row},{col}={name}" for row, col, name, _ in labels))
+
+    def clear_marks(self):
+        self._print("reset")
+
+
+def open_source(args, presets):
+    # (FrameSource, screen() -> (frame, origin) to calibrate on)
+    if args.replay:
+        from recording import ReplayFrameSource, SessionReader
+        source = ReplayFrameSource(SessionReader(args.replay))
+        return source, lambda: (source.reader.read(0), (0, 0))
+    if args.synthetic:
+        synth = SyntheticFrameSource(presets[args.preset], noise=args.noise, seed=args.seed, loop=False)
+        return synth, lambda: (synth.render_pose(0.0).copy(), (0, 0))
+    if args.npy:
+        source = NpyFrameSource(args.npy, loop=False)
+        return source, lambda: (source.frames[0], (0, 0))
+
+    from calibration import grab_screen
+    source = MssFrameSource()
+    return source, lambda: grab_screen(source)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Track the card grid without the overlay and print what is found")
+    # Built-in resolutions and those saved profiles add
+    presets = load_presets()
+    parser.add_argument('--preset', choices=sorted(presets), default='FHD')
+    parser.add_argument('--origin', type=int, nargs=2, metavar=('X', 'Y'), action='append',
+                        help="screen position of the top-left card's top-left pixel, repeat to track several boards")
+    parser.add_argument('--gap', type=int, nargs=2, metavar=('X', 'Y'), default=(0, 0))
+    parser.add_argument('--calibrate', action='store_true',
+                        help="find the grid on the first frame instead (all cards face down), any resolution")
+    parser.add_argument('--rows', type=int, default=3)
+    parser.add_argument('--cols', type=int, default=6)
+    parser.add_argument('--npy', metavar='PATH', help="replay a .npy frame stack whose top-left is screen (0, 0)")
+    parser.add_argument('--synthetic', action='store_true', help="play one scripted synthetic game")
+    parser.add_argument('--noise', type=int, default=2, help="synthetic capture noise amplitude")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--frames', type=int, default=0, help="stop after this many frames (default: run until done or Ctrl+C)")
+    parser.add_argument('--fps', type=int, default=30, help="live capture rate while cards move")
+    parser.add_argument('--idle-fps', type=int, default=5, help="live capture rate while the board is still")
+    parser.add_argument('--events', metavar='ADDRESS', help="also stream card events to host:port or a socket path")
+    parser.add_argument('--workers', type=int, metavar='N',
+                        help="analyze cards on N threads when it pays off (0: one per CPU)")
+    parser.add_argument('--record', metavar='PATH', help="record the session to PATH")
+    parser.add_argument('--replay', metavar='PATH', help="play back a session recording (its grid comes with it)")
+    parser.add_argument('--profile', metavar='NAME',
+                        help="start from a saved profile: layout, gaps, grid size, position, thresholds, palettes")
+    parser.add_argument('--save-profile', metavar='NAME', help="save the grid this run tracks (first board) as a profile")
+    args = parser.parse_args()
+    profile = None
+    if args.profile:
+        profile = load_profile(args.profile)
+        if profile is None:
+            parser.error(f"no usable profile {args.profile!r} in {profile_dir()}")
+        if profile.card_origin is None and not (args.origin or args.calibrate):
+            parser.error(f"profile {args.profile!r} has no card position, give --origin or --calibrate")
+    if not (args.origin or args.calibrate or args.synthetic or args.replay or profile):
+        parser.error("give the grid position with --origin, or --calibrate")
+
+    source, screen = open_source(args, presets)
+    gap = tuple(args.gap)
+    rows, cols = (profile.rows, profile.cols) if profile else (args.rows, args.cols)
+    resolution = None
+    if args.replay:
+        # The recording's grid, which the source keeps current from here on
+        config = TrackerConfig(source.reader.geometry_at(0))
+        source.config = config
+    elif args.calibrate:
+        from calibration import calibrate
+
+        frame, origin = screen()
+        fit = calibrate(frame, presets[CALIBRATION_REFERENCE], origin, rows, cols)
+        if fit is None:
+            source.close()
+            print("calibration failed - show the board with all cards face down", file=sys.stderr)
+            return 1
+        print(f"calibrated: {fit!r}")
+        preset = fit.preset(presets)
+        resolution = next((name for name, known in presets.items() if known == preset), None)
+        gap = fit.gap(preset)
+        card_origin = (fit.left, fit.top)
+    elif profile:
+        preset, resolution, gap, card_origin = profile.preset, profile.resolution, profile.gap, profile.card_origin
+    else:
+        preset = presets[args.preset]
+        resolution = args.preset
+        card_origin = (source.card_x, source.card_y) if args.synthetic else None
+    if args.replay:
+        configs = [config]
+    else:
+        origins = [card_origin] if args.calibrate or not args.origin else args.origin
+        configs = [TrackerConfig(GridGeometry.from_card_origin(preset, origin, gap, rows, cols)) for origin in origins]
+        if args.save_profile:
+            saved = Profile(args.save_profile, preset, resolution, gap, rows, cols, origins[0],
+                            profile and profile.thresholds, profile and profile.palettes)
+            print(f"saved profile {args.save_profile!r} to {saved.save()}")
+    publisher = None
+    if args.events:
+        from events import EventPublisher
+        publisher = EventPublisher(args.events).start()
+        print(f"streaming events on {publisher.address}")
+    # Card events and the recording come from the first board
+    boards = [
+        CardTracker(config, PrintSink(f"board {i}  " if len(configs) > 1 else ""), source,
+                    events=publisher if i == 0 else None)
+        for i, config in enumerate(configs)
+    ]
+    if profile is not None:
+        for tracker in boards:
+            tracker.apply_profile(profile)
+    if args.workers is not None:
+        from parallel import ParallelAnalyzer
+        for tracker in boards:
+            tracker.analyzer = ParallelAnalyzer(tracker.classifier, args.workers)
+    if args.record:
+        from recording import SessionRecorder
+        boards[0].recorder = SessionRecorder(args.record)
+    # One capture per tick for every board. Live capture is paced like the
+    # GUI's tracker thread, replays run flat out.
+    runner = BoardScheduler(boards, source, args.fps, args.idle_fps)
+    live = isinstance(source, MssFrameSource)
+    frames = 0
+    try:
+        with source:
+            while not args.frames or frames < args.frames:
+                if not runner.process_tick(source):
+                    break
+                frames += 1
+                if live:
+                    runner.scheduler.wait(runner.motion)
+    except KeyboardInterrupt:
+        pass
+    if publisher is not None:
+        publisher.close()
+    for i, tracker in enumerate(boards):
+        prefix = f"board {i}: " if len(boards) > 1 else ""
+        if tracker.analyzer is not None:
+            tracker.analyzer.close()
+            stats = tracker.analyzer.stats()
+            print(f"{prefix}analysis: {stats['parallel_frames']}/{stats['frames']} frames on {stats['workers']} threads"
+                  + (f" (from {stats['min_cards']} cards)" if stats['min_cards'] else ""))
+        if tracker.recorder is not None:
+            tracker.recorder.close()
+            stats = tracker.recorder.stats()
+            print(f"{prefix}recorded {stats['frames']} frames ({stats['dropped']} dropped), "
+                  f"{stats['bytes'] / 1e6:.1f} MB to {args.record}")
+
+        gold = sorted(card for card, state in tracker.card_states.items() if state == 'GOLD')
+        print(f"{prefix}{frames} frames, gold cards: {' '.join(f'{r},{c}' for r, c in gold) or 'none'}")
+        if tracker.recognizer is not None:
+            names = sorted(tracker.recognizer.names.items())
+            print(f"{prefix}identified: {' '.join(f'{r},{c}={name}' for (r, c), name in names) or 'none'}")
+    if len(boards) > 1:
+        stats = runner.stats()
+        print(f"{stats['grabs_per_tick']:.2f} grabs, {stats['pixels_per_tick'] / 1e6:.2f} MPx per tick")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
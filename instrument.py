@@ -0,0 +1,179 @@
+import bisect
+import csv
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+# Pipeline stages in frame order, plus the whole frame
+STAGES = ('capture', 'record', 'convert', 'crop', 'stability', 'classify', 'dispatch')
+FRAME = 'frame'
+
+
+class StageHistogram:
+    # Fixed-size histogram of durations: log-spaced buckets, 20 per decade
+    # from 1 us to 10 s (plus under/overflow). Percentiles are bucket-accurate.
+    EDGES = np.logspace(-6, 1, 7 * 20 + 1)
+    _edges = EDGES.tolist()
+
+    def __init__(self):
+        self.counts = np.zeros(len(self.EDGES) + 1, dtype=np.int64)
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_right(self._edges, seconds)] += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def percentile(self, q):
+        # Upper edge of the bucket holding the q-th percentile, in seconds
+        counts = self.counts.copy()
+        n = counts.sum()
+        if n == 0:
+            return 0.0
+        i = int(np.searchsorted(np.cumsum(counts), q / 100.0 * n))
+        return min(self.EDGES[min(i, len(self.EDGES) - 1)], self.max)
+
+    def summary(self):
+        n = self.count
+        return {
+            'count': n,
+            'mean_ms': self.total / n * 1000 if n else 0.0,
+            'p50_ms': self.percentile(50) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+class Instrumentation:
+    # Per-stage frame timings for the tracker. Every call is a no-op while
+    # disabled, so it can stay wired into the hot loop.
+    #
+    # Tracker thread: frame_start(), lap(stage) after each stage, frame_end().
+    # UI thread: start() / stop(), snapshot() / export_json() / export_csv().
+    # Whether a frame is timed is decided at its frame_start(): a frame that
+    # was under way when recording was turned on is skipped, its laps would
+    # run from a stale start.
+    #
+    # Several boards tracked on one thread (boards.BoardScheduler) are timed
+    # as one frame per tick: tick_start(), every board's frame, tick_end().
+    # The boards' laps add up and each stage is recorded once per tick.
+    def __init__(self, enabled=False, window=60):
+        self.enabled = enabled
+        self.frame_times = deque(maxlen=window)
+        self._reset_pending = False
+        self._recording = False # the current frame is timed
+        self._tick = None # stage -> seconds so far this tick, None outside a tick
+        self.reset()
+
+    def reset(self):
+        # Clears the recorded timings; from the tracker thread or while no
+        # tracker runs (use start() from the UI thread)
+        self.histograms = {stage: StageHistogram() for stage in STAGES + (FRAME,)}
+        self.frame_times.clear()
+        self.dropped = 0
+        self._frame_t0 = self._t = 0.0
+
+    def start(self):
+        # UI thread: record afresh from the tracker's next frame on
+        self._reset_pending = True
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+
+    def frame_start(self):
+        if self._tick is not None:
+            # A board's frame within the tick: its laps run from here
+            if self._recording:
+                self._t = time.perf_counter()
+            return
+        if self._reset_pending:
+            self._reset_pending = False
+            self.reset()
+        self._recording = self.enabled
+        if not self._recording:
+            return
+        self._frame_t0 = self._t = time.perf_counter()
+
+    def lap(self, stage):
+        # Time since the previous lap (or frame start) goes to `stage`
+        if not self._recording:
+            return
+        now = time.perf_counter()
+        if self._tick is not None:
+            self._tick[stage] = self._tick.get(stage, 0.0) + now - self._t
+        else:
+            self.histograms[stage].record(now - self._t)
+        self._t = now
+
+    def frame_end(self):
+        if not self._recording or self._tick is not None:
+            return
+        now = time.perf_counter()
+        self.histograms[FRAME].record(now - self._frame_t0)
+        self.frame_times.append(now)
+
+    def tick_start(self):
+        self._tick = None
+        self.frame_start()
+        self._tick = {}
+
+    def tick_end(self):
+        tick, self._tick = self._tick, None
+        if not self._recording:
+            return
+        for stage, seconds in tick.items():
+            self.histograms[stage].record(seconds)
+        self.frame_end()
+
+    def fps(self):
+        if len(self.frame_times) < 2:
+            return 0.0
+        span = self.frame_times[-1] - self.frame_times[0]
+        return (len(self.frame_times) - 1) / span if span > 0 else 0.0
+
+    def snapshot(self):
+        return {
+            'fps': self.fps(),
+            'frames': self.histograms[FRAME].count,
+            'dropped': self.dropped,
+            'stages': {stage: hist.summary() for stage, hist in self.histograms.items()},
+        }
+
+    def export_json(self, path):
+        data = self.snapshot()
+        for stage, hist in self.histograms.items():
+            data['stages'][stage]['histogram'] = {
+                'edges_s': StageHistogram.EDGES.tolist(),
+                'counts': hist.counts.tolist(),
+            }
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+    def export_csv(self, path):
+        snapshot = self.snapshot()
+        fields = ['stage', 'count', 'mean_ms', 'p50_ms', 'p99_ms', 'max_ms']
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for stage, summary in snapshot['stages'].items():
+                writer.writerow(dict(summary, stage=stage))
+
+    def format_table(self):
+        # Plain-text summary for the stats panel
+        snapshot = self.snapshot()
+        lines = [
+            f"FPS {snapshot['fps']:5.1f}  frames {snapshot['frames']}  dropped {snapshot['dropped']}",
+            f"{'stage':<10}{'p50 ms':>8}{'p99 ms':>8}",
+        ]
+        for stage, summary in snapshot['stages'].items():
+            lines.append(f"{stage:<10}{summary['p50_ms']:>8.2f}{summary['p99_ms']:>8.2f}")
+        return '\n'.join(lines)
@@ -1,9 +1,20 @@
+import argparse
 import tkinter as tk
+import multiprocessing
 import threading
 from overlay import ControlPanel
-from tracker import CardTracker
+from instrument import Instrumentation
 
-def main():
+def main(use_processes=False, events_address=None, workers=None, boards=1):
+    # use_processes: capture and analysis run in their own processes
+    # (ProcessPipeline) instead of a tracker thread in this one
+    # events_address: publish card events there for other tools (events.py)
+    # workers: analyze cards on this many threads when it pays off
+    # (parallel.py, 0: one per CPU), None analyzes on the tracker thread
+    # boards: game windows to track, each with its own overlay, all from one
+    # capture thread (boards.BoardScheduler). Processes track one board.
+    if use_processes and boards > 1:
+        raise ValueError("the process pipeline tracks one board")
     root = tk.Tk()
     # Root is just a container, we hide it or use it as controller
     root.withdraw() # Hide the main root window, we use ControlPanel and Overlay
@@ -15,15 +26,74 @@ def main():
     
     tracker = None
     tracker_thread = None
+    # Stage timings shown in the stats panel, which turns them on and off
+    # (session recording is headless.py --record only)
+    instrumentation = Instrumentation()
+    
+    def pump_pipeline():
+        # Forward geometry changes and apply result events on the Tk thread
+        tracker.pump()
+        root.after(15, pump_pipeline)
     
     def start_tracking():
         nonlocal tracker, tracker_thread
+        # Tracking modules load on first START, the windows come up without them
+        if use_processes:
+            if tracker is None:
+                from pipeline import ProcessPipeline
+                tracker = ProcessPipeline(app.overlay, events_address=events_address,
+                                          on_error=lambda message: app.status.config(text=message, fg='red'))
+                tracker.start()
+                pump_pipeline()
+            else:
+                tracker.start()
+            return
+        
         if tracker is None:
-            tracker = CardTracker(app) # Pass app to access overlay and debug flag
+            from tracker import CardTracker
+            publisher = None
+            if events_address is not None:
+                from events import EventPublisher
+                publisher = EventPublisher(events_address).start()
+            # Each overlay publishes its grid geometry and draws the results;
+            # card events come from the first board. Several boards are timed
+            # together, one frame per tick (BoardScheduler).
+            trackers = [
+                CardTracker(overlay, overlay, instrumentation=instrumentation, events=publisher if i == 0 else None)
+                for i, overlay in enumerate(app.overlays)
+            ]
+            # Thresholds and palettes of each board's saved profile
+            for board, overlay in zip(trackers, app.overlays):
+                if overlay.profile is not None:
+                    board.apply_profile(overlay.profile)
+            if workers is not None:
+                from parallel import ParallelAnalyzer
+                for board in trackers:
+                    board.analyzer = ParallelAnalyzer(board.classifier, workers)
+            if len(trackers) == 1:
+                tracker = trackers[0]
+            else:
+                from boards import BoardScheduler
+                tracker = BoardScheduler(trackers, instrumentation=instrumentation)
         
+        if tracker_thread is not None and tracker_thread.is_alive():
+            if tracker.running:
+                return
+            # STOP just before: the old loop must be done with the tracker's
+            # buffers (and close its analyzer) before a new one starts.
+            # stop() cut its frame wait short, this is at most one frame.
+            tracker_thread.join()
         tracker.running = True
-        tracker_thread = threading.Thread(target=tracker.run_loop, daemon=True)
+        tracker_thread = threading.Thread(target=run_tracker, args=(tracker,), daemon=True)
         tracker_thread.start()
+    
+    def run_tracker(runner):
+        # Tracker thread: track until STOP, then report how it went
+        runner.run_loop()
+        stats = runner.scheduler.stats()
+        print(f"Tracker stopped: {stats['frames']} frames, {stats['fps']:.1f} fps, {stats['missed']} missed deadlines")
+        if boards > 1:
+            print(f"{runner.stats()['grabs_per_tick']:.2f} grabs per tick for {boards} boards")
         
     def stop_tracking():
         nonlocal tracker
@@ -35,12 +105,41 @@ def main():
         if tracker:
             tracker.reset()
         else:
-            # If tracker not created yet, just clear overlay
-            app.overlay.clear_marks()
+            # If tracker not created yet, just clear the overlays
+            for overlay in app.overlays:
+                overlay.clear_marks()
             
-    app = ControlPanel(root, start_tracking, stop_tracking, reset_tracking)
+    def on_close():
+        if use_processes and tracker:
+            tracker.close()
+        root.destroy()
+            
+    app = ControlPanel(root, start_tracking, stop_tracking, reset_tracking, instrumentation, boards)
+    root.protocol("WM_DELETE_WINDOW", on_close)
     
     root.mainloop()
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Card game overlay")
+    parser.add_argument('--processes', action='store_true',
+                        help="capture and analyze in their own processes (one board only)")
+    # Default is events.DEFAULT_ADDRESS, spelled out so startup doesn't import asyncio
+    parser.add_argument('--events', metavar='ADDRESS', nargs='?', const='127.0.0.1:8765',
+                        help="stream card events to host:port or a socket path (default 127.0.0.1:8765)")
+    parser.add_argument('--workers', type=int, metavar='N',
+                        help="analyze cards on N threads when it pays off (0: one per CPU)")
+    parser.add_argument('--boards', type=int, default=1, metavar='N', help="track N game windows, one overlay each")
+    args = parser.parse_args(argv)
+    if args.workers is not None and args.workers < 0:
+        parser.error("--workers must be 0 or more")
+    if args.boards < 1:
+        parser.error("--boards must be 1 or more")
+    if args.processes and args.boards > 1:
+        parser.error("--processes tracks one board, it can't be combined with --boards above 1")
+    return args
+
 if __name__ == "__main__":
-    main()
+    # Needed for the capture/analysis processes in a frozen exe
+    multiprocessing.freeze_support()
+    args = parse_args()
+    main(use_processes=args.processes, events_address=args.events, workers=args.workers, boards=args.boards)
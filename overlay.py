@@ -1,5 +1,20 @@
 import tkinter as tk
-from ctypes import windll
+from tkinter import filedialog
+
+from geometry import CALIBRATION_REFERENCE, GridGeometry
+from profiles import BOARD_PROFILE, Profile, load_presets, load_profile
+from render import CardRenderer
+
+# Resolution buttons for the built-in presets, others show their name
+RESOLUTION_LABELS = {'FHD': "FHD (1080p)", 'QHD': "QHD (1440p)"}
+
+
+def photo_image(pil_image):
+    # PIL.ImageTk loads on first use, not while the windows come up. numpy
+    # does load at startup: instrument.py and the profiles' palettes need it.
+    from PIL import ImageTk
+    return ImageTk.PhotoImage(pil_image)
+
 
 class CardOverlay(tk.Toplevel):
     def __init__(self, master):
@@ -15,6 +30,10 @@ class CardOverlay(tk.Toplevel):
         self.canvas = tk.Canvas(self, width=1200, height=900, bg='white', highlightthickness=0)
         self.canvas.pack(fill='both', expand=True)
         
+        # Card images: persistent per-slot PhotoImages, updates coalesced
+        # into one callback on the Tk thread
+        self.renderer = CardRenderer(self.canvas, lambda fn: self.after(0, fn), photo_image)
+        
         # Card Grid Configuration
         # Actual card size for pitch calculation
         self.cell_w = 151
@@ -38,21 +57,14 @@ class CardOverlay(tk.Toplevel):
         
         self.click_through = False
         
-        # Resolution Presets
-        self.presets = {
-            'FHD': {
-                'cell_w': 151, 'cell_h': 232,
-                'padding': 7,
-                'scan_y_start': 168, 'scan_y_end': 179,
-                'gold_threshold': 10
-            },
-            'QHD': {
-                'cell_w': 202, 'cell_h': 310,
-                'padding': 9, # 7 * 1.33
-                'scan_y_start': 224, 'scan_y_end': 239, # 168*1.336, 179*1.336
-                'gold_threshold': 18 # 10 * 1.78 (area ratio)
-            }
-        }
+        # Resolution Presets, built in and added by saved profiles
+        self.presets = load_presets()
+        # profiles.Profile this overlay was restored from or last saved to
+        self.profile = None
+        
+        # GridGeometry snapshot read by the tracker thread
+        self.card_geometry = None
+        self.bind('<Configure>', self._on_configure)
         
         self.current_res = 'FHD'
         self.apply_preset('FHD')
@@ -61,11 +73,40 @@ class CardOverlay(tk.Toplevel):
         self.maintain_style()
 
     def apply_preset(self, res_name):
-        preset = self.presets[res_name]
+        self.current_res = res_name
+        self.set_layout(self.presets[res_name])
+
+    def apply_calibration(self, fit):
+        # Take cell size and scan strip from a calibration.GridFit and move
+        # the window so the grid lands on the cards it found
+        self.current_res = None
+        preset = fit.preset(self.presets)
+        self.gap_x, self.gap_y = fit.gap(preset)
+        self.set_layout(preset, (fit.left, fit.top))
+
+    def apply_profile(self, profile):
+        # Layout, gaps, grid size and position of a saved profile
+        self.profile = profile
+        self.current_res = profile.resolution
+        self.gap_x, self.gap_y = profile.gap
+        self.rows, self.cols = profile.rows, profile.cols
+        self.set_layout(profile.preset, profile.card_origin)
+
+    def to_profile(self, name):
+        # The current setup as a profile, keeping the thresholds and palettes
+        # of the one it was restored from
+        monitor = self.card_geometry.monitor
+        base = self.profile
+        return Profile(name, self.preset, self.current_res, (self.gap_x, self.gap_y), self.rows, self.cols,
+                       (monitor['left'], monitor['top']), base and base.thresholds, base and base.palettes)
+
+    def set_layout(self, preset, card_origin=None):
+        # card_origin: screen position of card (0, 0), default centers the grid
+        self.preset = dict(preset)
         self.cell_w = preset['cell_w']
         self.cell_h = preset['cell_h']
         self.padding_x = preset['padding']
-        self.padding_y = preset['padding']
+        self.padding_y = preset.get('padding_y', preset['padding'])
         self.scan_y_start = preset['scan_y_start']
         self.scan_y_end = preset['scan_y_end']
         self.gold_threshold = preset['gold_threshold']
@@ -87,14 +128,40 @@ class CardOverlay(tk.Toplevel):
         req_h = grid_h + (2 * self.start_y)
         
         # Resize Window and Canvas
-        # Center the window on screen
-        screen_w = self.winfo_screenwidth()
-        screen_h = self.winfo_screenheight()
-        x = (screen_w - req_w) // 2
-        y = (screen_h - req_h) // 2
+        if card_origin is None:
+            # Center the window on screen
+            screen_w = self.winfo_screenwidth()
+            screen_h = self.winfo_screenheight()
+            x = (screen_w - req_w) // 2
+            y = (screen_h - req_h) // 2
+        else:
+            # geometry() places the window frame, the canvas sits below the
+            # title bar and inside the border
+            x = card_origin[0] - self.padding_x - self.start_x - (self.winfo_rootx() - self.winfo_x())
+            y = card_origin[1] - self.padding_y - self.start_y - (self.winfo_rooty() - self.winfo_y())
         
         self.geometry(f"{req_w}x{req_h}+{x}+{y}")
         self.canvas.config(width=req_w, height=req_h)
+        self.publish_geometry()
+
+    def publish_geometry(self):
+        # UI thread only. Rebuilds the grid snapshot; replacing the attribute is
+        # atomic, so the tracker sees either the old or the new geometry.
+        self.card_geometry = GridGeometry(
+            origin_x=self.winfo_rootx(), origin_y=self.winfo_rooty(),
+            start_x=self.start_x, start_y=self.start_y,
+            cell_w=self.cell_w, cell_h=self.cell_h,
+            gap_x=self.gap_x, gap_y=self.gap_y,
+            padding_x=self.padding_x, padding_y=self.padding_y,
+            scan_y_start=self.scan_y_start, scan_y_end=self.scan_y_end,
+            gold_threshold=self.gold_threshold,
+            rows=self.rows, cols=self.cols,
+        )
+
+    def _on_configure(self, event):
+        # Window moved or resized (children report here too, ignore them)
+        if event.widget is self:
+            self.publish_geometry()
 
     def maintain_style(self):
         # Periodically enforce click-through if enabled
@@ -130,44 +197,36 @@ class CardOverlay(tk.Toplevel):
         pass
 
     def update_card_image(self, row, col, pil_image, y_offset=0):
-        def _update():
-            # Calculate based on cell pitch
-            cell_x = self.start_x + col * (self.cell_w + self.gap_x)
-            cell_y = self.start_y + row * (self.cell_h + self.gap_y)
-            
-            # Apply padding
-            x = cell_x + self.padding_x
-            y = cell_y + self.padding_y + y_offset
-            
-            # Convert PIL to ImageTk
-            from PIL import ImageTk
-            tk_img = ImageTk.PhotoImage(pil_image)
-            
-            # Store reference to prevent GC
-            if not hasattr(self, 'card_images'):
-                self.card_images = {}
-            self.card_images[(row, col)] = tk_img
-            
-            # Remove old image/text if any
-            self.canvas.delete(f'card_img_{row}_{col}')
-            self.canvas.delete(f'gold_{row}_{col}')
-            
-            # Draw new image
-            self.canvas.create_image(x, y, image=tk_img, anchor='nw', tags=f'card_img_{row}_{col}')
-            
-        self.after(0, _update)
+        self.update_card_images([(row, col, pil_image, y_offset)])
+
+    def update_card_images(self, updates):
+        # Safe from any thread. updates: (row, col, pil_image, y_offset) tuples,
+        # typically everything one tracker frame produced.
+        geometry = self.card_geometry
+        posted = []
+        for row, col, pil_image, y_offset in updates:
+            x, y = geometry.canvas_position(row, col)
+            posted.append(((row, col), pil_image, x, y + y_offset))
+        self.renderer.post(posted)
+
+    def update_card_labels(self, labels):
+        # Safe from any thread. labels: (row, col, text, color) tuples, drawn
+        # at the top of each card
+        geometry = self.card_geometry
+        posted = []
+        for row, col, text, color in labels:
+            x, y = geometry.canvas_position(row, col)
+            posted.append(((row, col), text, color, x + geometry.card_w // 2, y + 4))
+        self.renderer.post_labels(posted)
 
     def clear_marks(self):
-        def _clear():
-            self.canvas.delete('gold')
-            self.canvas.delete('card_img') # Delete all images with this tag
-            if hasattr(self, 'card_images'):
-                self.card_images.clear()
-        self.after(0, _clear)
+        self.renderer.clear()
 
     def set_click_through(self, enable):
         self.click_through = enable
         try:
+            # Windows only, imported here so the module loads elsewhere
+            from ctypes import windll
             hwnd = windll.user32.GetParent(self.winfo_id())
             GWL_EXSTYLE = -20
             WS_EX_LAYERED = 0x80000
@@ -189,6 +248,7 @@ class CardOverlay(tk.Toplevel):
 
     def get_card_region(self, row, col):
         # Returns global screen coordinates for a card
+        # UI thread only, the tracker uses card_geometry instead
         cell_x = self.winfo_rootx() + self.start_x + col * (self.cell_w + self.gap_x)
         cell_y = self.winfo_rooty() + self.start_y + row * (self.cell_h + self.gap_y)
         
@@ -198,25 +258,40 @@ class CardOverlay(tk.Toplevel):
         return {'top': y, 'left': x, 'width': self.card_w, 'height': self.card_h}
 
 class ControlPanel:
-    def __init__(self, root, on_start, on_stop, on_reset):
+    def __init__(self, root, on_start, on_stop, on_reset, instrumentation=None, boards=1):
         self.root = root
         self.root.title("Controls")
-        self.root.geometry("350x400")
+        height = (680 if instrumentation is not None else 440) + (40 if boards > 1 else 0)
+        self.root.geometry(f"350x{height}")
         self.root.attributes('-topmost', True)
         
         self.on_start = on_start
         self.on_stop = on_stop
         self.on_reset = on_reset
         
-        self.overlay = CardOverlay(root)
+        # One overlay per game window, the controls below act on the selected one
+        self.overlays = [CardOverlay(root) for _ in range(boards)]
+        self.selected = 0
+        if boards > 1:
+            for i, overlay in enumerate(self.overlays):
+                overlay.title(f"Card Helper Overlay {i + 1}")
+            board_frame = tk.LabelFrame(root, text="Board", padx=5, pady=5)
+            board_frame.pack(fill='x', padx=10, pady=5)
+            self.var_board = tk.IntVar(value=0)
+            for i in range(boards):
+                tk.Radiobutton(board_frame, text=str(i + 1), variable=self.var_board, value=i,
+                               command=self.select_board).pack(side='left', padx=5)
         
         # --- Resolution Selection ---
         res_frame = tk.LabelFrame(root, text="Resolution", padx=5, pady=5)
         res_frame.pack(fill='x', padx=10, pady=5)
         
         self.var_res = tk.StringVar(value="FHD")
-        tk.Radiobutton(res_frame, text="FHD (1080p)", variable=self.var_res, value="FHD", command=self.change_resolution).pack(side='left', padx=10)
-        tk.Radiobutton(res_frame, text="QHD (1440p)", variable=self.var_res, value="QHD", command=self.change_resolution).pack(side='left', padx=10)
+        for res in self.overlay.presets:
+            tk.Radiobutton(res_frame, text=RESOLUTION_LABELS.get(res, res), variable=self.var_res, value=res, command=self.change_resolution).pack(side='left', padx=10)
+        
+        # Finds the grid on screen instead, any resolution
+        tk.Button(root, text="AUTO Calibrate (all cards face down)", command=self.auto_calibrate).pack(fill='x', padx=10)
         
         # --- Configuration Controls ---
         config_frame = tk.LabelFrame(root, text="Manual Adjust (Optional)", padx=5, pady=5)
@@ -243,29 +318,144 @@ class ControlPanel:
         self.status = tk.Label(root, text="Stopped - Overlay Movable", fg='blue')
         self.status.pack()
         
+        # --- Stats (per-stage tracker timings) ---
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            stats_frame = tk.LabelFrame(root, text="Stats", padx=5, pady=5)
+            stats_frame.pack(fill='x', padx=10, pady=5)
+            
+            self.var_stats = tk.BooleanVar(value=instrumentation.enabled)
+            tk.Checkbutton(stats_frame, text="Record timings", variable=self.var_stats, command=self.toggle_stats).pack(anchor='w')
+            
+            self.stats_label = tk.Label(stats_frame, text="", font=('Courier', 8), justify='left', anchor='w')
+            self.stats_label.pack(fill='x')
+            
+            export_frame = tk.Frame(stats_frame)
+            export_frame.pack(fill='x')
+            tk.Button(export_frame, text="Export JSON", command=lambda: self.export_stats('json')).pack(side='left', padx=5)
+            tk.Button(export_frame, text="Export CSV", command=lambda: self.export_stats('csv')).pack(side='left', padx=5)
+            
+            self.refresh_stats()
+        
         # Instructions
-        tk.Label(root, text="Select Resolution -> Align Blue Boxes -> START", justify='center', fg='gray').pack(pady=10, padx=10)
+        tk.Label(root, text="Select Resolution -> Align Blue Boxes -> START\n(or AUTO Calibrate -> START)", justify='center', fg='gray').pack(pady=10, padx=10)
+        
+        # Each board comes back where it was last started, once the windows
+        # are mapped (placement needs their frame offsets)
+        self.root.after(200, self.restore_profiles)
+
+    def restore_profiles(self):
+        for i, overlay in enumerate(self.overlays):
+            profile = load_profile(BOARD_PROFILE.format(i + 1))
+            if profile is not None:
+                overlay.apply_profile(profile)
+                overlay.draw_grid()
+        self._sync_controls()
+
+    def save_profiles(self):
+        # Remember every board's setup for the next start
+        for i, overlay in enumerate(self.overlays):
+            profile = overlay.to_profile(BOARD_PROFILE.format(i + 1))
+            try:
+                profile.save()
+            except OSError as e:
+                self.status.config(text=f"Could not save profile: {e}", fg='red')
+                return
+            overlay.profile = profile
+
+    @property
+    def overlay(self):
+        return self.overlays[self.selected]
+
+    def select_board(self):
+        self.selected = self.var_board.get()
+        self._sync_controls()
+
+    def _sync_controls(self):
+        # Controls show the selected board's setup
+        self.var_res.set(self.overlay.current_res or '')
+        self.var_gx.set(self.overlay.gap_x)
+        self.var_gy.set(self.overlay.gap_y)
 
     def change_resolution(self):
         res = self.var_res.get()
         self.overlay.apply_preset(res)
         self.overlay.draw_grid()
 
+    def auto_calibrate(self):
+        # Hide every window so the screen grab only shows the games
+        for overlay in self.overlays:
+            overlay.withdraw()
+        self.root.withdraw()
+        self.root.update()
+        self.root.after(200, self._finish_calibration)
+
+    def _finish_calibration(self):
+        from calibration import calibrate, grab_screen
+        from frames import MssFrameSource
+
+        try:
+            with MssFrameSource() as source:
+                frame, origin = grab_screen(source)
+                fit = calibrate(frame, self.overlay.presets[CALIBRATION_REFERENCE], origin, self.overlay.rows, self.overlay.cols)
+        finally:
+            self.root.deiconify()
+            for overlay in self.overlays:
+                overlay.deiconify()
+                overlay.update()
+        if fit is None:
+            self.status.config(text="Calibration failed - show the board with all cards face down", fg='red')
+            return
+        self.overlay.apply_calibration(fit)
+        self.overlay.draw_grid()
+        self.var_res.set('')
+        self.var_gx.set(self.overlay.gap_x)
+        self.var_gy.set(self.overlay.gap_y)
+        self.save_profiles()
+        self.status.config(text=f"Calibrated - {fit.card_w}x{fit.card_h} cards at {fit.left},{fit.top}", fg='blue')
+
     def update_config(self):
         self.overlay.gap_x = self.var_gx.get()
         self.overlay.gap_y = self.var_gy.get()
+        self.overlay.publish_geometry()
         self.overlay.draw_grid()
+        self.save_profiles()
 
     def reset(self):
         if self.on_reset:
             self.on_reset()
 
+    def toggle_stats(self):
+        if self.var_stats.get():
+            self.instrumentation.start()
+        else:
+            self.instrumentation.stop()
+
+    def refresh_stats(self):
+        if self.instrumentation.enabled:
+            self.stats_label.config(text=self.instrumentation.format_table())
+        self.root.after(500, self.refresh_stats)
+
+    def export_stats(self, kind):
+        path = filedialog.asksaveasfilename(
+            defaultextension=f'.{kind}', filetypes=[(kind.upper(), f'*.{kind}')], initialfile=f'tracker_stats.{kind}'
+        )
+        if not path:
+            return
+        if kind == 'json':
+            self.instrumentation.export_json(path)
+        else:
+            self.instrumentation.export_csv(path)
+
     def start(self):
-        self.overlay.set_click_through(True)
+        self.save_profiles()
+        for overlay in self.overlays:
+            overlay.set_click_through(True)
         self.status.config(text="Running - Overlay LOCKED (Click-Through)", fg='green')
         self.on_start()
 
     def stop(self):
-        self.overlay.set_click_through(False)
+        for overlay in self.overlays:
+            overlay.set_click_through(False)
         self.status.config(text="Stopped - Overlay Movable", fg='blue')
         self.on_stop()
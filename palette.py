@@ -0,0 +1,170 @@
+import copy
+import hashlib
+import os
+
+import numpy as np
+
+from analysis import GOLD_TARGETS, GOLD_TOLERANCE
+
+# Bump when the table layout changes, invalidates cached tables
+TABLE_VERSION = 1
+
+TABLE_SIZE = 1 << 24
+
+
+def cache_dir():
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'loa-cardgame-helper')
+
+
+def packed_bgra(frame):
+    # (h, w) uint32 view of a contiguous BGRA frame. Little endian B, G, R, X
+    # reads as 0xXXRRGGBB, so masking the low 24 bits gives the table index.
+    return frame.view('<u4')[..., 0]
+
+
+def pack_rgb(arr):
+    # 0xRRGGBB indices for an RGB array (copies, for non-BGRA inputs)
+    arr = arr.astype(np.uint32)
+    return (arr[..., 0] << 16) | (arr[..., 1] << 8) | arr[..., 2]
+
+
+class Palette:
+    # Target RGB colors with a per-channel tolerance
+    def __init__(self, name, targets, tolerance):
+        self.name = name
+        self.targets = tuple(tuple(int(v) for v in t) for t in targets)
+        self.tolerance = int(tolerance)
+
+    def key(self):
+        spec = repr((TABLE_VERSION, self.targets, self.tolerance))
+        return hashlib.sha1(spec.encode()).hexdigest()[:16]
+
+    def build_mask(self):
+        # Boolean (2^24,) membership table indexed by 0xRRGGBB
+        values = np.arange(256)
+        mask = np.zeros((256, 256, 256), dtype=bool)
+        for target in self.targets:
+            r_ok, g_ok, b_ok = (np.abs(values - v) <= self.tolerance for v in target)
+            mask |= r_ok[:, None, None] & g_ok[None, :, None] & b_ok[None, None, :]
+        return mask.reshape(-1)
+
+    def load_mask(self, directory=None):
+        # Membership table, cached on disk as packed bits keyed by the palette
+        directory = directory or cache_dir()
+        path = os.path.join(directory, f'palette-{self.name}-{self.key()}.npy')
+        try:
+            return np.unpackbits(np.load(path)).view(bool)
+        except (OSError, ValueError):
+            pass
+
+        mask = self.build_mask()
+        try:
+            os.makedirs(directory, exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                np.save(f, np.packbits(mask))
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Could not cache palette table: {e}")
+        return mask
+
+
+# Known card palettes, by name
+PALETTES = {
+    'gold': Palette('gold', GOLD_TARGETS, GOLD_TOLERANCE),
+}
+
+
+class ColorClassifier:
+    # Up to 8 palettes compiled into one uint8 lookup table, one bit per
+    # palette. Classifying a pixel is a single gather however many palettes
+    # are loaded.
+    def __init__(self, palettes, directory=None):
+        if len(palettes) > 8:
+            raise ValueError("at most 8 palettes per classifier")
+        self.names = [p.name for p in palettes]
+        self.table = np.zeros(TABLE_SIZE, dtype=np.uint8)
+        for bit, palette in enumerate(palettes):
+            self.table |= palette.load_mask(directory).view(np.uint8) << bit
+        # counts(out=...) scratch: (table index, labels, one palette's bits
+        # widened for the sum), flat, sized for the largest input seen and
+        # used through views
+        self.scratch = None
+
+    @classmethod
+    def from_table(cls, names, table):
+        # Classifier over an already compiled table, bit i for names[i]
+        classifier = cls.__new__(cls)
+        classifier.names = list(names)
+        classifier.table = table
+        classifier.scratch = None
+        return classifier
+
+    @classmethod
+    def load(cls, palettes, directory=None):
+        # Classifier whose compiled table is cached on disk and memory-mapped:
+        # startup reads no table data, pages load as colors get looked up and
+        # processes share them. Builds (and caches) the table if needed.
+        directory = directory or cache_dir()
+        spec = repr([(p.name, p.key()) for p in palettes])
+        path = os.path.join(directory, f'classifier-{hashlib.sha1(spec.encode()).hexdigest()[:16]}.npy')
+        try:
+            table = np.load(path, mmap_mode='r')
+            if table.shape == (TABLE_SIZE,) and table.dtype == np.uint8:
+                return cls.from_table([p.name for p in palettes], table)
+        except (OSError, ValueError):
+            pass
+
+        classifier = cls(palettes, directory)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                np.save(f, classifier.table)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Could not cache classifier table: {e}")
+        return classifier
+
+    def fork(self):
+        # Classifier sharing this one's table, with its own counts(out=...)
+        # scratch so another thread can use it at the same time
+        other = copy.copy(self)
+        other.scratch = None
+        return other
+
+    def classify(self, packed):
+        # Palette bits per pixel for 0x??RRGGBB packed pixels
+        return self.table[packed & 0xFFFFFF]
+
+    def counts(self, packed, out=None):
+        # {palette name: pixel count over the last two axes}
+        # out: dict of arrays shaped packed.shape[:-2] to fill instead; the
+        # lookup then runs through reused buffers without allocating
+        if out is not None:
+            return self._counts_into(packed, out)
+        labels = self.classify(packed)
+        if len(self.names) == 1:
+            return {self.names[0]: labels.sum(axis=(-2, -1), dtype=np.int64)}
+        return {
+            name: np.count_nonzero(labels & (1 << bit), axis=(-2, -1))
+            for bit, name in enumerate(self.names)
+        }
+
+    def _counts_into(self, packed, out):
+        size = packed.size
+        if self.scratch is None or self.scratch[0].size < size:
+            self.scratch = (np.empty(size, dtype=np.intp), np.empty(size, dtype=np.uint8),
+                            np.empty(size, dtype=np.int64))
+        index, labels, wide = (buf[:size].reshape(packed.shape) for buf in self.scratch)
+        np.copyto(index, packed)
+        np.bitwise_and(index, 0xFFFFFF, out=index)
+        np.take(self.table, index, out=labels, mode='clip')
+        # Palette bits are consumed from the lowest
+        for name in self.names:
+            np.copyto(wide, labels)
+            np.bitwise_and(wide, 1, out=wide)
+            np.right_shift(labels, 1, out=labels)
+            np.add.reduce(wide, axis=(-2, -1), out=out[name])
+        return out
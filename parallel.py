@@ -0,0 +1,142 @@
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from analysis import analyze_runs, card_runs, scan_strip
+
+
+def available_cpus():
+    # CPUs this process may run on
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def run_cards(runs):
+    return sum(c1 - c0 for _, c0, c1 in runs)
+
+
+def split_runs(runs, parts):
+    # runs (see analysis.card_runs) cut into at most `parts` tiles holding
+    # nearly the same number of cards, each tile a list of runs
+    size = math.ceil(run_cards(runs) / parts)
+    tiles, tile, room = [], [], size
+    for r, c0, c1 in runs:
+        while c0 < c1:
+            end = min(c1, c0 + room)
+            tile.append((r, c0, end))
+            room -= end - c0
+            c0 = end
+            if room == 0:
+                tiles.append(tile)
+                tile, room = [], size
+    if tile:
+        tiles.append(tile)
+    return tiles
+
+
+class ParallelAnalyzer:
+    # analysis.analyze_grid over a persistent thread pool. The runs of cards
+    # to analyze are split into one tile (row-major, nearly equal card
+    # counts) per worker; the calling thread takes the first tile, pool
+    # threads the others, each with its own classifier fork and its own views
+    # of the result's scratch. The NumPy passes (widening copy, sums, table
+    # lookup) release the GIL, so tiles overlap on separate cores. Every card
+    # goes through the same code as the serial path, so results are identical.
+    #
+    # mode 'auto' measures the first frame of each card size both ways
+    # (best of `repeats`) and models a frame of n cards as n * t_card serial
+    # and overhead + ceil(n / workers) * t_card in parallel. Frames go
+    # parallel from the smallest n where that wins by `margin`, if any, so
+    # small cards or single-core machines stay serial. 'serial' and
+    # 'parallel' force a path.
+    def __init__(self, classifier, workers=None, mode='auto', repeats=3, margin=0.9):
+        if mode not in ('auto', 'serial', 'parallel'):
+            raise ValueError(f"unknown analysis mode {mode!r}")
+        self.classifier = classifier
+        self.workers = max(1, workers or available_cpus())
+        self.mode = mode
+        self.repeats = repeats
+        self.margin = margin
+        self.pool = None
+        # Tiles after the first: one classifier fork each
+        self.forks = [classifier.fork() for _ in range(self.workers - 1)]
+
+        # Decision for the last card shape measured
+        self.measured_shape = None
+        self.min_cards = None # parallel from this many cards on, None: never
+        self.timings = None # (serial, parallel) full-grid seconds
+        self.frames = 0
+        self.parallel_frames = 0
+
+    def analyze(self, cards, packed_cards, scan_y_start, scan_y_end, active, out):
+        # analyze_grid(cards, packed_cards, ..., self.classifier, active, out)
+        strip = scan_strip(packed_cards, scan_y_start, scan_y_end, channel_axis=False)
+        out.prepare(cards)
+        if cards.shape != self.measured_shape:
+            self._decide(cards, strip, out)
+        runs = card_runs(active, cards.shape[:2])
+        out.clear()
+        self.frames += 1
+        if self.min_cards is None or run_cards(runs) < self.min_cards:
+            analyze_runs(cards, strip, self.classifier, runs, out)
+        else:
+            self.parallel_frames += 1
+            self._analyze_tiles(cards, strip, runs, out)
+        return out
+
+    def _analyze_tiles(self, cards, strip, runs, out):
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(self.workers - 1, thread_name_prefix='card-analysis')
+        first, *others = split_runs(runs, self.workers)
+        futures = [
+            self.pool.submit(analyze_runs, cards, strip, classifier, tile, out)
+            for tile, classifier in zip(others, self.forks)
+        ]
+        try:
+            analyze_runs(cards, strip, self.classifier, first, out)
+        finally:
+            # No tile may still be writing into out once this returns
+            wait(futures)
+        for future in futures:
+            future.result()
+
+    def _decide(self, cards, strip, out):
+        self.measured_shape = cards.shape
+        self.timings = None
+        if self.workers == 1 or self.mode == 'serial':
+            self.min_cards = None
+            return
+        if self.mode == 'parallel':
+            self.min_cards = 2
+            return
+
+        runs = card_runs(None, cards.shape[:2])
+        n_cards = run_cards(runs)
+        serial = parallel = math.inf
+        for _ in range(self.repeats):
+            start = time.perf_counter()
+            analyze_runs(cards, strip, self.classifier, runs, out)
+            serial = min(serial, time.perf_counter() - start)
+            start = time.perf_counter()
+            self._analyze_tiles(cards, strip, runs, out)
+            parallel = min(parallel, time.perf_counter() - start)
+        self.timings = (serial, parallel)
+
+        card = serial / n_cards
+        overhead = max(0.0, parallel - math.ceil(n_cards / self.workers) * card)
+        self.min_cards = next((n for n in range(2, n_cards + 1)
+                               if overhead + math.ceil(n / self.workers) * card < self.margin * n * card), None)
+
+    def stats(self):
+        serial, parallel = self.timings or (None, None)
+        return {'workers': self.workers, 'mode': self.mode, 'min_cards': self.min_cards,
+                'serial_ms': serial and serial * 1000, 'parallel_ms': parallel and parallel * 1000,
+                'frames': self.frames, 'parallel_frames': self.parallel_frames}
+
+    def close(self):
+        # Stops the pool threads, the next parallel frame starts new ones
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
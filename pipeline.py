@@ -0,0 +1,366 @@
+import multiprocessing as mp
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from frames import FrameSource, MssFrameSource
+from scheduler import FrameScheduler
+
+RING_SLOTS = 4
+# Ring header: write_seq, slots, slot_bytes
+META_FIELDS = 3
+# Per-slot header: seq (-1 while being written), top, left, height, width
+SLOT_FIELDS = 5
+
+# Shared counters
+CAPTURED, ANALYZED = range(2)
+
+
+class FrameRing:
+    # Fixed-slot ring of BGRA frames in shared memory. One writer, readers
+    # always take the newest frame. Slot sequence numbers let a reader detect
+    # that a slot was overwritten while it was copying it.
+    def __init__(self, name=None, slots=RING_SLOTS, slot_bytes=0):
+        if name is None:
+            size = 8 * (META_FIELDS + slots * SLOT_FIELDS) + slots * slot_bytes
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+
+        buf = self.shm.buf
+        self.meta = np.ndarray((META_FIELDS,), dtype=np.int64, buffer=buf)
+        if self.owner:
+            self.meta[:] = (0, slots, slot_bytes)
+        slots, slot_bytes = int(self.meta[1]), int(self.meta[2])
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.headers = np.ndarray((slots, SLOT_FIELDS), dtype=np.int64, buffer=buf, offset=8 * META_FIELDS)
+        data_offset = 8 * (META_FIELDS + slots * SLOT_FIELDS)
+        self.data = np.ndarray((slots, slot_bytes), dtype=np.uint8, buffer=buf, offset=data_offset)
+        self.buffer = None
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, frame, region):
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"frame of {frame.nbytes} bytes does not fit ring slots of {self.slot_bytes}")
+        seq = int(self.meta[0]) + 1
+        header = self.headers[seq % self.slots]
+        header[0] = -1
+        h, w = frame.shape[:2]
+        self.data[seq % self.slots, :frame.nbytes].reshape(frame.shape)[...] = frame
+        header[1:] = (region['top'], region['left'], h, w)
+        header[0] = seq
+        self.meta[0] = seq
+        return seq
+
+    def latest_seq(self):
+        return int(self.meta[0])
+
+    def read(self, seq):
+        # Copy frame `seq` out of the ring into a reused buffer.
+        # Returns (region, frame) or None if the slot was overwritten.
+        header = self.headers[seq % self.slots]
+        if header[0] != seq:
+            return None
+        top, left, h, w = (int(v) for v in header[1:])
+        if self.buffer is None or self.buffer.shape != (h, w, 4):
+            self.buffer = np.empty((h, w, 4), dtype=np.uint8)
+        self.buffer[...] = self.data[seq % self.slots, :h * w * 4].reshape(h, w, 4)
+        if header[0] != seq:
+            return None
+        return {'top': top, 'left': left, 'width': w, 'height': h}, self.buffer
+
+    def close(self):
+        self.meta = self.headers = self.data = self.buffer = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingFrameSource(FrameSource):
+    # Analysis side of the ring: waits for the next frame for `region`.
+    # Frames captured for an older geometry are skipped. Returns None after
+    # `timeout` seconds without one, so the caller can check its controls.
+    def __init__(self, ring, frame_ready, timeout=0.1):
+        self.ring = ring
+        self.frame_ready = frame_ready
+        self.timeout = timeout
+        self.last_seq = 0
+
+    def grab(self, region):
+        deadline = time.perf_counter() + self.timeout
+        while True:
+            # Clear before checking, a frame written after the check sets it again
+            self.frame_ready.clear()
+            seq = self.ring.latest_seq()
+            if seq > self.last_seq:
+                self.last_seq = seq
+                read = self.ring.read(seq)
+                if read is not None and read[0] == region:
+                    return read[1]
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not self.frame_ready.wait(remaining):
+                return None
+
+
+class EventOverlay:
+    # Tracker config and result sink (tracker.TrackerConfig, ResultSink) for
+    # the analysis process: geometry arrives over the control queue and
+    # overlay updates go back to the GUI process as events
+    def __init__(self, events, overlay_alpha):
+        self.events = events
+        self.overlay_alpha = overlay_alpha
+        self.card_geometry = None
+
+    def update_card_images(self, updates):
+        self.events.put(('images', updates))
+
+    def update_card_labels(self, labels):
+        self.events.put(('labels', labels))
+
+    def clear_marks(self):
+        self.events.put(('clear',))
+
+
+def capture_main(ring_name, source_factory, control, events, frame_ready, running, shutdown, motion, counters,
+                 active_fps, idle_fps):
+    ring = FrameRing(ring_name)
+    scheduler = FrameScheduler(active_fps, idle_fps) if active_fps else None
+    geometry = None
+    try:
+        with source_factory() as source:
+            while not shutdown.is_set():
+                try:
+                    while True:
+                        message = control.get_nowait()
+                        if message[0] == 'geometry':
+                            geometry = message[1]
+                        elif message[0] == 'ring':
+                            # Larger slots, sent ahead of the geometry needing them
+                            ring.close()
+                            ring = FrameRing(message[1])
+                except queue.Empty:
+                    pass
+                if geometry is None or not running.wait(0.1):
+                    if scheduler:
+                        scheduler.reset()
+                    continue
+
+                frame = source.grab(geometry.monitor)
+                if frame is None:
+                    # Finite source ran out
+                    running.clear()
+                    continue
+                ring.write(frame, geometry.monitor)
+                frame_ready.set()
+                counters[CAPTURED] += 1
+                if scheduler:
+                    scheduler.wait(bool(motion.value))
+    except Exception as e:
+        # Tell the GUI rather than leave it pumping a dead pipeline
+        running.clear()
+        events.put(('error', f"capture stopped: {e}"))
+        raise
+    finally:
+        ring.close()
+
+
+def analysis_main(ring_name, control, events, frame_ready, shutdown, motion, counters, overlay_alpha,
+                  events_address=None):
+    from tracker import CardTracker
+
+    ring = FrameRing(ring_name)
+    overlay = EventOverlay(events, overlay_alpha)
+    source = RingFrameSource(ring, frame_ready)
+    publisher = None
+    if events_address is not None:
+        # Card events are published straight from this process
+        from events import EventPublisher
+        publisher = EventPublisher(events_address).start()
+    tracker = CardTracker(overlay, overlay, source, events=publisher)
+    try:
+        while not shutdown.is_set():
+            try:
+                while True:
+                    message = control.get_nowait()
+                    if message[0] == 'geometry':
+                        overlay.card_geometry = message[1]
+                    elif message[0] == 'ring':
+                        ring.close()
+                        ring = source.ring = FrameRing(message[1])
+                        source.last_seq = 0
+                    elif message[0] == 'profile':
+                        from profiles import Profile
+                        tracker.apply_profile(Profile.from_dict(message[1]))
+                    elif message[0] == 'reset':
+                        tracker.reset()
+            except queue.Empty:
+                pass
+            if overlay.card_geometry is None:
+                time.sleep(0.05)
+                continue
+            if tracker.process_frame(source):
+                motion.value = tracker.motion
+                counters[ANALYZED] += 1
+    except Exception as e:
+        events.put(('error', f"analysis stopped: {e}"))
+        raise
+    finally:
+        if publisher is not None:
+            publisher.close()
+        ring.close()
+
+
+class ProcessPipeline:
+    # Capture and analysis in their own processes, connected by a shared
+    # memory FrameRing. Only compact per-card events come back to this (GUI)
+    # process. start/stop/reset mirror CardTracker; call pump() regularly on
+    # the UI thread to forward geometry changes and apply events.
+    #
+    # source_factory is called in the capture process (it must be picklable),
+    # slot_bytes sizes the ring's slots (defaults to the geometry's grid x2).
+    # A later geometry too large for them moves both processes to a new ring.
+    # events_address: publish card events there (see events.py), or None
+    # on_error(message) is called from pump() if a process fails (default: print)
+    def __init__(self, overlay, source_factory=MssFrameSource, slot_bytes=None,
+                 active_fps=30, idle_fps=5, events_address=None, on_error=None):
+        self.overlay = overlay
+        self.events_address = events_address
+        self.on_error = on_error or print
+        self.source_factory = source_factory
+        self.slot_bytes = slot_bytes
+        self.active_fps = active_fps
+        self.idle_fps = idle_fps
+        self.card_states = {} # (row, col) -> 'GOLD', mirrored from events
+        self.processes = []
+        self.ring = None
+        # Rings replaced by larger ones, kept until close(): a process may
+        # still be attaching to one
+        self.old_rings = []
+        self.sent_geometry = None
+        self.sent_profile = None
+
+    @staticmethod
+    def _frame_bytes(geometry):
+        return geometry.monitor['width'] * geometry.monitor['height'] * 4
+
+    def _launch(self):
+        geometry = self.overlay.card_geometry
+        self.ring = FrameRing(slot_bytes=max(self.slot_bytes or 0, 2 * self._frame_bytes(geometry)))
+
+        self.capture_control = mp.Queue()
+        self.analysis_control = mp.Queue()
+        self.events = mp.Queue()
+        self.frame_ready = mp.Event()
+        self.running = mp.Event()
+        self.shutdown = mp.Event()
+        self.motion = mp.Value('b', False, lock=False)
+        self.counters = mp.Array('q', 2, lock=False)
+        self.sent_geometry = None
+        self.sent_profile = None
+
+        self.processes = [
+            mp.Process(target=capture_main, name='card-capture', daemon=True, args=(
+                self.ring.name, self.source_factory, self.capture_control, self.events, self.frame_ready,
+                self.running, self.shutdown, self.motion, self.counters, self.active_fps, self.idle_fps)),
+            mp.Process(target=analysis_main, name='card-analysis', daemon=True, args=(
+                self.ring.name, self.analysis_control, self.events, self.frame_ready,
+                self.shutdown, self.motion, self.counters, self.overlay.overlay_alpha, self.events_address)),
+        ]
+        for process in self.processes:
+            process.start()
+
+    def start(self):
+        if not self.processes:
+            self._launch()
+        self.pump()
+        self.running.set()
+
+    def stop(self):
+        # Capture pauses, analysis keeps its card state for the next start
+        if self.processes:
+            self.running.clear()
+
+    def reset(self):
+        self.card_states = {}
+        if self.processes:
+            self.analysis_control.put(('reset',))
+        else:
+            self.overlay.clear_marks()
+
+    def close(self):
+        if not self.processes:
+            return
+        self.running.clear()
+        self.shutdown.set()
+        for process in self.processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        for ring in self.old_rings + [self.ring]:
+            ring.close()
+        self.old_rings = []
+        self.ring = None
+
+    def stats(self):
+        if not self.processes:
+            return {'captured': 0, 'analyzed': 0}
+        return {'captured': self.counters[CAPTURED], 'analyzed': self.counters[ANALYZED]}
+
+    def pump(self):
+        if not self.processes:
+            return
+        geometry = self.overlay.card_geometry
+        if geometry is not self.sent_geometry:
+            if self._frame_bytes(geometry) > self.ring.slot_bytes:
+                # Queued ahead of the geometry, so no frame of the new size
+                # goes to the old ring
+                self.old_rings.append(self.ring)
+                self.ring = FrameRing(slot_bytes=2 * self._frame_bytes(geometry))
+                self.capture_control.put(('ring', self.ring.name))
+                self.analysis_control.put(('ring', self.ring.name))
+            self.capture_control.put(('geometry', geometry))
+            self.analysis_control.put(('geometry', geometry))
+            self.sent_geometry = geometry
+        # Thresholds and palettes of the overlay's profile (profiles.py), if
+        # any, sent again only when they change
+        profile = getattr(self.overlay, 'profile', None)
+        if profile is not None:
+            data = profile.to_dict()
+            if (data['thresholds'], data['palettes']) != self.sent_profile:
+                self.analysis_control.put(('profile', data))
+                self.sent_profile = (data['thresholds'], data['palettes'])
+
+        updates = []
+        labels = None
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == 'images':
+                for row, col, _, _ in event[1]:
+                    self.card_states[(row, col)] = 'GOLD'
+                updates.extend(event[1])
+            elif event[0] == 'labels':
+                # Each labels event carries the full set, keep the latest
+                labels = event[1]
+            elif event[0] == 'clear':
+                updates = []
+                labels = None
+                self.overlay.clear_marks()
+            elif event[0] == 'error':
+                self.on_error(event[1])
+        if updates:
+            self.overlay.update_card_images(updates)
+        if labels:
+            self.overlay.update_card_labels(labels)
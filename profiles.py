@@ -0,0 +1,137 @@
+import json
+import os
+
+from geometry import PRESETS, GridGeometry
+from palette import PALETTES, ColorClassifier, Palette
+
+# Bump when the file layout changes; older files are upgraded in from_dict
+PROFILE_VERSION = 1
+PRESET_KEYS = ('cell_w', 'cell_h', 'padding', 'padding_y', 'scan_y_start', 'scan_y_end', 'gold_threshold')
+# The tracker's defaults (tracker.CardTracker)
+DEFAULT_THRESHOLDS = {'brightness': 20, 'stable_diff': 5.0, 'stable_frames': 2}
+# Profile the GUI saves each board's setup to, by board number from 1
+BOARD_PROFILE = 'board-{}'
+
+
+def profile_dir():
+    base = os.environ.get('APPDATA') or os.path.join(os.path.expanduser('~'), '.config')
+    return os.path.join(base, 'loa-cardgame-helper', 'profiles')
+
+
+class Profile:
+    # Everything needed to track one board without realigning: the layout
+    # preset (cell size, padding, scan strip, gold threshold) and the
+    # resolution it belongs to (None: calibrated), grid gaps and size, where
+    # card (0, 0) was on screen (None: not placed yet), detection thresholds
+    # and the scan strip palettes. Stored as JSON:
+    #
+    #   {"version": 1, "name": "board-1", "resolution": "FHD",
+    #    "preset": {"cell_w": 151, ...}, "gap": [0, 0], "rows": 3, "cols": 6,
+    #    "card_origin": [457, 213], "thresholds": {"brightness": 20, ...},
+    #    "palettes": [{"name": "gold", "targets": [[180, 120, 52], ...], "tolerance": 15}]}
+    #
+    # A profile whose resolution isn't a built-in preset adds that
+    # resolution (see load_presets). The compiled form, the palettes' lookup
+    # table, is cached and memory-mapped by ColorClassifier.load.
+    def __init__(self, name, preset, resolution=None, gap=(0, 0), rows=3, cols=6, card_origin=None,
+                 thresholds=None, palettes=None):
+        self.name = name
+        self.preset = {key: preset[key] for key in PRESET_KEYS if key in preset}
+        self.resolution = resolution
+        self.gap = tuple(gap)
+        self.rows = rows
+        self.cols = cols
+        self.card_origin = tuple(card_origin) if card_origin is not None else None
+        self.thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        self.palettes = list(palettes or [PALETTES['gold']])
+
+    @classmethod
+    def from_preset(cls, name, resolution='FHD'):
+        return cls(name, PRESETS[resolution], resolution)
+
+    def geometry(self, card_origin=None):
+        # GridGeometry with card (0, 0) at card_origin (default: the saved one)
+        card_origin = card_origin or self.card_origin
+        if card_origin is None:
+            raise ValueError(f"profile {self.name!r} has no card position")
+        return GridGeometry.from_card_origin(self.preset, card_origin, self.gap, self.rows, self.cols)
+
+    def classifier(self, directory=None):
+        return ColorClassifier.load(self.palettes, directory)
+
+    def to_dict(self):
+        return {
+            'version': PROFILE_VERSION, 'name': self.name, 'resolution': self.resolution,
+            'preset': self.preset, 'gap': list(self.gap), 'rows': self.rows, 'cols': self.cols,
+            'card_origin': list(self.card_origin) if self.card_origin is not None else None,
+            'thresholds': self.thresholds,
+            'palettes': [{'name': p.name, 'targets': [list(t) for t in p.targets], 'tolerance': p.tolerance}
+                         for p in self.palettes],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        version = data.get('version')
+        if not isinstance(version, int) or version > PROFILE_VERSION:
+            raise ValueError(f"profile version {version!r} not supported (up to {PROFILE_VERSION})")
+        missing = [key for key in PRESET_KEYS if key != 'padding_y' and key not in data['preset']]
+        if missing:
+            raise ValueError(f"profile preset lacks {', '.join(missing)}")
+        palettes = [Palette(p['name'], p['targets'], p['tolerance']) for p in data.get('palettes') or []]
+        if palettes and 'gold' not in [p.name for p in palettes]:
+            raise ValueError("profile palettes need a 'gold' palette")
+        return cls(data['name'], data['preset'], data.get('resolution'), data.get('gap', (0, 0)),
+                   data.get('rows', 3), data.get('cols', 6), data.get('card_origin'),
+                   data.get('thresholds'), palettes)
+
+    @staticmethod
+    def path(name, directory=None):
+        return os.path.join(directory or profile_dir(), f'{name}.json')
+
+    def save(self, directory=None):
+        path = self.path(self.name, directory)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, name, directory=None):
+        # Raises OSError if there is no such profile, ValueError if it can't be read
+        with open(cls.path(name, directory)) as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"profile {name!r}: {e}") from None
+        return cls.from_dict(data)
+
+
+def list_profiles(directory=None):
+    directory = directory or profile_dir()
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    return sorted(name[:-5] for name in names if name.endswith('.json'))
+
+
+def load_profile(name, directory=None):
+    # The saved profile, or None if it is missing or unreadable
+    try:
+        return Profile.load(name, directory)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Could not load profile {name!r}: {e}")
+        return None
+
+
+def load_presets(directory=None):
+    # Built-in resolution presets plus any resolutions saved profiles add
+    presets = dict(PRESETS)
+    for name in list_profiles(directory):
+        profile = load_profile(name, directory)
+        if profile is not None and profile.resolution and profile.resolution not in presets:
+            presets[profile.resolution] = profile.preset
+    return presets
@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from profiles import profile_dir
+
+# Index file format version
+INDEX_VERSION = 1
+
+HASH_SIZE = 8 # 8x8 = 64-bit difference hash
+# Block mean difference (summed over channels) a bit needs to be set; flat
+# areas would otherwise hash capture noise
+HASH_MARGIN = 2.0
+# Nearest-neighbor matches further than this many bits count as unknown
+MAX_DISTANCE = 12
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def dhash(card, size=HASH_SIZE, margin=HASH_MARGIN):
+    # 64-bit difference hash of a card image, (h, w, channels) in any
+    # channel order. The card is averaged into size x (size + 1) blocks and
+    # each bit says whether a block is clearly brighter than its left neighbor.
+    gray = card.sum(axis=-1, dtype=np.int32) if card.ndim == 3 else card.astype(np.int32)
+    h, w = gray.shape
+    ys = (np.arange(size) * h) // size
+    xs = (np.arange(size + 1) * w) // (size + 1)
+    blocks = np.add.reduceat(np.add.reduceat(gray, ys, axis=0), xs, axis=1)
+    area = np.outer(np.diff(np.append(ys, h)), np.diff(np.append(xs, w)))
+    means = blocks / area
+    bits = (means[:, 1:] > means[:, :-1] + margin).reshape(-1)
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hamming(hashes, h):
+    # Bit distance from h to every hash in a uint64 array
+    xor = hashes ^ np.uint64(h)
+    return _POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class CardIndex:
+    # Known card faces: name per 64-bit hash. Exact hashes resolve through a
+    # dict, anything else through a vectorized Hamming nearest neighbor.
+    def __init__(self, entries=()):
+        self.names = []
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.exact = {}
+        for name, h in entries:
+            self.add(name, h)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, h):
+        self.names.append(name)
+        self.hashes = np.append(self.hashes, np.uint64(h))
+        self.exact.setdefault(h, name)
+
+    def lookup(self, h, max_distance=MAX_DISTANCE):
+        # Returns (name, distance); name is None if nothing is close enough
+        name = self.exact.get(h)
+        if name is not None:
+            return name, 0
+        if not self.names:
+            return None, None
+        distances = hamming(self.hashes, h)
+        i = int(np.argmin(distances))
+        distance = int(distances[i])
+        return (self.names[i] if distance <= max_distance else None), distance
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        version = data.get('version') if isinstance(data, dict) else None
+        if version != INDEX_VERSION:
+            raise ValueError(f"{path}: unsupported card index version {version}")
+        return cls((card['name'], int(card['hash'], 16)) for card in data['cards'])
+
+    def save(self, path):
+        data = {
+            'version': INDEX_VERSION,
+            'cards': [{'name': name, 'hash': f'{int(h):016x}'} for name, h in zip(self.names, self.hashes)],
+        }
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1, ensure_ascii=False)
+        os.replace(tmp, path)
+
+
+class CardRecognizer:
+    # Session cache on top of a CardIndex: a position is hashed when its card
+    # settles face up and, once identified, never again until reset().
+    def __init__(self, index):
+        self.index = index
+        self.names = {} # (row, col) -> name
+        self.hashed = 0
+
+    def reset(self):
+        self.names = {}
+
+    def identify(self, key, card):
+        name = self.names.get(key)
+        if name is not None:
+            return name
+        self.hashed += 1
+        name, _ = self.index.lookup(dhash(card))
+        if name is not None:
+            self.names[key] = name
+        return name
+
+    def pairs(self):
+        # name -> positions, for names seen at two or more positions
+        positions = {}
+        for key, name in self.names.items():
+            positions.setdefault(name, []).append(key)
+        return {name: keys for name, keys in positions.items() if len(keys) > 1}
+
+
+def index_path():
+    # card_index.json in the settings directory, next to the profiles
+    return os.path.join(os.path.dirname(profile_dir()), 'card_index.json')
+
+
+def load_index(path=None):
+    # The card index at path (default: index_path()), or None if it is
+    # missing or unreadable: recognition stays off
+    path = path or index_path()
+    try:
+        return CardIndex.load(path)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Could not load card index {path}: {e}")
+        return None
+
+
+def _load_or_new(path):
+    return CardIndex.load(path) if os.path.exists(path) else CardIndex()
+
+
+def main():
+    from PIL import Image
+
+    parser = argparse.ArgumentParser(description="Manage the card face index")
+    parser.add_argument('--index', default=index_path(), help="index file (default: %(default)s)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('add', help="add card face crops under one name")
+    p.add_argument('name')
+    p.add_argument('images', nargs='+')
+    p = sub.add_parser('build', help="add every image in a directory, named after the file")
+    p.add_argument('directory')
+    sub.add_parser('list')
+    args = parser.parse_args()
+
+    index = _load_or_new(args.index)
+    if args.command == 'list':
+        for name, h in zip(index.names, index.hashes):
+            print(f'{int(h):016x}  {name}')
+        return
+
+    if args.command == 'add':
+        images = [(args.name, path) for path in args.images]
+    else:
+        images = [
+            (os.path.splitext(entry)[0], os.path.join(args.directory, entry))
+            for entry in sorted(os.listdir(args.directory))
+            if entry.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp'))
+        ]
+    for name, path in images:
+        h = dhash(np.asarray(Image.open(path).convert('RGB')))
+        index.add(name, h)
+        print(f'{h:016x}  {name}  ({path})')
+    index.save(args.index)
+
+
+if __name__ == "__main__":
+    main()
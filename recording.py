@@ -0,0 +1,343 @@
+import json
+import mmap
+import queue
+import struct
+import threading
+import time
+import zlib
+from dataclasses import fields
+
+import numpy as np
+
+from analysis import card_grid_view
+from frames import FrameSource, crop_region
+from geometry import GridGeometry
+
+# Session file layout, little endian:
+#
+#   header   MAGIC, version
+#   records  RECORD header + payload, one per recorded frame:
+#            KEY    u32 geometry JSON length, geometry JSON, the whole BGRA
+#                   capture (height x width x 4)
+#            DELTA  (row, col) u8 pairs of the cards that changed, then each
+#                   of those cards minus the same card in the last keyframe
+#                   (uint8, wrapping), card_h x card_w x 4
+#            payloads zlib compressed when flagged
+#   index    INDEX_DTYPE entry per frame: record offset, offset of the
+#            keyframe it builds on, capture time
+#   trailer  index offset, frame count, INDEX_MAGIC
+#
+# The index and trailer are written on close. A file without them (the
+# recorder did not get to close) is indexed by scanning the records.
+MAGIC = b'CARDREC1'
+INDEX_MAGIC = b'CARDIDX1'
+VERSION = 1
+FILE_HEADER = struct.Struct('<8sI4x')
+RECORD = struct.Struct('<BBHId') # kind, flags, cards, payload bytes, time
+TRAILER = struct.Struct('<QQ8s')
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('key', '<u8'), ('time', '<f8')])
+KEY, DELTA = 1, 2
+COMPRESSED = 1
+
+GEOMETRY_FIELDS = tuple(f.name for f in fields(GridGeometry) if f.init)
+
+
+def _join(parts, compress, level):
+    if not compress:
+        return b''.join(parts)
+    c = zlib.compressobj(level)
+    return b''.join([c.compress(part) for part in parts] + [c.flush()])
+
+
+class SessionRecorder:
+    # Records what the tracker captures into a session file (layout above).
+    # A keyframe holds the whole capture; the frames after it hold only the
+    # cards whose signature (every step-th pixel, as in stability.py) moved
+    # more than diff_threshold from the card as last recorded, as deltas
+    # against the keyframe. A new keyframe starts every keyframe_interval
+    # frames and whenever the grid geometry changes.
+    #
+    # write() runs on the tracker thread and only compares signatures and
+    # copies the changed cards out. Delta encoding, compression and file
+    # writes happen on a writer thread. If that falls queue_frames behind,
+    # frames are dropped rather than slowing the tracker, and recording
+    # resumes with a keyframe.
+    def __init__(self, path, keyframe_interval=300, compress=True, level=1, diff_threshold=2.5, step=4,
+                 queue_frames=64):
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.compress = compress
+        self.level = level
+        self.diff_threshold = diff_threshold
+        self.step = step
+
+        self.file = open(path, 'wb')
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self.queue = queue.Queue(maxsize=queue_frames)
+
+        # Tracker thread
+        self.geometry = None
+        self.recorded = None
+        self.since_key = 0
+        self.force_key = True
+        self.frames = 0
+        self.dropped = 0
+        self.raw_bytes = 0
+
+        # Writer thread
+        self.index = []
+        self.offset = FILE_HEADER.size
+
+        self.thread = threading.Thread(target=self._writer, name='card-recorder', daemon=True)
+        self.thread.start()
+
+    def _allocate(self, shape):
+        grid = shape[:2]
+        self.recorded = np.empty(shape, dtype=np.int32)
+        self.work = np.empty(shape, dtype=np.int32)
+        self.sums = np.zeros(grid, dtype=np.int32)
+        self.changed = np.zeros(grid, dtype=bool)
+        self.limit = int(np.ceil(self.diff_threshold * np.prod(shape[2:])))
+
+    def write(self, frame, geometry, timestamp=None):
+        # Record one (h, w, 4) BGRA capture of geometry.monitor
+        timestamp = time.time() if timestamp is None else timestamp
+        cards = card_grid_view(frame, *geometry.layout)
+        samples = cards[..., ::self.step, ::self.step, :3]
+        self.raw_bytes += frame.nbytes
+
+        if self.force_key or geometry != self.geometry or self.since_key >= self.keyframe_interval:
+            if not self._put((KEY, timestamp, geometry, np.array(frame))):
+                return
+            if self.recorded is None or self.recorded.shape != samples.shape:
+                self._allocate(samples.shape)
+            np.copyto(self.recorded, samples)
+            self.geometry = geometry
+            self.since_key = 0
+            self.force_key = False
+            return
+
+        # Cards whose signature moved away from the recorded one
+        np.copyto(self.work, samples)
+        np.subtract(self.work, self.recorded, out=self.work)
+        np.abs(self.work, out=self.work)
+        np.add.reduce(self.work, axis=(-3, -2, -1), out=self.sums)
+        np.greater_equal(self.sums, self.limit, out=self.changed)
+        positions = np.argwhere(self.changed)
+        # Copies: the capture buffer is reused for the next frame
+        crops = [np.array(cards[r, c]) for r, c in positions]
+        if not self._put((DELTA, timestamp, positions, crops)):
+            return
+        for r, c in positions:
+            np.copyto(self.recorded[r, c], samples[r, c])
+        self.since_key += 1
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            self.force_key = True
+            return False
+        self.frames += 1
+        return True
+
+    def _writer(self):
+        key_offset = 0
+        key_cards = None
+        flags = COMPRESSED if self.compress else 0
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            kind, timestamp = item[:2]
+            if kind == KEY:
+                geometry, frame = item[2:]
+                meta = json.dumps({name: getattr(geometry, name) for name in GEOMETRY_FIELDS}).encode()
+                data = _join((struct.pack('<I', len(meta)), meta, frame), self.compress, self.level)
+                key_offset = self.offset
+                key_cards = card_grid_view(frame, *geometry.layout)
+                count = 0
+            else:
+                positions, crops = item[2:]
+                for (r, c), crop in zip(positions, crops):
+                    np.subtract(crop, key_cards[r, c], out=crop)
+                data = _join([positions.astype(np.uint8).tobytes()] + crops, self.compress, self.level)
+                count = len(crops)
+            self.file.write(RECORD.pack(kind, flags, count, len(data), timestamp))
+            self.file.write(data)
+            self.index.append((self.offset, key_offset, timestamp))
+            self.offset += RECORD.size + len(data)
+
+    def close(self):
+        # Finish queued frames, then write the index
+        if self.file is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        index = np.array(self.index, dtype=INDEX_DTYPE)
+        self.file.write(index.tobytes())
+        self.file.write(TRAILER.pack(self.offset, len(index), INDEX_MAGIC))
+        self.file.close()
+        self.file = None
+
+    def stats(self):
+        # Bytes on disk so far against the raw captures
+        return {'frames': self.frames, 'dropped': self.dropped, 'bytes': self.offset, 'raw_bytes': self.raw_bytes}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SessionReader:
+    # Reconstructs recorded frames from a memory-mapped session file.
+    # read(i) returns frame i in a buffer reused by the next read; reading
+    # forward applies one delta per frame, other jumps start from frame i's
+    # keyframe.
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = FILE_HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a version {VERSION} session recording")
+        self.index = self._load_index()
+        self.geometries = {} # keyframe offset -> GridGeometry
+        self.key_offset = None
+        self.position = None
+        self.geometry = None
+        self.frame = None
+
+    def _load_index(self):
+        size = len(self.map)
+        if size >= FILE_HEADER.size + TRAILER.size:
+            offset, frames, magic = TRAILER.unpack_from(self.map, size - TRAILER.size)
+            if magic == INDEX_MAGIC:
+                return np.frombuffer(self.map[offset:offset + frames * INDEX_DTYPE.itemsize], dtype=INDEX_DTYPE)
+
+        # Not closed: walk the records, up to a partly written last one
+        entries = []
+        offset = FILE_HEADER.size
+        key = offset
+        while offset + RECORD.size <= size:
+            kind, _, _, length, timestamp = RECORD.unpack_from(self.map, offset)
+            if kind not in (KEY, DELTA) or offset + RECORD.size + length > size:
+                break
+            if kind == KEY:
+                key = offset
+            entries.append((offset, key, timestamp))
+            offset += RECORD.size + length
+        return np.array(entries, dtype=INDEX_DTYPE)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def times(self):
+        return self.index['time']
+
+    def _record(self, offset):
+        kind, flags, count, length, _ = RECORD.unpack_from(self.map, offset)
+        start = offset + RECORD.size
+        return kind, flags, count, self.map[start:start + length]
+
+    def geometry_at(self, i):
+        # GridGeometry frame i was recorded with, without decoding its pixels
+        key = int(self.index[i]['key'])
+        geometry = self.geometries.get(key)
+        if geometry is None:
+            _, flags, _, data = self._record(key)
+            if flags & COMPRESSED:
+                d = zlib.decompressobj()
+                head = d.decompress(data, 4)
+                meta = d.decompress(d.unconsumed_tail, struct.unpack('<I', head)[0])
+            else:
+                (length,) = struct.unpack_from('<I', data)
+                meta = data[4:4 + length]
+            geometry = self.geometries[key] = GridGeometry(**json.loads(meta))
+        return geometry
+
+    def _load_key(self, key):
+        _, flags, _, data = self._record(key)
+        if flags & COMPRESSED:
+            data = zlib.decompress(data)
+        (length,) = struct.unpack_from('<I', data)
+        geometry = self.geometry_at(int(np.searchsorted(self.index['offset'], key)))
+        h, w = geometry.monitor['height'], geometry.monitor['width']
+        self.key_frame = np.frombuffer(data, dtype=np.uint8, count=h * w * 4, offset=4 + length).reshape(h, w, 4)
+        self.key_cards = card_grid_view(self.key_frame, *geometry.layout)
+        self.frame = np.array(self.key_frame)
+        self.geometry = geometry
+
+    def _apply_delta(self, offset):
+        _, flags, count, data = self._record(offset)
+        if count == 0:
+            return
+        if flags & COMPRESSED:
+            data = zlib.decompress(data)
+        geometry = self.geometry
+        positions = np.frombuffer(data, dtype=np.uint8, count=2 * count).reshape(count, 2)
+        deltas = np.frombuffer(data, dtype=np.uint8, offset=2 * count).reshape(
+            count, geometry.card_h, geometry.card_w, 4)
+        for (r, c), delta in zip(positions, deltas):
+            ys, xs = geometry.card_slices[r][c]
+            np.add(self.key_cards[r, c], delta, out=self.frame[ys, xs])
+
+    def read(self, i):
+        key = int(self.index[i]['key'])
+        if key != self.key_offset or self.position is None or self.position > i:
+            self._load_key(key)
+            self.key_offset = key
+            self.position = int(np.searchsorted(self.index['offset'], key))
+        for j in range(self.position + 1, i + 1):
+            self._apply_delta(int(self.index[j]['offset']))
+        self.position = i
+        return self.frame
+
+    def close(self):
+        self.key_frame = self.key_cards = self.frame = None
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ReplayFrameSource(FrameSource):
+    # Plays a session recording back, one frame per grab. Given the tracker's
+    # config (tracker.TrackerConfig) it also keeps config.card_geometry on the
+    # recorded grid, set ahead of each frame.
+    def __init__(self, reader, config=None, loop=False):
+        self.reader = reader
+        self.config = config
+        self.loop = loop
+        self.index = 0
+        self._publish_geometry()
+
+    def __len__(self):
+        return len(self.reader)
+
+    def _publish_geometry(self):
+        if self.config is not None and self.index < len(self.reader):
+            self.config.card_geometry = self.reader.geometry_at(self.index)
+
+    def grab(self, region):
+        if self.index >= len(self.reader):
+            if not self.loop:
+                return None
+            self.index = 0
+        frame = self.reader.read(self.index)
+        monitor = self.reader.geometry.monitor
+        self.index += 1
+        self._publish_geometry()
+        if region == monitor:
+            return frame
+        return crop_region(frame, (monitor['left'], monitor['top']), region)
+
+    def close(self):
+        self.reader.close()
@@ -0,0 +1,499 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sys
+
+import numpy as np
+
+from analysis import GridAnalysis, analyze_grid, card_grid_view
+from capture import bgr_to_rgb
+from frames import BOARD_BGR, SyntheticFrameSource
+from geometry import PRESETS, GridGeometry
+from instrument import STAGES, Instrumentation
+from palette import packed_bgra
+from parallel import available_cpus
+from tracker import CardTracker, ResultSink, TrackerConfig
+
+# Accuracy and speed regression suite over a labelled corpus.
+#
+# The corpus (corpus/ next to this file) is generated once from the
+# synthetic board and committed:
+#   faces.npz     clean card images per preset (face-down back, gold and
+#                 plain faces), compressed
+#   corpus.json   labelled crops as recipes over those faces (capture noise,
+#                 lighting gain, misaligned crop) and flip sequences as
+#                 SyntheticFrameSource recipes with the frames each card
+#                 turns fully up / down and which cards are gold
+# Pixels are rebuilt from the recipes on every run, so the corpus stays a
+# few hundred kB. A sequence whose script no longer matches its stored
+# digest fails: the generator changed under the labels.
+#
+# Each run measures per preset: crop classification (face up, gold) through
+# the tracker's batched analysis and the legacy per-card checks, detection
+# latency in frames over the sequences, and per-stage tracker timings.
+# corpus/baseline.json holds the last accepted numbers; any accuracy loss,
+# added latency or throughput loss beyond --tolerance fails the run. Every
+# crop must classify correctly, apart from the known failures below, which
+# are scored on their own and listed in the baseline.
+#
+#   python regression.py                # check against the baseline
+#   python regression.py --update       # accept the current numbers
+#   python regression.py --generate     # rebuild the corpus (then --update)
+#
+# tests/test_regression.py runs the accuracy and latency checks with the
+# test suite (--skip-throughput: speed depends on the machine, check it
+# with a plain run).
+
+CORPUS_VERSION = 1
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+# Crop variants: every face at every noise amplitude, lighting gain and
+# crop misalignment (pixels down and right)
+FACES_PER_KIND = 2
+NOISE_LEVELS = (0, 3, 8)
+GAINS = (0.8, 1.0, 1.2)
+SHIFTS = (0, 3)
+# Known detection gap: the gold palette is a fixed color match (+/-15 per
+# channel around two targets), so a lighting gain of +/-20% moves the gold
+# trim out of it and those gold crops read as plain. They stay in the
+# corpus to show when gold detection copes with lighting; until then a
+# failure there is expected, not accepted as correct.
+KNOWN_FAILURE = "gold trim under a lighting gain other than 1.0 (fixed-color gold palette)"
+
+
+def known_failure(crop):
+    _, _, gain, _, _, gold = crop
+    return gold and gain != 1.0
+
+
+# Flip sequences per preset: a steady player and a fast one on a noisier capture
+SEQUENCES = (
+    {'noise': 2, 'hold_frames': 8, 'idle_frames': 4},
+    {'noise': 4, 'hold_frames': 3, 'idle_frames': 2},
+)
+
+# Baseline comparisons: metric -> how it may move
+#   'accuracy' may drop by --accuracy-tolerance, 'errors' may not grow,
+#   'latency' may grow by --latency-tolerance frames
+METRICS = {
+    'crop_face_up_accuracy': 'accuracy',
+    'crop_gold_accuracy': 'accuracy',
+    'crop_path_mismatches': 'errors',
+    'crop_known_failures': 'errors',
+    'gold_recall': 'accuracy',
+    'gold_false': 'errors',
+    'gold_early': 'errors',
+    'flip_up_missed': 'errors',
+    'flip_down_missed': 'errors',
+    'flip_spurious': 'errors',
+    'gold_latency_mean': 'latency',
+    'gold_latency_max': 'latency',
+    'flip_up_latency_mean': 'latency',
+    'flip_up_latency_max': 'latency',
+    'flip_down_latency_mean': 'latency',
+    'flip_down_latency_max': 'latency',
+}
+# Stage timings below this (ms) are noise, not regressions
+STAGE_FLOOR_MS = 0.05
+
+
+def sequence_labels(synth):
+    # Ground truth from a synthetic game's script: for every card the frames
+    # it becomes fully face up and fully face down again, and the gold cards
+    phase = synth.phase
+    up = phase >= 1.0
+    down = phase <= 0.0
+    rises_up = np.zeros_like(up)
+    rises_up[1:] = up[1:] & ~up[:-1]
+    rises_down = np.zeros_like(down)
+    rises_down[1:] = down[1:] & ~down[:-1]
+    cards = [(r, c) for r in range(synth.rows) for c in range(synth.cols)]
+    return {
+        'frames': len(phase),
+        'gold': sorted([r, c] for r, c in synth.gold_cards),
+        'up': {f'{r},{c}': np.nonzero(rises_up[:, r, c])[0].tolist() for r, c in cards},
+        'down': {f'{r},{c}': np.nonzero(rises_down[:, r, c])[0].tolist() for r, c in cards},
+        'digest': script_digest(synth),
+    }
+
+
+def script_digest(synth):
+    h = hashlib.sha1(synth.phase.tobytes())
+    h.update(repr(sorted(synth.gold_cards)).encode())
+    return h.hexdigest()
+
+
+def sequence_source(preset, sequence):
+    return SyntheticFrameSource(preset, seed=sequence['seed'], noise=sequence['noise'],
+                                hold_frames=sequence['hold_frames'], idle_frames=sequence['idle_frames'],
+                                loop=False)
+
+
+def generate_corpus(directory, seed=0):
+    faces = {}
+    manifest = {'version': CORPUS_VERSION, 'seed': seed, 'presets': {}}
+    for name, preset in PRESETS.items():
+        synth = SyntheticFrameSource(preset, seed=seed)
+        pairs = sorted(synth.pair_faces.items(), key=lambda item: item[0])
+        bases = [('back', synth.back, False, False)]
+        for kind, gold in (('gold', True), ('plain', False)):
+            chosen = [face for (_, is_gold), face in pairs if is_gold == gold][:FACES_PER_KIND]
+            bases += [(f'{kind}-{i}', face, True, gold) for i, face in enumerate(chosen)]
+
+        crops = []
+        for key, face, face_up, gold in bases:
+            faces[f'{name}/{key}'] = face
+            for noise in NOISE_LEVELS:
+                for gain in GAINS:
+                    for shift in SHIFTS:
+                        # [face, noise, gain, shift, face up, gold]
+                        crops.append([key, noise, gain, shift, face_up, gold])
+
+        sequences = []
+        for i, recipe in enumerate(SEQUENCES):
+            sequence = dict(recipe, seed=seed + i)
+            sequence.update(sequence_labels(sequence_source(preset, sequence)))
+            sequences.append(sequence)
+        manifest['presets'][name] = {'crops': crops, 'sequences': sequences}
+
+    os.makedirs(directory, exist_ok=True)
+    np.savez_compressed(os.path.join(directory, 'faces.npz'), **faces)
+    with open(os.path.join(directory, 'corpus.json'), 'w') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+
+
+def load_corpus(directory):
+    # (manifest, faces, digest); raises OSError without a corpus
+    with open(os.path.join(directory, 'corpus.json'), 'rb') as f:
+        raw = f.read()
+    manifest = json.loads(raw)
+    if manifest.get('version') != CORPUS_VERSION:
+        raise ValueError(f"corpus version {manifest.get('version')!r}, expected {CORPUS_VERSION} (run --generate)")
+    h = hashlib.sha1(raw)
+    with np.load(os.path.join(directory, 'faces.npz')) as data:
+        faces = {key: data[key] for key in sorted(data.files)}
+    for key, face in faces.items():
+        h.update(key.encode())
+        h.update(face.tobytes())
+    return manifest, faces, h.hexdigest()
+
+
+def render_crop(face, noise, gain, shift, seed):
+    # The face as captured: moved shift pixels down and right (the board
+    # shows in the gap), lit by gain and with +/- noise per channel
+    h, w = face.shape[:2]
+    crop = np.empty_like(face)
+    crop[:, :, :3] = BOARD_BGR
+    crop[:, :, 3] = 255
+    crop[shift:, shift:] = face[:h - shift, :w - shift]
+    pixels = crop[:, :, :3] * np.float32(gain)
+    if noise:
+        rng = np.random.default_rng(seed)
+        pixels += rng.integers(-noise, noise + 1, size=pixels.shape)
+    crop[:, :, :3] = np.clip(np.rint(pixels), 0, 255)
+    return crop
+
+
+def preset_tracker(preset, card_origin=(0, 0), **kwargs):
+    geometry = GridGeometry.from_card_origin(preset, card_origin)
+    return CardTracker(TrackerConfig(geometry), ResultSink(), **kwargs)
+
+
+def check_crops(preset, crops, faces, prefix):
+    tracker = preset_tracker(preset)
+    geometry = tracker.config.card_geometry
+    images = [render_crop(faces[prefix + key], noise, gain, shift, seed)
+              for seed, (key, noise, gain, shift, _, _) in enumerate(crops)]
+    face_up_labels = np.array([crop[4] for crop in crops])
+    gold_labels = np.array([crop[5] for crop in crops])
+
+    # The tracker's path: every crop a card of one long grid row
+    n = len(images)
+    h, w = images[0].shape[:2]
+    row = np.concatenate(images, axis=1)
+    cards = card_grid_view(row[..., :3], 1, n, h, w, h, w)
+    packed_cards = card_grid_view(packed_bgra(row), 1, n, h, w, h, w)
+    result = analyze_grid(cards, packed_cards, geometry.scan_y_start, geometry.scan_y_end, tracker.classifier,
+                          out=GridAnalysis.empty((1, n), tracker.classifier.names))
+    face_up = result.brightness[0] > tracker.BRIGHTNESS_THRESHOLD
+    gold = face_up & (result.gold_counts[0] > geometry.gold_threshold)
+
+    # Legacy per-card checks (RGB, range masks) must decide the same
+    mismatches = 0
+    for i, image in enumerate(images):
+        rgb = bgr_to_rgb(image[..., :3])
+        up = tracker.check_flipped(rgb)
+        mismatches += (up != face_up[i]) or ((up and tracker.count_gold_pixels(rgb) > geometry.gold_threshold) != gold[i])
+
+    # Accuracy over the crops that must pass, known failures counted apart
+    wrong = (face_up != face_up_labels) | (gold != gold_labels)
+    known = np.array([known_failure(crop) for crop in crops])
+    return {
+        'crops': n,
+        'crop_face_up_accuracy': float(np.mean((face_up == face_up_labels)[~known])),
+        'crop_gold_accuracy': float(np.mean((gold == gold_labels)[~known])),
+        'crop_path_mismatches': int(mismatches),
+        'crop_known_failures': int(np.count_nonzero(wrong & known)),
+        'known_failures': [crop_name(crops[i]) for i in np.nonzero(wrong & known)[0]],
+        'crop_failures': [crop_name(crops[i]) for i in np.nonzero(wrong & ~known)[0]],
+        'crops_known': int(np.count_nonzero(known)),
+    }
+
+
+def crop_name(crop):
+    key, noise, gain, shift, _, _ = crop
+    return f"{key} noise {noise} gain {gain} shift {shift}"
+
+
+class EventLog(ResultSink):
+    # Event publisher for a tracker replaying one sequence: records every
+    # card event with the frame it was published on
+    def __init__(self):
+        self.frame = 0
+        self.events = [] # (frame, kind, row, col, up)
+
+    def publish(self, kind, row=None, col=None, **fields):
+        self.events.append((self.frame, kind, row, col, fields.get('up')))
+
+
+def match_latency(labels, events, ends):
+    # Frames from each label to the first event at or after it and before
+    # the matching end; returns (latencies, missed, events matched)
+    latencies = []
+    used = set()
+    for label, end in zip(labels, ends):
+        hit = next((f for f in events if label <= f < end and f not in used), None)
+        if hit is None:
+            continue
+        used.add(hit)
+        latencies.append(hit - label)
+    return latencies, len(labels) - len(latencies), len(used)
+
+
+def check_sequence(preset, sequence):
+    synth = sequence_source(preset, sequence)
+    if script_digest(synth) != sequence['digest']:
+        raise ValueError(f"sequence seed {sequence['seed']}: synthetic script changed, labels no longer apply "
+                         f"(run --generate and review the baseline)")
+    log = EventLog()
+    instrumentation = Instrumentation(enabled=True)
+    tracker = preset_tracker(preset, (synth.card_x, synth.card_y), source=synth,
+                             instrumentation=instrumentation, events=log)
+    while tracker.process_frame(synth):
+        log.frame += 1
+
+    gold = {tuple(card) for card in sequence['gold']}
+    first_gold = {}
+    flips_up, flips_down = {}, {}
+    for frame, kind, r, c, up in log.events:
+        if kind == 'gold':
+            first_gold.setdefault((r, c), frame)
+        elif kind == 'flip':
+            (flips_up if up else flips_down).setdefault((r, c), []).append(frame)
+
+    stats = {'gold_latency': [], 'flip_up_latency': [], 'flip_down_latency': [], 'gold_hits': 0, 'gold_false': 0,
+             'gold_early': 0, 'flip_up_missed': 0, 'flip_down_missed': 0, 'flip_spurious': 0}
+    for key, ups in sequence['up'].items():
+        card = tuple(int(v) for v in key.split(','))
+        downs = sequence['down'][key]
+        # Face up until fully down again, face down until the next turn starts
+        up_latency, up_missed, up_used = match_latency(ups, flips_up.get(card, []), downs + [sequence['frames']])
+        next_up = [u - SyntheticFrameSource.FLIP_FRAMES for u in ups[1:]] + [sequence['frames']]
+        down_latency, down_missed, down_used = match_latency(downs, flips_down.get(card, []), next_up)
+        stats['flip_up_latency'] += up_latency
+        stats['flip_down_latency'] += down_latency
+        stats['flip_up_missed'] += up_missed
+        stats['flip_down_missed'] += down_missed
+        stats['flip_spurious'] += len(flips_up.get(card, [])) - up_used + len(flips_down.get(card, [])) - down_used
+
+        if card not in first_gold:
+            continue
+        if card not in gold:
+            stats['gold_false'] += 1
+        elif ups and first_gold[card] < ups[0]:
+            stats['gold_early'] += 1
+        else:
+            stats['gold_hits'] += 1
+            stats['gold_latency'].append(first_gold[card] - ups[0])
+    stats['gold_cards'] = len(gold)
+    return stats, instrumentation.snapshot()
+
+
+def latency_summary(metrics, name, latencies):
+    metrics[f'{name}_mean'] = round(float(np.mean(latencies)), 3) if latencies else 0.0
+    metrics[f'{name}_max'] = int(max(latencies)) if latencies else 0
+
+
+def check_sequences(preset, sequences, runs):
+    totals = {}
+    best = [] # per sequence: {stage: best mean ms over the runs}
+    for sequence in sequences:
+        stages = {stage: np.inf for stage in STAGES}
+        for run in range(runs):
+            stats, snapshot = check_sequence(preset, sequence)
+            # Detection is deterministic, only the first run is scored
+            if run == 0:
+                for key, value in stats.items():
+                    totals[key] = totals[key] + value if key in totals else value
+            for stage in STAGES:
+                stages[stage] = min(stages[stage], snapshot['stages'][stage]['mean_ms'])
+        best.append(stages)
+
+    metrics = {
+        'sequences': len(sequences),
+        'gold_recall': totals['gold_hits'] / totals['gold_cards'] if totals['gold_cards'] else 1.0,
+    }
+    for key in ('gold_false', 'gold_early', 'flip_up_missed', 'flip_down_missed', 'flip_spurious'):
+        metrics[key] = totals[key]
+    for name in ('gold_latency', 'flip_up_latency', 'flip_down_latency'):
+        latency_summary(metrics, name, totals[name])
+
+    # Capture here is the synthetic renderer, not tracker work: fps counts
+    # the tracker's own stages only
+    stage_ms = {stage: round(float(np.mean([stages[stage] for stages in best])), 4)
+                for stage in STAGES if stage != 'capture'}
+    metrics['stage_ms'] = stage_ms
+    metrics['fps'] = round(1000.0 / sum(stage_ms.values()), 1)
+    return metrics
+
+
+def machine():
+    return {'platform': platform.platform(), 'python': platform.python_version(), 'numpy': np.__version__,
+            'cpus': available_cpus(), 'processor': platform.processor() or platform.machine()}
+
+
+def compare(name, current, baseline, args):
+    # Regressions of current vs baseline metrics, as messages
+    failures = []
+    for metric, kind in METRICS.items():
+        if metric not in baseline:
+            continue
+        value, base = current[metric], baseline[metric]
+        if kind == 'accuracy':
+            bad = value < base - args.accuracy_tolerance - 1e-9
+        elif kind == 'errors':
+            bad = value > base
+        else:
+            bad = value > base + args.latency_tolerance + 1e-9
+        if bad:
+            failures.append(f"{name} {metric}: {value} (baseline {base})")
+    if args.skip_throughput:
+        return failures
+
+    if current['fps'] < baseline['fps'] * (1 - args.tolerance):
+        failures.append(f"{name} fps: {current['fps']} (baseline {baseline['fps']}, "
+                        f"-{1 - current['fps'] / baseline['fps']:.0%})")
+    for stage, base in baseline['stage_ms'].items():
+        value = current['stage_ms'].get(stage, 0.0)
+        if value > base * (1 + args.tolerance) + STAGE_FLOOR_MS:
+            failures.append(f"{name} {stage} stage: {value:.3f} ms (baseline {base:.3f} ms)")
+    return failures
+
+
+def print_report(results, baseline):
+    base = baseline.get('presets', {}) if baseline else {}
+    for name, metrics in results.items():
+        old = base.get(name, {})
+        print(f"{name}: {metrics['crops']} crops, {metrics['sequences']} sequences")
+        for metric in METRICS:
+            was = f"  (baseline {old[metric]})" if metric in old and old[metric] != metrics[metric] else ''
+            print(f"  {metric:<24} {metrics[metric]}{was}")
+        stages = '  '.join(f"{stage} {ms:.3f}" for stage, ms in metrics['stage_ms'].items())
+        was = f"  (baseline {old['fps']})" if 'fps' in old else ''
+        print(f"  {'fps':<24} {metrics['fps']}{was}")
+        print(f"  stage ms: {stages}")
+        print(f"  known failures: {metrics['crop_known_failures']} of {metrics['crops_known']} crops with "
+              f"{KNOWN_FAILURE}")
+        for crop in metrics['crop_failures']:
+            print(f"  misclassified: {crop}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tracker accuracy and throughput regression suite")
+    parser.add_argument('--corpus', default=CORPUS_DIR, help="corpus directory (default: corpus/)")
+    parser.add_argument('--baseline', help="baseline file (default: baseline.json in the corpus directory)")
+    parser.add_argument('--preset', action='append', choices=sorted(PRESETS), help="default: all presets")
+    parser.add_argument('--generate', action='store_true', help="rebuild the corpus from --seed first")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--update', action='store_true', help="record the results as the new baseline")
+    parser.add_argument('--runs', type=int, default=2, help="timed runs per sequence, the best counts")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed fps loss and stage slowdown, as a fraction (default: 0.25)")
+    parser.add_argument('--accuracy-tolerance', type=float, default=0.0, help="allowed accuracy loss, as a fraction")
+    parser.add_argument('--latency-tolerance', type=float, default=0.0, help="allowed added latency, in frames")
+    parser.add_argument('--skip-throughput', action='store_true',
+                        help="check accuracy and latency only (baseline from another machine)")
+    args = parser.parse_args(argv)
+    baseline_path = args.baseline or os.path.join(args.corpus, 'baseline.json')
+
+    if args.generate:
+        generate_corpus(args.corpus, args.seed)
+        print(f"Corpus written to {args.corpus}")
+    try:
+        manifest, faces, digest = load_corpus(args.corpus)
+    except (OSError, ValueError) as e:
+        print(f"Cannot load corpus: {e}")
+        return 2
+
+    baseline = None
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+    results = {}
+    try:
+        for name, corpus in manifest['presets'].items():
+            if args.preset and name not in args.preset:
+                continue
+            preset = PRESETS[name]
+            metrics = check_crops(preset, corpus['crops'], faces, f'{name}/')
+            metrics.update(check_sequences(preset, corpus['sequences'], args.runs))
+            results[name] = metrics
+    except ValueError as e:
+        print(f"FAIL {e}")
+        return 1
+    print_report(results, baseline)
+    # Crops outside the known failures must all classify correctly, a
+    # baseline can't make a wrong answer the expected one
+    wrong = [f"{name} {crop} misclassified" for name, metrics in results.items() for crop in metrics['crop_failures']]
+
+    if args.update:
+        if wrong:
+            for failure in wrong:
+                print(f"FAIL {failure}")
+            print("Baseline not written")
+            return 1
+        presets = dict(baseline['presets']) if baseline and baseline.get('corpus') == digest else {}
+        presets.update(results)
+        with open(baseline_path, 'w') as f:
+            json.dump({'version': CORPUS_VERSION, 'corpus': digest, 'machine': machine(),
+                       'known_failure': KNOWN_FAILURE, 'presets': presets}, f, indent=2)
+        print(f"Baseline written to {baseline_path}")
+        return 0
+
+    if baseline is None:
+        print(f"No baseline at {baseline_path} (run --update)")
+        return 2
+    if baseline.get('corpus') != digest:
+        print("FAIL corpus changed since the baseline was recorded (review, then --update)")
+        return 1
+    if baseline.get('machine') != machine() and not args.skip_throughput:
+        print("Note: baseline recorded on another machine, throughput comparisons are approximate")
+    failures = wrong
+    for name, metrics in results.items():
+        if name not in baseline['presets']:
+            print(f"Note: no baseline for {name}")
+            continue
+        failures += compare(name, metrics, baseline['presets'][name], args)
+        fixed = set(baseline['presets'][name].get('known_failures', [])) - set(metrics['known_failures'])
+        if fixed:
+            print(f"Note: {name}: {len(fixed)} known failure(s) now classify correctly (review, then --update)")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print('OK' if not failures else f"{len(failures)} regression(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import threading
+
+
+class CardSlot:
+    __slots__ = ('photo', 'item', 'size')
+
+    def __init__(self, photo, item, size):
+        self.photo = photo
+        self.item = item
+        self.size = size
+
+
+class CardRenderer:
+    # Overlay card images, one persistent PhotoImage and canvas item per card
+    # slot, updated in place with paste().
+    #
+    # Updates can be posted from any thread. They are kept latest-wins per slot
+    # and applied by a single callback on the Tk thread; at most one callback
+    # is outstanding at a time, however fast updates arrive.
+    #
+    # canvas: tk.Canvas (or anything with create_image/itemconfigure/coords)
+    # schedule(fn): run fn on the Tk thread, e.g. lambda fn: widget.after(0, fn)
+    # photo_factory(pil_image): new PhotoImage, e.g. ImageTk.PhotoImage
+    def __init__(self, canvas, schedule, photo_factory):
+        self.canvas = canvas
+        self.schedule = schedule
+        self.photo_factory = photo_factory
+
+        self.lock = threading.Lock()
+        self.pending = {} # (row, col) -> (pil_image, x, y)
+        self.pending_labels = {} # (row, col) -> (text, color, x, y)
+        self.clear_pending = False
+        self.scheduled = False
+        self.slots = {} # (row, col) -> CardSlot, Tk thread only
+        self.labels = {} # (row, col) -> canvas text item, Tk thread only
+
+        # Counters for diagnostics
+        self.callbacks = 0
+        self.photos_created = 0
+
+    def post(self, updates):
+        # updates: iterable of ((row, col), pil_image, x, y) canvas positions
+        with self.lock:
+            for key, image, x, y in updates:
+                self.pending[key] = (image, x, y)
+            self._schedule_locked()
+
+    def post_labels(self, labels):
+        # labels: iterable of ((row, col), text, color, x, y), anchored top-center
+        with self.lock:
+            for key, text, color, x, y in labels:
+                self.pending_labels[key] = (text, color, x, y)
+            self._schedule_locked()
+
+    def clear(self):
+        # Hide every card image and label and drop queued updates
+        with self.lock:
+            self.pending.clear()
+            self.pending_labels.clear()
+            self.clear_pending = True
+            self._schedule_locked()
+
+    def _schedule_locked(self):
+        if not self.scheduled:
+            self.scheduled = True
+            self.schedule(self.flush)
+
+    def flush(self):
+        # Tk thread: apply everything queued since the last flush
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            pending_labels, self.pending_labels = self.pending_labels, {}
+            clear, self.clear_pending = self.clear_pending, False
+            self.scheduled = False
+        self.callbacks += 1
+
+        canvas = self.canvas
+        if clear:
+            for slot in self.slots.values():
+                canvas.itemconfigure(slot.item, state='hidden')
+            for item in self.labels.values():
+                canvas.itemconfigure(item, state='hidden')
+
+        for (row, col), (image, x, y) in pending.items():
+            slot = self.slots.get((row, col))
+            if slot is not None and slot.size == image.size:
+                slot.photo.paste(image)
+                canvas.coords(slot.item, x, y)
+                canvas.itemconfigure(slot.item, state='normal')
+                continue
+
+            # First image for this slot, or the card size changed
+            photo = self.photo_factory(image)
+            self.photos_created += 1
+            if slot is None:
+                item = canvas.create_image(x, y, image=photo, anchor='nw',
+                                           tags=('card_img', f'card_img_{row}_{col}'))
+                self.slots[(row, col)] = CardSlot(photo, item, image.size)
+            else:
+                canvas.coords(slot.item, x, y)
+                canvas.itemconfigure(slot.item, image=photo, state='normal')
+                slot.photo = photo
+                slot.size = image.size
+
+        for (row, col), (text, color, x, y) in pending_labels.items():
+            item = self.labels.get((row, col))
+            if item is None:
+                self.labels[(row, col)] = canvas.create_text(
+                    x, y, text=text, fill=color, anchor='n', font=('Arial', 11, 'bold'),
+                    tags=('card_label', f'card_label_{row}_{col}'))
+            else:
+                canvas.coords(item, x, y)
+                canvas.itemconfigure(item, text=text, fill=color, state='normal')
+        if pending and self.labels:
+            # Keep labels above card images
+            canvas.tag_raise('card_label')
@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import deque
+
+
+class FrameScheduler:
+    # Paces the tracking loop with perf_counter deadlines.
+    # Runs at active_fps while cards are moving and for `linger` seconds after
+    # the last motion, then drops to idle_fps. A frame that finishes after its
+    # deadline counts as missed and the schedule restarts from now instead of
+    # trying to catch up.
+    #
+    # interrupt() (from any thread) cuts the current wait short, and makes
+    # later ones return at once until reset(): a stopping loop doesn't sleep
+    # out an idle interval.
+    def __init__(self, active_fps=30, idle_fps=5, linger=1.0, window=60,
+                 clock=time.perf_counter, sleep=None):
+        self.active_interval = 1.0 / active_fps
+        self.idle_interval = 1.0 / idle_fps
+        self.linger = linger
+        self.clock = clock
+        self.interrupted = threading.Event()
+        self.sleep = sleep or self.interrupted.wait
+        self.frame_times = deque(maxlen=window)
+        self.reset()
+
+    def interrupt(self):
+        self.interrupted.set()
+
+    def reset(self):
+        self.interrupted.clear()
+        self.deadline = None
+        self.last_motion = None
+        self.frames = 0
+        self.missed = 0
+        self.frame_times.clear()
+
+    @property
+    def active(self):
+        return self.last_motion is not None and self.clock() - self.last_motion < self.linger
+
+    def wait(self, motion):
+        # Call once per frame after processing; sleeps until the next deadline
+        now = self.clock()
+        self.frames += 1
+        self.frame_times.append(now)
+        if motion:
+            self.last_motion = now
+
+        interval = self.active_interval if self.active else self.idle_interval
+        if self.deadline is None:
+            self.deadline = now
+        self.deadline += interval
+
+        delay = self.deadline - now
+        if delay > 0:
+            self.sleep(delay)
+        else:
+            self.missed += 1
+            self.deadline = now
+
+    def fps(self):
+        # Effective frame rate over the recent window
+        if len(self.frame_times) < 2:
+            return 0.0
+        span = self.frame_times[-1] - self.frame_times[0]
+        return (len(self.frame_times) - 1) / span if span > 0 else 0.0
+
+    def stats(self):
+        return {
+            'fps': self.fps(),
+            'frames': self.frames,
+            'missed': self.missed,
+            'mode': 'active' if self.active else 'idle',
+        }
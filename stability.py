@@ -0,0 +1,85 @@
+import math
+
+import numpy as np
+
+
+class StabilityTracker:
+    # Counts consecutive frames in which each card barely changed.
+    # A card's signature is every `step`-th pixel in both directions (a
+    # decimated thumbnail); the card is stable once the mean absolute
+    # difference of its signature has stayed under diff_threshold for
+    # stable_frames frames in a row.
+    #
+    # Per-card arrays are allocated on the first frame (or when the grid
+    # changes) and updated in place afterwards. update() and changed()
+    # return those buffers, read them before the next update().
+    def __init__(self, diff_threshold=5.0, stable_frames=2, step=4):
+        self.diff_threshold = diff_threshold
+        self.stable_frames = stable_frames
+        self.step = step
+        self.reset()
+
+    def reset(self):
+        self.signatures = None
+        self.counts = None
+        self.moved = None
+
+    def _allocate(self, shape):
+        grid = shape[:2]
+        # int32 so differences can't wrap and sums reduce without casting
+        self.signatures = np.empty(shape, dtype=np.int32)
+        self.work = np.empty(shape, dtype=np.int32)
+        self.sums = np.zeros(grid, dtype=np.int32)
+        self.counts = np.zeros(grid, dtype=np.int32)
+        self.quiet = np.zeros(grid, dtype=bool)
+        self.moved = np.zeros(grid, dtype=bool)
+        self.stable = np.zeros(grid, dtype=bool)
+        # Mean diff < threshold  <=>  summed diff < limit
+        self.limit = math.ceil(self.diff_threshold * math.prod(shape[2:]))
+
+    def update(self, cards, active=None):
+        # Feed one frame of cards, returns the (rows, cols) stable mask.
+        # active: optional (rows, cols) mask of the cards to check, the others
+        # keep their signature and count (and read as unchanged).
+        decimated = cards[..., ::self.step, ::self.step, :]
+        if self.signatures is None or self.signatures.shape != decimated.shape:
+            # First frame or geometry changed
+            self._allocate(decimated.shape)
+            np.copyto(self.signatures, decimated)
+        elif active is None:
+            # New signatures into work, diff in place of the old ones, swap
+            np.copyto(self.work, decimated)
+            np.subtract(self.work, self.signatures, out=self.signatures)
+            np.abs(self.signatures, out=self.signatures)
+            np.add.reduce(self.signatures, axis=(-3, -2, -1), out=self.sums)
+            self.signatures, self.work = self.work, self.signatures
+            np.less(self.sums, self.limit, out=self.quiet)
+            np.logical_not(self.quiet, out=self.moved)
+            np.add(self.counts, 1, out=self.counts)
+            np.copyto(self.counts, 0, where=self.moved)
+        else:
+            self.moved.fill(False)
+            for r, c in zip(*np.nonzero(active)):
+                sig, work = self.signatures[r, c], self.work[r, c]
+                np.copyto(work, decimated[r, c])
+                np.subtract(work, sig, out=sig)
+                np.abs(sig, out=sig)
+                np.add.reduce(sig, axis=None, out=self.sums[r, c, ...])
+                np.copyto(sig, work)
+                if self.sums[r, c] < self.limit:
+                    self.counts[r, c] += 1
+                else:
+                    self.counts[r, c] = 0
+                    self.moved[r, c] = True
+        np.greater_equal(self.counts, self.stable_frames, out=self.stable)
+        return self.stable
+
+    def restart(self, mask):
+        # Cards in mask need stable_frames fresh quiet frames again (after a
+        # grid size change, update() starts every card over anyway)
+        if self.counts is not None and self.counts.shape == mask.shape:
+            np.copyto(self.counts, 0, where=mask)
+
+    def changed(self):
+        # Cards whose signature moved past the threshold this frame
+        return self.moved
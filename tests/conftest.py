@@ -0,0 +1,15 @@
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def user_dirs(tmp_path_factory):
+    # Settings (profiles, card index) and caches (palette and classifier
+    # tables) in a scratch home for the whole run: the tests neither read
+    # this machine's files nor leave tables in its cache. Session scoped so
+    # module scoped fixtures run inside it too.
+    home = tmp_path_factory.mktemp('home')
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('HOME', str(home))
+        patch.setenv('APPDATA', str(home / 'config'))
+        patch.setenv('LOCALAPPDATA', str(home / 'cache'))
+        yield home
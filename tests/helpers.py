@@ -0,0 +1,393 @@
+# Stand-ins and scenario runs shared by the tests and bench.py. The event
+# stream and process pipeline scenarios import their modules when run, so
+# tests that don't use them don't load asyncio or multiprocessing.
+import gc
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+
+from boards import BoardScheduler
+from frames import FrameSource, SyntheticFrameSource, crop_region
+from geometry import GridGeometry
+from tracker import CardTracker
+
+
+class HeadlessOverlay:
+    # Stand-in for CardOverlay with the window at the screen origin and the
+    # grid where SyntheticFrameSource draws it. Records overlay updates
+    # instead of drawing them.
+    def __init__(self, preset, origin=(50, 50)):
+        self.card_geometry = GridGeometry.from_preset(preset, start=origin)
+        self.overlay_alpha = 230
+        self.updates = []
+        self.labels = []
+
+    def update_card_images(self, updates):
+        self.updates.extend((row, col) for row, col, _, _ in updates)
+
+    def update_card_labels(self, labels):
+        self.labels = list(labels)
+
+    def clear_marks(self):
+        self.updates.clear()
+
+
+def headless_tracker(preset, source, instrumentation=None):
+    # Tracker reading its grid from, and reporting to, a HeadlessOverlay
+    overlay = HeadlessOverlay(preset)
+    return CardTracker(overlay, overlay, source, instrumentation)
+
+
+def run_pipeline(preset, source, frames, instrumentation=None):
+    # Run the tracker headless over `frames` frames, returns (tracker, latencies in s)
+    overlay = HeadlessOverlay(preset)
+    tracker = CardTracker(overlay, overlay, source, instrumentation)
+    latencies = np.empty(frames)
+    for i in range(frames):
+        start = time.perf_counter()
+        if not tracker.process_frame(source):
+            latencies = latencies[:i]
+            break
+        latencies[i] = time.perf_counter() - start
+    return tracker, latencies
+
+
+def detection_score(tracker, gold_cards):
+    detected = {card for card, state in tracker.card_states.items() if state == 'GOLD'}
+    hits = len(detected & gold_cards)
+    return hits, len(detected - gold_cards), len(gold_cards - detected)
+
+
+class FakeCanvas:
+    # Counts canvas operations instead of drawing
+    def __init__(self):
+        self.created = 0
+        self.deleted = 0
+        self.items = 0
+
+    def create_image(self, x, y, **kw):
+        self.created += 1
+        self.items += 1
+        return self.items
+
+    def create_text(self, x, y, **kw):
+        return self.create_image(x, y)
+
+    def delete(self, tag):
+        self.deleted += 1
+
+    def tag_raise(self, tag):
+        pass
+
+    def coords(self, item, x, y):
+        pass
+
+    def itemconfigure(self, item, **kw):
+        pass
+
+
+class FakePhoto:
+    def __init__(self, image):
+        self.size = image.size
+
+    def paste(self, image):
+        pass
+
+
+class FakeTk:
+    # Queue of after(0, ...) callbacks, run when the "mainloop" gets a turn
+    def __init__(self):
+        self.queue = []
+        self.max_queue = 0
+
+    def after(self, fn):
+        self.queue.append(fn)
+        self.max_queue = max(self.max_queue, len(self.queue))
+
+    def pump(self):
+        queue, self.queue = self.queue, []
+        for fn in queue:
+            fn()
+
+
+def run_process_pipeline(preset, factory, seconds, fps):
+    # Returns (captured/s, analyzed/s, main process cpu share, card_states)
+    from pipeline import ProcessPipeline
+
+    pipeline = ProcessPipeline(HeadlessOverlay(preset), factory, active_fps=fps, idle_fps=fps)
+    pipeline.start()
+    # Let both processes come up before measuring
+    while pipeline.stats()['analyzed'] == 0:
+        pipeline.pump()
+        time.sleep(0.01)
+    before = pipeline.stats()
+    cpu = time.process_time()
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        pipeline.pump()
+        time.sleep(0.015)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    after = pipeline.stats()
+    pipeline.close()
+    pipeline.pump()
+    captured = (after['captured'] - before['captured']) / elapsed
+    analyzed = (after['analyzed'] - before['analyzed']) / elapsed
+    return captured, analyzed, cpu / elapsed, pipeline.card_states
+
+
+def fake_desktop(width, height, rng):
+    # Wallpaper gradient, a few windows (some dark, like a dark themed
+    # editor) and a dark taskbar
+    screen = np.empty((height, width, 4), dtype=np.uint8)
+    screen[:, :, :3] = np.linspace(60, 140, width, dtype=np.uint8)[None, :, None]
+    screen[:, :, 3] = 255
+    for dark in (True, False, False, True, False):
+        w, h = rng.integers(width // 8, width // 3), rng.integers(height // 8, height // 2)
+        x, y = rng.integers(0, width - w), rng.integers(0, height - h)
+        screen[y:y + h, x:x + w, :3] = rng.integers(5, 18, size=3) if dark else rng.integers(60, 255, size=3)
+        # Title bar
+        screen[y:y + 30, x:x + w, :3] = 200
+    screen[-48:, :, :3] = 16
+    return screen
+
+
+class BufferSource(FrameSource):
+    # Replays pre-rendered frames as they are, like a capture that fills a
+    # reused buffer (the process pipeline's RingFrameSource does), so only
+    # the tracker's own allocations are measured
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+
+    def grab(self, region):
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return frame
+
+
+def alloc_boards(preset, seed=0):
+    # (board, frames) pairs: a still face-down board and one replayed game
+    geometry = HeadlessOverlay(preset).card_geometry
+    synth = SyntheticFrameSource(preset, seed=seed)
+    return (
+        ('idle', [crop_region(synth.render_pose(0.0), (0, 0), geometry.monitor)]),
+        ('play', [crop_region(synth.render(), (0, 0), geometry.monitor) for _ in range(len(synth))]),
+    )
+
+
+def trace_frames(tracker, source, frames, settle):
+    # tracemalloc over `frames` tracker frames, returns (peak bytes allocated
+    # within each frame, traced memory growth over the run, gc runs). The
+    # first `settle` traced frames are not counted: they refill the
+    # interpreter's free lists (2000 tuples per size), which tracemalloc
+    # sees as growth.
+    peaks = np.empty(frames, dtype=np.int64)
+    gc.collect()
+    tracemalloc.start()
+    for _ in range(settle):
+        tracker.process_frame(source)
+    collections = sum(stats['collections'] for stats in gc.get_stats())
+    start = tracemalloc.get_traced_memory()[0]
+    for i in range(frames):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        tracker.process_frame(source)
+        peaks[i] = tracemalloc.get_traced_memory()[1] - before
+    growth = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return peaks, growth, sum(stats['collections'] for stats in gc.get_stats()) - collections
+
+
+def published(publisher):
+    # Wait until the publisher's loop has handled everything published so far
+    import asyncio
+    asyncio.run_coroutine_threadsafe(asyncio.sleep(0), publisher.loop).result()
+    return publisher.seq
+
+
+def event_clients(address, preset, seed=0, queue=256, flood=50000):
+    # Stand-in clients on a publisher fed by the tracker over one synthetic
+    # game: one keeps up, one stalls (never reads) and one joins after the
+    # game. A flood of events follows with the stalled client still stuck,
+    # then it reads what is left. Returns what each client got and the
+    # publisher's timings.
+    from events import EventPublisher, connect, subscribe
+
+    publisher = EventPublisher(address, queue_size=queue).start()
+    fast = []
+    fast_thread = threading.Thread(target=lambda: fast.extend(subscribe(publisher.address)), daemon=True)
+    fast_thread.start()
+    stalled = connect(publisher.address)
+    stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    deadline = time.perf_counter() + 5
+    while publisher.stats()['subscribers'] < 2 and time.perf_counter() < deadline:
+        time.sleep(0.01)
+
+    # The game, timing every publish() the tracker makes
+    synth = SyntheticFrameSource(preset, noise=2, seed=seed, loop=False)
+    overlay = HeadlessOverlay(preset)
+    publish_times = []
+    publish = publisher.publish
+    def timed_publish(*a, **kw):
+        start = time.perf_counter()
+        publish(*a, **kw)
+        publish_times.append(time.perf_counter() - start)
+    tracker = CardTracker(overlay, overlay, synth, events=SimpleNamespace(publish=timed_publish))
+    frame_times = []
+    while True:
+        start = time.perf_counter()
+        if not tracker.process_frame(synth):
+            break
+        frame_times.append(time.perf_counter() - start)
+    game_seq = published(publisher)
+    gold = {card for card, state in tracker.card_states.items() if state == 'GOLD'}
+
+    late = subscribe(publisher.address)
+    snapshot = next(late)
+    late.close()
+
+    flood_start = time.perf_counter()
+    for i in range(flood):
+        publisher.publish('gold', 0, 0, count=i)
+    flood_time = time.perf_counter() - flood_start
+    final_seq = published(publisher)
+    deadline = time.perf_counter() + 10
+    while (not fast or fast[-1]['seq'] < final_seq) and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    with stalled, stalled.makefile('rb') as stream:
+        stalled.settimeout(10)
+        late_reads = []
+        for line in stream:
+            late_reads.append(json.loads(line))
+            if late_reads[-1]['seq'] >= final_seq:
+                break
+    publisher.close()
+    fast_thread.join(timeout=2)
+    return SimpleNamespace(synth=synth, gold=gold, game_seq=game_seq, final_seq=final_seq, fast=fast,
+                           snapshot=snapshot, stalled=late_reads, frame_times=frame_times,
+                           publish_times=publish_times, flood_time=flood_time)
+
+
+def event_addresses():
+    # TCP, and a Unix socket where there are those
+    addresses = [('127.0.0.1', 0)]
+    if hasattr(socket, 'AF_UNIX'):
+        addresses.append(os.path.join(tempfile.mkdtemp(), 'events.sock'))
+    return addresses
+
+
+class DesktopSource(FrameSource):
+    # Stand-in desktop with synthetic games pasted where their boards sit:
+    # placements are (SyntheticFrameSource, its card grid region, the
+    # region on the desktop). tick() advances every game one frame, grab()
+    # crops the desktop as it is and counts what was grabbed.
+    def __init__(self, width, height, placements):
+        self.screen = np.zeros((height, width, 4), dtype=np.uint8)
+        self.placements = placements
+        self.grabs = 0
+        self.pixels = 0
+
+    def tick(self):
+        # False once every game is over
+        playing = False
+        for synth, region, target in self.placements:
+            frame = synth.grab(region)
+            if frame is None:
+                continue
+            playing = True
+            self.screen[target['top']:target['top'] + target['height'],
+                        target['left']:target['left'] + target['width']] = frame
+        return playing
+
+    def grab(self, region):
+        self.grabs += 1
+        self.pixels += region['width'] * region['height']
+        return crop_region(self.screen, (0, 0), region)
+
+
+def board_layouts(preset, margin=20, spacing=40):
+    # name -> [(game, card grid top-left on the desktop, covered by a later board)]
+    # Boards showing the same game index watch the same board
+    monitor = GridGeometry.from_preset(preset).monitor
+    w, h = monitor['width'], monitor['height']
+    return {
+        'apart': [(k, (margin + (k % 2) * (w + spacing), margin + (k // 2) * (h + spacing)), False) for k in range(4)],
+        'touching': [(k, (margin + (k % 2) * w, margin + (k // 2) * h), False) for k in range(4)],
+        'overlap': [(0, (margin, margin), True), (1, (margin + w // 2, margin + h // 3), False)],
+        'same': [(0, (margin, margin), False), (0, (margin, margin), False)],
+    }
+
+
+def track_boards(preset, boards, shared, noise=2, seed=0):
+    # Plays board_layouts() boards on a DesktopSource, tracked by one
+    # BoardScheduler (merged grabs) or by one CardTracker per board grabbing
+    # its own rectangle. Returns grabs, pixels and seconds per tick, the
+    # trackers, each board's game and the desktop pixels boards cover.
+    padding = preset['padding']
+    synths = {}
+    trackers = []
+    placements = []
+    for game, (x, y), _ in boards:
+        if game not in synths:
+            synths[game] = SyntheticFrameSource(preset, noise=noise, seed=seed + game, loop=False)
+        geometry = GridGeometry.from_preset(preset, start=(x - padding, y - padding))
+        overlay = HeadlessOverlay(preset)
+        overlay.card_geometry = geometry
+        trackers.append(CardTracker(overlay, overlay))
+        placements.append((synths[game], geometry))
+    # Each game pasted once, the last board placed wins where they overlap
+    region = GridGeometry.from_preset(preset).monitor
+    seen = {}
+    for (game, _, _), (synth, geometry) in zip(boards, placements):
+        seen[game] = (synth, region, geometry.monitor)
+    right = max(g.monitor['left'] + g.monitor['width'] for _, g in placements)
+    bottom = max(g.monitor['top'] + g.monitor['height'] for _, g in placements)
+    desktop = DesktopSource(right + 20, bottom + 20, [seen[game] for game in sorted(seen)])
+    covered = np.zeros(desktop.screen.shape[:2], dtype=bool)
+    for _, g in placements:
+        m = g.monitor
+        covered[m['top']:m['top'] + m['height'], m['left']:m['left'] + m['width']] = True
+
+    scheduler = BoardScheduler(trackers)
+    ticks = 0
+    elapsed = 0.0
+    while desktop.tick():
+        start = time.perf_counter()
+        if shared:
+            scheduler.process_tick(desktop)
+        else:
+            for tracker in trackers:
+                tracker.process_frame(desktop)
+        elapsed += time.perf_counter() - start
+        ticks += 1
+    return SimpleNamespace(grabs=desktop.grabs / ticks, pixels=desktop.pixels / ticks, seconds=elapsed / ticks,
+                           trackers=trackers, games=[synths[game] for game, _, _ in boards],
+                           covered=int(covered.sum()))
+
+
+# Heavy modules reported by fresh_import()
+WATCHED_MODULES = ('tkinter', 'PIL.Image', 'PIL.ImageTk', 'numpy', 'mss')
+
+
+def fresh_import(module):
+    # Imports module in a fresh interpreter, returns (import ms, the
+    # WATCHED_MODULES loaded with it). Raises RuntimeError if it fails.
+    code = ("import sys, time; start = time.perf_counter(); import %s; "
+            "print((time.perf_counter() - start) * 1000, *[m for m in %r if m in sys.modules])"
+            % (module, WATCHED_MODULES))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    run = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True)
+    if run.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{run.stderr}")
+    ms, *loaded = run.stdout.split()
+    return float(ms), loaded
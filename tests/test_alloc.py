@@ -0,0 +1,24 @@
+import pytest
+
+from tests.helpers import BufferSource, alloc_boards, headless_tracker, trace_frames
+from geometry import PRESETS
+
+# Bytes a tracker frame may allocate, and the run may grow by: room for the
+# Python objects of a frame (array views and the like), not for a frame or
+# card sized buffer
+LIMIT = 8192
+
+
+@pytest.mark.parametrize('incremental', [False, True], ids=['full', 'incremental'])
+@pytest.mark.parametrize('name', sorted(PRESETS))
+def test_frames_allocate_no_buffers(name, incremental):
+    for board, frames in alloc_boards(PRESETS[name]):
+        source = BufferSource(frames)
+        tracker = headless_tracker(PRESETS[name], source)
+        tracker.incremental = incremental
+        # Warm-up: buffers, and overlay images for the game's gold cards
+        for _ in range(len(frames) + 5):
+            tracker.process_frame(source)
+        peaks, growth, _ = trace_frames(tracker, source, frames=200, settle=500)
+        assert peaks.max() <= LIMIT, f"{board}: {peaks.max()} B allocated in one frame"
+        assert growth <= LIMIT, f"{board}: traced memory grew {growth} B"
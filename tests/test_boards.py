@@ -0,0 +1,53 @@
+import pytest
+
+from tests.helpers import board_layouts, detection_score, headless_tracker, track_boards
+from boards import BoardScheduler
+from frames import SyntheticFrameSource
+from geometry import PRESETS
+from instrument import STAGES, Instrumentation
+
+PRESET = PRESETS['FHD']
+# Boards far apart are grabbed one by one, the others in one merged grab
+GRABS = {'apart': 4, 'touching': 1, 'overlap': 1, 'same': 1}
+
+
+@pytest.fixture(scope='module', params=sorted(GRABS))
+def layout(request):
+    boards = board_layouts(PRESET)[request.param]
+    return request.param, boards, track_boards(PRESET, boards, True), track_boards(PRESET, boards, False)
+
+
+def states(run):
+    return [(dict(t.card_states), t.buffers.best_gold.tolist()) for t in run.trackers]
+
+
+def test_shared_grabs_track_like_separate_trackers(layout):
+    _, _, shared, separate = layout
+    assert states(shared) == states(separate)
+
+
+def test_uncovered_boards_find_their_gold_cards(layout):
+    _, boards, shared, _ = layout
+    for (_, _, hidden), tracker, game in zip(boards, shared.trackers, shared.games):
+        if not hidden:
+            assert detection_score(tracker, game.gold_cards) == (len(game.gold_cards), 0, 0)
+
+
+def test_merged_grabs(layout):
+    name, _, shared, separate = layout
+    assert shared.grabs == GRABS[name]
+    assert shared.pixels <= separate.pixels
+
+
+def test_one_timed_frame_per_tick():
+    # Boards sharing the stats panel's Instrumentation are timed once per
+    # tick, not once per board
+    synth = SyntheticFrameSource(PRESET, seed=0)
+    instrumentation = Instrumentation(enabled=True)
+    trackers = [headless_tracker(PRESET, synth, instrumentation) for _ in range(2)]
+    scheduler = BoardScheduler(trackers, synth, instrumentation=instrumentation)
+    for _ in range(20):
+        assert scheduler.process_tick(synth)
+    snapshot = instrumentation.snapshot()
+    assert snapshot['frames'] == scheduler.ticks == 20
+    assert all(snapshot['stages'][stage]['count'] == 20 for stage in STAGES)
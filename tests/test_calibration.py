@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from tests.helpers import fake_desktop
+from calibration import calibrate, scale_preset
+from frames import SyntheticFrameSource
+from geometry import PRESETS
+
+SCREEN = (3840, 2160)
+REFERENCE = PRESETS['FHD']
+BOARDS = dict(PRESETS, **{f'x{scale:g}': scale_preset(REFERENCE, scale) for scale in (0.67, 1.17, 1.5, 2.0)})
+
+
+def noisy(screen, rng, noise=2):
+    jitter = rng.integers(-noise, noise + 1, size=screen.shape[:2] + (3,), dtype=np.int16)
+    screen[:, :, :3] = np.clip(screen[:, :, :3] + jitter, 0, 255)
+    return screen
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+@pytest.mark.parametrize('name', sorted(BOARDS))
+def test_fit_matches_drawn_board(name, seed):
+    # A face-down board at a random offset on a synthetic desktop: the fit
+    # hits every card edge within 1 px, with the exact pitch, and gives back
+    # the preset the board was drawn with
+    rng = np.random.default_rng(seed)
+    width, height = SCREEN
+    preset = BOARDS[name]
+    screen = fake_desktop(width, height, rng)
+    margin = round(preset['cell_w'] * 0.25)
+    board = SyntheticFrameSource(preset, origin=(margin, margin), seed=seed)
+    image = board.render_pose(0.0)
+    h, w = image.shape[:2]
+    x, y = int(rng.integers(0, width - w + 1)), int(rng.integers(0, height - h + 1))
+    screen[y:y + h, x:x + w] = image
+
+    fit = calibrate(noisy(screen, rng), REFERENCE)
+    assert fit is not None
+    assert abs(fit.left - (x + board.card_x)) <= 1
+    assert abs(fit.top - (y + board.card_y)) <= 1
+    assert abs(fit.card_w - board.card_w) <= 1
+    assert abs(fit.card_h - board.card_h) <= 1
+    assert (fit.pitch_x, fit.pitch_y) == (board.pitch_x, board.pitch_y)
+    assert fit.preset(PRESETS)['scan_y_start'] == preset['scan_y_start']
+
+
+def test_no_board_no_fit():
+    rng = np.random.default_rng(0)
+    assert calibrate(noisy(fake_desktop(*SCREEN, rng), rng), REFERENCE) is None
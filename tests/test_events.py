@@ -0,0 +1,37 @@
+import pytest
+
+from tests.helpers import event_addresses, event_clients
+from geometry import PRESETS
+
+
+@pytest.fixture(scope='module', params=event_addresses(), ids=lambda address: 'unix' if isinstance(address, str) else 'tcp')
+def run(request):
+    return event_clients(request.param, PRESETS['FHD'], flood=5000)
+
+
+def test_client_keeping_up_gets_every_game_event(run):
+    assert run.fast[0] == {'seq': 0, 'type': 'snapshot', 'cards': []}
+    game = [e for e in run.fast[1:] if e['seq'] <= run.game_seq]
+    assert [e['seq'] for e in game] == list(range(1, run.game_seq + 1))
+    cards = run.synth.rows * run.synth.cols
+    kinds = {}
+    for e in game:
+        key = e['type'] + ('_up' if e.get('up') else '_down' if 'up' in e else '')
+        kinds[key] = kinds.get(key, 0) + 1
+    assert (kinds.get('flip_up'), kinds.get('flip_down'), kinds.get('settle')) == (cards, cards, cards)
+    assert {(e['r'], e['c']) for e in game if e['type'] == 'gold'} == run.gold == run.synth.gold_cards
+
+
+def test_late_client_starts_from_a_current_snapshot(run):
+    snapshot = run.snapshot
+    assert snapshot['seq'] == run.game_seq
+    assert {(c['r'], c['c']) for c in snapshot['cards'] if 'gold' in c} == run.gold
+    assert not any(c.get('up') for c in snapshot['cards'])
+
+
+def test_stalled_client_gets_newest_events_after_a_gap(run):
+    seqs = [e['seq'] for e in run.stalled[1:]]
+    assert seqs and seqs[-1] == run.final_seq
+    assert seqs == sorted(set(seqs))
+    assert len(seqs) < run.final_seq
+
@@ -0,0 +1,18 @@
+import pytest
+
+from tests.helpers import fresh_import
+
+# The detection core and headless CLI must not load Tk, the GUI must not
+# load PIL or mss before tracking starts
+FORBIDDEN = {
+    'tracker': ('tkinter', 'PIL.ImageTk'),
+    'headless': ('tkinter', 'PIL.ImageTk'),
+    'pipeline': ('tkinter', 'PIL.ImageTk', 'PIL.Image'),
+    'main': ('PIL.Image', 'PIL.ImageTk', 'mss'),
+}
+
+
+@pytest.mark.parametrize('module', sorted(FORBIDDEN))
+def test_startup_imports(module):
+    _, loaded = fresh_import(module)
+    assert not set(loaded) & set(FORBIDDEN[module])
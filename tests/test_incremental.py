@@ -0,0 +1,31 @@
+import pytest
+
+from tests.helpers import headless_tracker
+from frames import SyntheticFrameSource
+from geometry import PRESETS
+from recognition import CardIndex, CardRecognizer, dhash
+
+
+def replay(preset, incremental, seed):
+    # One noisy scripted game through the tracker, returns (synth, gold cards
+    # detected, card names)
+    synth = SyntheticFrameSource(preset, idle_frames=5, noise=2, seed=seed, loop=False)
+    index = CardIndex((f'card-{pair}', dhash(face[..., :3])) for (pair, _), face in synth.pair_faces.items())
+    tracker = headless_tracker(preset, synth)
+    tracker.incremental = incremental
+    tracker.recognizer = CardRecognizer(index)
+    while tracker.process_frame(synth):
+        pass
+    gold = {card for card, state in tracker.card_states.items() if state == 'GOLD'}
+    return synth, gold, dict(tracker.recognizer.names)
+
+
+@pytest.mark.parametrize('name', sorted(PRESETS))
+def test_incremental_loses_no_detections(name):
+    # Analyzing only the cards that change finds the same gold cards and
+    # card identities as analyzing every card every frame, and those are
+    # the game's
+    synth, gold, names = replay(PRESETS[name], False, seed=0)
+    assert gold == synth.gold_cards
+    assert len(names) == len(synth.card_ids)
+    assert replay(PRESETS[name], True, seed=0)[1:] == (gold, names)
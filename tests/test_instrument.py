@@ -0,0 +1,88 @@
+from instrument import FRAME, STAGES, Instrumentation, StageHistogram
+
+
+def test_histogram_percentiles():
+    hist = StageHistogram()
+    for ms in range(1, 101):
+        hist.record(ms / 1000)
+    assert hist.count == 100
+    # Bucket-accurate: within one 1/20 decade bucket above the true value
+    assert 0.050 <= hist.percentile(50) <= 0.050 * 10 ** (1 / 20)
+    assert hist.percentile(100) == hist.max == 0.1
+
+
+def test_disabled_records_nothing():
+    timings = Instrumentation()
+    timings.frame_start()
+    timings.lap('capture')
+    timings.frame_end()
+    assert timings.snapshot()['frames'] == 0
+
+
+def test_start_mid_frame_skips_that_frame():
+    # Recording turned on (UI thread) while a frame is under way: that
+    # frame's laps and end are ignored, timing starts at the next frame
+    timings = Instrumentation()
+    timings.frame_start()
+    timings.start()
+    timings.lap('capture')
+    timings.frame_end()
+    assert timings.snapshot()['frames'] == 0
+    assert timings.histograms['capture'].count == 0
+    timings.frame_start()
+    for stage in STAGES:
+        timings.lap(stage)
+    timings.frame_end()
+    snapshot = timings.snapshot()
+    assert snapshot['frames'] == 1
+    assert all(snapshot['stages'][stage]['count'] == 1 for stage in STAGES)
+
+
+def test_restart_resets_at_the_next_frame():
+    timings = Instrumentation(enabled=True)
+    for _ in range(3):
+        timings.frame_start()
+        timings.lap('capture')
+        timings.frame_end()
+    timings.frame_start()
+    timings.start()
+    # The frame under way still records into the old timings
+    timings.lap('capture')
+    timings.frame_end()
+    assert timings.histograms['capture'].count == 4
+    timings.frame_start()
+    timings.frame_end()
+    assert timings.histograms['capture'].count == 0
+    assert timings.histograms[FRAME].count == 1
+
+
+def test_stop_mid_frame():
+    timings = Instrumentation(enabled=True)
+    timings.frame_start()
+    timings.stop()
+    timings.lap('capture')
+    timings.frame_end()
+    timings.frame_start()
+    timings.lap('capture')
+    timings.frame_end()
+    assert timings.histograms['capture'].count == 1
+    assert timings.histograms[FRAME].count == 1
+
+
+def test_tick_times_boards_as_one_frame():
+    # Two boards' frames in a tick: one frame, each stage recorded once with
+    # the boards' laps added up
+    timings = Instrumentation(enabled=True)
+    timings.tick_start()
+    timings.lap('capture')
+    for _ in range(2):
+        timings.frame_start()
+        for stage in STAGES:
+            timings.lap(stage)
+        timings.frame_end()
+    timings.tick_end()
+    snapshot = timings.snapshot()
+    assert snapshot['frames'] == 1
+    assert all(snapshot['stages'][stage]['count'] == 1 for stage in STAGES)
+    total = sum(timings.histograms[stage].total for stage in STAGES)
+    assert total <= timings.histograms[FRAME].total
@@ -0,0 +1,31 @@
+import pytest
+
+from main import parse_args
+
+
+def test_defaults():
+    args = parse_args([])
+    assert (args.processes, args.events, args.workers, args.boards) == (False, None, None, 1)
+
+
+def test_events_default_address():
+    assert parse_args(['--events']).events == '127.0.0.1:8765'
+    assert parse_args(['--events', '/tmp/events.sock']).events == '/tmp/events.sock'
+
+
+@pytest.mark.parametrize('argv', [
+    ['--processes', '--boards', '2'],
+    ['--boards', '0'],
+    ['--workers', '-1'],
+    ['--boards', 'two'],
+])
+def test_rejected(argv, capsys):
+    with pytest.raises(SystemExit) as exit:
+        parse_args(argv)
+    assert exit.value.code == 2
+    assert 'error' in capsys.readouterr().err
+
+
+def test_processes_with_one_board():
+    args = parse_args(['--processes', '--boards', '1'])
+    assert args.processes and args.boards == 1
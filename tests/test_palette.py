@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from analysis import card_grid_view, gold_pixel_counts, scan_strip
+from frames import SyntheticFrameSource, crop_region
+from geometry import PRESETS, GridGeometry
+from palette import PALETTES, ColorClassifier, Palette, packed_bgra
+
+EXTRA = [
+    Palette('test-silver', [(150, 160, 160)], 15),
+    Palette('test-purple', [(140, 70, 180)], 15),
+]
+
+
+@pytest.mark.parametrize('name', sorted(PRESETS))
+def test_table_matches_range_masks(name, tmp_path):
+    # Every card face up: the lookup table counts what the per-channel range
+    # masks count, for each palette of the classifier
+    preset = PRESETS[name]
+    geometry = GridGeometry.from_preset(preset, start=(50, 50))
+    y0, y1 = geometry.scan_y_start, geometry.scan_y_end
+    synth = SyntheticFrameSource(preset, seed=0)
+    frame = crop_region(synth.render_pose(1.0), (0, 0), geometry.monitor)
+    cards = card_grid_view(frame[..., :3], *geometry.layout)
+    packed = scan_strip(card_grid_view(packed_bgra(frame), *geometry.layout), y0, y1, channel_axis=False)
+
+    palettes = [PALETTES['gold']] + EXTRA
+    classifier = ColorClassifier(palettes, tmp_path)
+    counts = classifier.counts(packed)
+    filled = classifier.counts(packed, out={p.name: np.zeros(cards.shape[:2], dtype=np.int64) for p in palettes})
+    for palette in palettes:
+        bgr = tuple(t[::-1] for t in palette.targets)
+        expected = gold_pixel_counts(cards, y0, y1, bgr, palette.tolerance)
+        np.testing.assert_array_equal(counts[palette.name], expected)
+        np.testing.assert_array_equal(filled[palette.name], expected)
+    assert counts['gold'].sum() > 0
+
+
+def test_tolerance_edges(tmp_path):
+    classifier = ColorClassifier([Palette('edge', [(100, 100, 100)], 15)], tmp_path)
+    rgb = np.array([[100, 100, 100], [115, 85, 115], [116, 100, 100], [100, 84, 100]], dtype=np.uint32)
+    packed = (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2] | 0xFF000000
+    assert classifier.classify(packed).tolist() == [1, 1, 0, 0]
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from analysis import GridAnalysis, analyze_grid, card_grid_view, card_runs
+from frames import SyntheticFrameSource
+from geometry import PRESETS, GridGeometry
+from palette import PALETTES, ColorClassifier, packed_bgra
+from parallel import ParallelAnalyzer, split_runs
+
+
+@pytest.mark.parametrize('parts', [1, 2, 3, 4, 7, 18, 40])
+def test_split_runs_covers_every_card_once(parts):
+    active = np.random.default_rng(parts).random((3, 6)) < 0.6
+    tiles = split_runs(card_runs(active, active.shape), parts)
+    assert len(tiles) <= parts
+    covered = np.zeros(active.shape, dtype=int)
+    for tile in tiles:
+        for r, c0, c1 in tile:
+            covered[r, c0:c1] += 1
+    np.testing.assert_array_equal(covered, active)
+    sizes = [sum(c1 - c0 for _, c0, c1 in tile) for tile in tiles]
+    # Equal tiles, the last one takes what is left
+    assert all(size == sizes[0] for size in sizes[:-1]) and sizes[-1] <= sizes[0]
+
+
+@pytest.mark.parametrize('mode', ['parallel', 'auto'])
+@pytest.mark.parametrize('workers', [2, 4])
+@pytest.mark.parametrize('name', sorted(PRESETS))
+def test_results_match_serial(name, workers, mode):
+    # Every card active, then a few random ones, frame after frame into
+    # reused outputs
+    preset = PRESETS[name]
+    geometry = GridGeometry.from_preset(preset, start=(50, 50))
+    synth = SyntheticFrameSource(preset, noise=2, seed=0)
+    rng = np.random.default_rng(0)
+    classifier = ColorClassifier([PALETTES['gold']])
+    analyzer = ParallelAnalyzer(classifier, workers, mode)
+    grid = (geometry.rows, geometry.cols)
+    expected = GridAnalysis.empty(grid, classifier.names)
+    out = GridAnalysis.empty(grid, classifier.names)
+    try:
+        for f in range(20):
+            frame = np.array(synth.grab(geometry.monitor))
+            cards = card_grid_view(frame[..., :3], *geometry.layout)
+            packed = card_grid_view(packed_bgra(frame), *geometry.layout)
+            active = None
+            if f >= 10:
+                active = np.zeros(grid, dtype=bool)
+                active.flat[rng.choice(active.size, 3, replace=False)] = True
+            analyze_grid(cards, packed, geometry.scan_y_start, geometry.scan_y_end, classifier, active,
+                         out=expected)
+            result = analyzer.analyze(cards, packed, geometry.scan_y_start, geometry.scan_y_end, active, out)
+            np.testing.assert_array_equal(result.brightness, expected.brightness)
+            np.testing.assert_array_equal(result.gold_counts, expected.gold_counts)
+    finally:
+        analyzer.close()
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from tests.helpers import detection_score, run_pipeline
+from frames import NpyFrameSource, SyntheticFrameSource
+from geometry import PRESETS
+
+
+@pytest.mark.parametrize('name', sorted(PRESETS))
+def test_game_detections(name):
+    # One scripted game through the headless tracker: every gold card found,
+    # nothing else
+    synth = SyntheticFrameSource(PRESETS[name], seed=0)
+    tracker, _ = run_pipeline(PRESETS[name], synth, len(synth))
+    hits, false_pos, missed = detection_score(tracker, synth.gold_cards)
+    assert (hits, false_pos, missed) == (len(synth.gold_cards), 0, 0)
+
+
+def test_npy_replay_detections(tmp_path):
+    # The same game replayed from a memory-mapped frame stack
+    synth = SyntheticFrameSource(PRESETS['FHD'], seed=0)
+    path = tmp_path / 'frames.npy'
+    np.save(path, synth.render_stack())
+    tracker, _ = run_pipeline(PRESETS['FHD'], NpyFrameSource(path), len(synth))
+    assert detection_score(tracker, synth.gold_cards) == (len(synth.gold_cards), 0, 0)
@@ -0,0 +1,63 @@
+import functools
+import time
+
+from tests.helpers import HeadlessOverlay, run_process_pipeline
+from frames import FrameSource, SyntheticFrameSource
+from geometry import PRESETS, GridGeometry
+from pipeline import ProcessPipeline
+
+
+class BrokenSource(FrameSource):
+    def grab(self, region):
+        raise RuntimeError("screen grab failed")
+
+
+def pump_until(pipeline, done, seconds=20):
+    deadline = time.perf_counter() + seconds
+    while not done() and time.perf_counter() < deadline:
+        pipeline.pump()
+        time.sleep(0.01)
+    return done()
+
+
+def test_game_detections():
+    # One full scripted game captured at 30 fps, unpaced capture would skip
+    # frames by design
+    factory = functools.partial(SyntheticFrameSource, PRESETS['FHD'], seed=0)
+    card_states = run_process_pipeline(PRESETS['FHD'], factory, len(factory()) / 30, 30)[3]
+    assert {card for card, state in card_states.items() if state == 'GOLD'} == factory().gold_cards
+
+
+def test_larger_geometry_moves_to_a_larger_ring():
+    # Launched for a single card, then the whole QHD grid
+    preset = PRESETS['QHD']
+    factory = functools.partial(SyntheticFrameSource, preset, seed=0)
+    synth = factory()
+    overlay = HeadlessOverlay(PRESETS['FHD'])
+    overlay.card_geometry = GridGeometry.from_card_origin(preset, (synth.card_x, synth.card_y), rows=1, cols=1)
+    errors = []
+    pipeline = ProcessPipeline(overlay, factory, active_fps=None, on_error=errors.append)
+    try:
+        pipeline.start()
+        assert pump_until(pipeline, lambda: pipeline.stats()['analyzed'] >= 5)
+        small = pipeline.ring.slot_bytes
+        overlay.card_geometry = GridGeometry.from_card_origin(preset, (synth.card_x, synth.card_y))
+        pipeline.pump()
+        assert pipeline.ring.slot_bytes >= pipeline._frame_bytes(overlay.card_geometry) > small
+        analyzed = pipeline.stats()['analyzed']
+        assert pump_until(pipeline, lambda: pipeline.stats()['analyzed'] >= analyzed + 20)
+        assert errors == []
+    finally:
+        pipeline.close()
+
+
+def test_capture_failure_is_reported():
+    overlay = HeadlessOverlay(PRESETS['FHD'])
+    errors = []
+    pipeline = ProcessPipeline(overlay, BrokenSource, active_fps=None, on_error=errors.append)
+    try:
+        pipeline.start()
+        assert pump_until(pipeline, lambda: errors)
+        assert errors[0].startswith("capture stopped:") and "screen grab failed" in errors[0]
+    finally:
+        pipeline.close()
@@ -0,0 +1,72 @@
+import gc
+import json
+import os
+
+import numpy as np
+
+from calibration import scale_preset
+from frames import SyntheticFrameSource
+from geometry import PRESETS, GridGeometry
+from palette import PALETTES, ColorClassifier
+from profiles import PROFILE_VERSION, Profile, load_presets, load_profile
+from tracker import CardTracker, ResultSink, TrackerConfig
+
+GOLD = [PALETTES['gold']]
+
+
+def test_compiled_table_is_memory_mapped(tmp_path):
+    built = ColorClassifier(GOLD, tmp_path)
+    ColorClassifier.load(GOLD, tmp_path)
+    loaded = ColorClassifier.load(GOLD, tmp_path)
+    assert isinstance(loaded.table, np.memmap)
+    np.testing.assert_array_equal(loaded.table, built.table)
+
+
+def test_truncated_compiled_table_is_rebuilt(tmp_path):
+    built = ColorClassifier(GOLD, tmp_path)
+    ColorClassifier.load(GOLD, tmp_path)
+    path = ColorClassifier.load(GOLD, tmp_path).table.filename
+    # The memory map is gone before the file is cut
+    gc.collect()
+    with open(path, 'r+b') as f:
+        f.truncate(1000)
+    np.testing.assert_array_equal(ColorClassifier.load(GOLD, tmp_path).table, built.table)
+
+
+def test_round_trip(tmp_path):
+    saved = Profile('board-1', PRESETS['QHD'], 'QHD', (3, 2), 3, 6, (412, 230), {'brightness': 24}, GOLD)
+    saved.save(tmp_path)
+    profile = Profile.load('board-1', tmp_path)
+    assert profile.to_dict() == saved.to_dict()
+    geometry = profile.geometry()
+    assert geometry == GridGeometry.from_card_origin(PRESETS['QHD'], (412, 230), (3, 2))
+    assert geometry.monitor['left'] == 412
+    # Thresholds not saved keep their defaults
+    assert profile.thresholds['stable_frames'] == 2
+    assert profile.classifier(os.path.join(tmp_path, 'cache')).names == ['gold']
+
+
+def test_unreadable_profiles_are_skipped(tmp_path):
+    saved = Profile('board-1', PRESETS['FHD'], 'FHD')
+    with open(Profile.path('future', tmp_path), 'w') as f:
+        json.dump(dict(saved.to_dict(), name='future', version=PROFILE_VERSION + 1), f)
+    with open(Profile.path('garbled', tmp_path), 'w') as f:
+        f.write('{"version": 1, "name": ')
+    assert load_profile('future', tmp_path) is None
+    assert load_profile('garbled', tmp_path) is None
+    assert load_profile('missing', tmp_path) is None
+
+
+def test_resolution_added_as_data(tmp_path):
+    # A resolution that exists only as a saved profile, tracked end to end
+    wide = Profile('ultrawide', scale_preset(PRESETS['FHD'], 1.25), 'UW-1.25')
+    synth = SyntheticFrameSource(wide.preset, noise=2, seed=0, loop=False)
+    wide.card_origin = (synth.card_x, synth.card_y)
+    wide.save(tmp_path)
+    assert load_presets(tmp_path).get('UW-1.25') == wide.preset
+    profile = load_profile('ultrawide', tmp_path)
+    tracker = CardTracker(TrackerConfig(profile.geometry()), ResultSink(), synth)
+    tracker.apply_profile(profile)
+    while tracker.process_frame(synth):
+        pass
+    assert {card for card, state in tracker.card_states.items() if state == 'GOLD'} == synth.gold_cards
@@ -0,0 +1,45 @@
+import pytest
+
+from tests.helpers import HeadlessOverlay
+from frames import SyntheticFrameSource
+from geometry import PRESETS
+from recognition import CardIndex, CardRecognizer, dhash, load_index
+from tracker import CardTracker
+
+
+@pytest.mark.parametrize('name', sorted(PRESETS))
+def test_every_card_identified(name):
+    # A noisy game against an index built on the clean faces
+    preset = PRESETS[name]
+    synth = SyntheticFrameSource(preset, noise=2, seed=0, loop=False)
+    index = CardIndex((f'card-{pair}', dhash(face[..., :3])) for (pair, _), face in synth.pair_faces.items())
+    overlay = HeadlessOverlay(preset)
+    tracker = CardTracker(overlay, overlay, synth)
+    tracker.recognizer = CardRecognizer(index)
+    while tracker.process_frame(synth):
+        pass
+    assert tracker.recognizer.names == {card: f'card-{pair}' for card, pair in synth.card_ids.items()}
+    assert len(tracker.recognizer.pairs()) == len(synth.card_ids) // 2
+
+
+def test_index_round_trip(tmp_path):
+    path = str(tmp_path / 'settings' / 'card_index.json')
+    CardIndex([('a', 0x0123456789abcdef), ('b', 0xfedcba9876543210)]).save(path)
+    index = load_index(path)
+    assert index.names == ['a', 'b']
+    assert index.lookup(0x0123456789abcdee) == ('a', 1)
+
+
+@pytest.mark.parametrize('content', ['{"version": 1, "cards": ', '{"version": 99, "cards": []}', '[]'])
+def test_bad_index_leaves_recognition_off(tmp_path, content, capsys):
+    path = tmp_path / 'card_index.json'
+    path.write_text(content)
+    assert load_index(str(path)) is None
+    assert 'Could not load card index' in capsys.readouterr().out
+    overlay = HeadlessOverlay(PRESETS['FHD'])
+    assert CardTracker(overlay, overlay, card_index_path=str(path)).recognizer is None
+
+
+def test_missing_index_is_silent(tmp_path, capsys):
+    assert load_index(str(tmp_path / 'card_index.json')) is None
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from tests.helpers import HeadlessOverlay, headless_tracker
+from frames import SyntheticFrameSource
+from geometry import PRESETS
+from recording import TRAILER, ReplayFrameSource, SessionReader, SessionRecorder
+from tracker import CardTracker, TrackerConfig
+
+NOISE = 2
+
+
+def game(preset):
+    return SyntheticFrameSource(preset, noise=NOISE, seed=0, loop=False)
+
+
+@pytest.fixture(scope='module', params=sorted(PRESETS))
+def session(request, tmp_path_factory):
+    # A noisy game recorded through the tracker. The queue holds the whole
+    # game, so the unpaced tracker can't outrun the writer.
+    preset = PRESETS[request.param]
+    path = str(tmp_path_factory.mktemp('session') / 'session.rec')
+    source = game(preset)
+    tracker = headless_tracker(preset, source)
+    recorder = tracker.recorder = SessionRecorder(path, queue_frames=len(source) + 1)
+    frames = 0
+    while tracker.process_frame(source):
+        frames += 1
+    recorder.close()
+    gold = {card for card, state in tracker.card_states.items() if state == 'GOLD'}
+    return preset, path, frames, recorder.stats(), gold
+
+
+def test_every_frame_recorded(session):
+    preset, path, frames, stats, _ = session
+    assert stats['dropped'] == 0
+    with SessionReader(path) as reader:
+        assert len(reader) == frames
+    assert stats['bytes'] < stats['raw_bytes']
+
+
+def test_reconstruction_within_capture_noise(session):
+    preset, path, _, _, _ = session
+    replay = game(preset)
+    monitor = HeadlessOverlay(preset).card_geometry.monitor
+    with SessionReader(path) as reader:
+        for i in range(len(reader)):
+            original = replay.grab(monitor)
+            assert np.abs(reader.read(i).astype(np.int16) - original).max() <= 2 * NOISE, f"frame {i}"
+
+
+def test_seeks_read_the_same_frames(session):
+    _, path, _, _, _ = session
+    with SessionReader(path) as reader:
+        samples = {i: reader.read(i).copy() for i in range(7, len(reader), 50)}
+        for i in sorted(samples, reverse=True):
+            np.testing.assert_array_equal(reader.read(i), samples[i])
+
+
+def test_replay_detects_the_live_gold_cards(session):
+    preset, path, _, _, gold = session
+    assert gold == game(preset).gold_cards
+    with SessionReader(path) as reader:
+        config = TrackerConfig(None)
+        source = ReplayFrameSource(reader, config)
+        replayed = CardTracker(config, HeadlessOverlay(preset), source)
+        while replayed.process_frame(source):
+            pass
+    assert {card for card, state in replayed.card_states.items() if state == 'GOLD'} == gold
+
+
+def test_unclosed_file_reads_the_same(session, tmp_path):
+    # Index and trailer cut off, as if the recorder never closed
+    _, path, frames, _, _ = session
+    with open(path, 'rb') as f:
+        data = f.read()
+    index_offset = TRAILER.unpack_from(data, len(data) - TRAILER.size)[0]
+    cut = tmp_path / 'unclosed.rec'
+    cut.write_bytes(data[:index_offset])
+    with SessionReader(path) as reader, SessionReader(str(cut)) as unclosed:
+        assert len(unclosed) == frames
+        np.testing.assert_array_equal(unclosed.read(frames - 1), reader.read(frames - 1))
@@ -0,0 +1,6 @@
+import regression
+
+
+def test_corpus_matches_baseline():
+    # Accuracy and latency against corpus/baseline.json
+    assert regression.main(['--skip-throughput', '--runs', '1']) == 0
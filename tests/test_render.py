@@ -0,0 +1,75 @@
+from PIL import Image
+
+from tests.helpers import FakeCanvas, FakePhoto, FakeTk
+from render import CardRenderer
+
+KEYS = [(r, c) for r in range(3) for c in range(6)]
+
+
+class RecordingPhoto(FakePhoto):
+    # Remembers the image it shows
+    def __init__(self, image):
+        super().__init__(image)
+        self.image = image
+
+    def paste(self, image):
+        self.image = image
+
+
+def flicker(renderer, tk, frames, tk_every, image):
+    # Every card re-posts its image each tracker frame, the Tk thread only
+    # gets a turn every tk_every frames
+    for frame in range(frames):
+        renderer.post([(key, image, 0, 0) for key in KEYS])
+        if frame % tk_every == 0:
+            tk.pump()
+    tk.pump()
+
+
+def test_updates_coalesce_into_one_callback():
+    tk = FakeTk()
+    canvas = FakeCanvas()
+    renderer = CardRenderer(canvas, tk.after, FakePhoto)
+    flicker(renderer, tk, 300, 3, Image.new('RGBA', (137, 39)))
+    assert tk.max_queue == 1
+    assert renderer.callbacks == 101
+    # One PhotoImage and one canvas item per slot, reused afterwards
+    assert renderer.photos_created == len(KEYS)
+    assert canvas.created == len(KEYS)
+    assert canvas.deleted == 0
+
+
+def test_latest_update_wins():
+    tk = FakeTk()
+    renderer = CardRenderer(FakeCanvas(), tk.after, RecordingPhoto)
+    first, second = Image.new('RGBA', (137, 39)), Image.new('RGBA', (137, 39))
+    renderer.post([((0, 0), first, 0, 0)])
+    tk.pump()
+    renderer.post([((0, 0), first, 0, 0)])
+    renderer.post([((0, 0), second, 0, 0)])
+    tk.pump()
+    assert renderer.slots[(0, 0)].photo.image is second
+    assert renderer.callbacks == 2
+
+
+def test_size_change_makes_a_new_photo():
+    tk = FakeTk()
+    canvas = FakeCanvas()
+    renderer = CardRenderer(canvas, tk.after, FakePhoto)
+    renderer.post([((0, 0), Image.new('RGBA', (137, 39)), 0, 0)])
+    tk.pump()
+    renderer.post([((0, 0), Image.new('RGBA', (183, 52)), 0, 0)])
+    tk.pump()
+    assert renderer.photos_created == 2
+    assert renderer.slots[(0, 0)].size == (183, 52)
+    assert canvas.created == 1
+
+
+def test_clear_drops_queued_updates():
+    tk = FakeTk()
+    renderer = CardRenderer(FakeCanvas(), tk.after, FakePhoto)
+    renderer.post([((0, 0), Image.new('RGBA', (137, 39)), 0, 0)])
+    renderer.clear()
+    tk.pump()
+    assert renderer.slots == {}
+    assert renderer.callbacks == 1
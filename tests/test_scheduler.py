@@ -0,0 +1,69 @@
+import threading
+import time
+
+from frames import SyntheticFrameSource
+from geometry import PRESETS
+from scheduler import FrameScheduler
+from tests.helpers import headless_tracker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_active_then_idle_pacing():
+    clock = FakeClock()
+    scheduler = FrameScheduler(active_fps=10, idle_fps=2, linger=0.5, clock=clock, sleep=clock.sleep)
+    scheduler.wait(True)
+    scheduler.wait(False)
+    assert clock.sleeps == [0.1, 0.1]
+    for _ in range(5):
+        scheduler.wait(False)
+    assert clock.sleeps[-1] == 0.5
+    # A frame past its deadline is missed, the schedule restarts from now
+    clock.now += 2.0
+    scheduler.wait(False)
+    assert scheduler.missed == 1
+
+
+def test_interrupt_cuts_the_wait_short():
+    scheduler = FrameScheduler(active_fps=1, idle_fps=1)
+    scheduler.wait(False)
+    threading.Timer(0.05, scheduler.interrupt).start()
+    start = time.perf_counter()
+    scheduler.wait(False)
+    assert time.perf_counter() - start < 0.5
+    # Until reset, later waits don't sleep either
+    start = time.perf_counter()
+    scheduler.wait(False)
+    assert time.perf_counter() - start < 0.5
+    scheduler.reset()
+    assert not scheduler.interrupted.is_set()
+
+
+def test_stop_ends_an_idle_loop_promptly():
+    # Idle at 1 fps: stop() must not leave the loop asleep for up to a
+    # second, a START right after STOP waits for it (main.start_tracking)
+    preset = PRESETS['FHD']
+    source = SyntheticFrameSource(preset, seed=0)
+    tracker = headless_tracker(preset, source)
+    tracker.scheduler = FrameScheduler(1, 1)
+    tracker.running = True
+    thread = threading.Thread(target=tracker.run_loop)
+    thread.start()
+    while tracker.scheduler.frames < 2:
+        time.sleep(0.01)
+    start = time.perf_counter()
+    tracker.stop()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert time.perf_counter() - start < 0.5
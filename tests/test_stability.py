@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from analysis import card_grid_view
+from frames import SyntheticFrameSource
+from geometry import PRESETS, GridGeometry
+from stability import StabilityTracker
+
+
+@pytest.mark.parametrize('name', sorted(PRESETS))
+def test_stable_only_after_unchanged_poses(name):
+    # Animated flips with capture noise: a card reads stable once its pose has
+    # been unchanged for two frame steps, and never while it is still moving
+    # with the face showing (a half-flipped card would reach gold analysis)
+    preset = PRESETS[name]
+    geometry = GridGeometry.from_preset(preset, start=(50, 50))
+    synth = SyntheticFrameSource(preset, noise=2, seed=0, loop=False)
+    phase = synth.phase
+    expected = np.zeros(phase.shape, dtype=bool)
+    expected[2:] = (phase[2:] == phase[1:-1]) & (phase[1:-1] == phase[:-2])
+    face_showing = phase >= 0.5
+
+    checker = StabilityTracker()
+    for f in range(len(synth)):
+        frame = synth.grab(geometry.monitor)[..., :3]
+        stable = checker.update(card_grid_view(frame, *geometry.layout))
+        assert not np.any(stable & ~expected[f] & face_showing[f]), f"false stable on frame {f}"
+        assert not np.any(expected[f] & ~stable), f"missed stable on frame {f}"
+
+
+def test_grid_change_reallocates():
+    checker = StabilityTracker()
+    checker.update(np.zeros((3, 6, 8, 8, 3), dtype=np.uint8))
+    checker.update(np.zeros((3, 6, 8, 8, 3), dtype=np.uint8))
+    stable = checker.update(np.zeros((4, 6, 8, 8, 3), dtype=np.uint8))
+    assert stable.shape == (4, 6)
+    assert not stable.any()
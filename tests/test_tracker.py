@@ -0,0 +1,57 @@
+import threading
+import time
+
+from tests.helpers import detection_score, headless_tracker
+from frames import SyntheticFrameSource
+from geometry import PRESETS
+
+
+def test_reset_waits_for_next_frame():
+    # reset() only marks the state stale; the tracker clears it when its
+    # next frame starts, and tracks the game from scratch after that
+    preset = PRESETS['FHD']
+    synth = SyntheticFrameSource(preset, seed=0)
+    tracker = headless_tracker(preset, synth)
+    for _ in range(len(synth)):
+        tracker.process_frame(synth)
+    buffers = tracker.buffers
+    assert tracker.card_states
+
+    tracker.reset()
+    assert tracker.buffers is buffers
+    assert tracker.card_states
+
+    for _ in range(len(synth)):
+        tracker.process_frame(synth)
+    assert tracker.buffers is not buffers
+    assert detection_score(tracker, synth.gold_cards) == (len(synth.gold_cards), 0, 0)
+
+
+def test_reset_during_run_loop():
+    # RESET pressed on the UI thread while the tracker thread is mid-frame
+    # must not pull the buffers out from under that frame
+    preset = PRESETS['FHD']
+    synth = SyntheticFrameSource(preset, noise=2, seed=0)
+    tracker = headless_tracker(preset, synth)
+    tracker.scheduler.sleep = lambda seconds: None
+    errors = []
+
+    def run():
+        try:
+            tracker.run_loop()
+        except Exception as e:
+            errors.append(e)
+
+    tracker.running = True
+    thread = threading.Thread(target=run)
+    thread.start()
+    deadline = time.perf_counter() + 2.0
+    while time.perf_counter() < deadline and thread.is_alive():
+        tracker.reset()
+        time.sleep(0.001)
+    tracker.stop()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert errors == []
+    assert tracker.scheduler.frames > 0
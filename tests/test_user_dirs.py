@@ -0,0 +1,10 @@
+import os
+
+from palette import cache_dir
+from profiles import profile_dir
+from recognition import index_path
+
+
+def test_settings_and_caches_in_scratch_home(user_dirs):
+    for path in (cache_dir(), profile_dir(), index_path()):
+        assert os.path.commonpath([path, str(user_dirs)]) == str(user_dirs)
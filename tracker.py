@@ -1,31 +1,150 @@
-import mss
 import numpy as np
 from PIL import Image
-import time
+
+from analysis import card_brightness, card_grid_view, gold_pixel_counts, analyze_grid
+from capture import bgr_to_rgb
+from cardstate import CardBuffers, CardStateMachine
+from frames import MssFrameSource
+from instrument import Instrumentation
+from palette import PALETTES, ColorClassifier, pack_rgb, packed_bgra
+from recognition import CardRecognizer, load_index
+from scheduler import FrameScheduler
+from stability import StabilityTracker
+
+# Overlay label colors: identified cards, and one color per matched pair
+# (pure white is the overlay's transparent color)
+LABEL_COLOR = '#e0e0e0'
+PAIR_COLORS = ('#ff5555', '#55ff55', '#5599ff', '#ffaa00', '#ff55ff', '#00dddd', '#dddd00', '#aa66ff', '#ff9988')
+
+
+class TrackerConfig:
+    # What the tracker reads from its surroundings. The tracker takes one
+    # card_geometry snapshot per frame, so another thread may replace it with
+    # a new GridGeometry at any time. CardOverlay provides the same attributes.
+    def __init__(self, card_geometry, overlay_alpha=230):
+        self.card_geometry = card_geometry
+        self.overlay_alpha = overlay_alpha
+
+
+class ResultSink:
+    # Receives the tracker's results, on the tracker thread. CardOverlay
+    # draws them, pipeline.EventOverlay forwards them to the GUI process.
+    def update_card_images(self, updates):
+        # (row, col, pil_image, y_offset): the card's best gold crop so far,
+        # starting y_offset pixels below the card's top edge
+        pass
+
+    def update_card_labels(self, labels):
+        # Every identified card as (row, col, name, color)
+        pass
+
+    def clear_marks(self):
+        # Tracker was reset, earlier results no longer apply
+        pass
+
 
 class CardTracker:
-    def __init__(self, app_ref):
-        self.app = app_ref
-        self.overlay = app_ref.overlay
+    # Detection core, free of Tk: frames come from a FrameSource, the grid
+    # from config (see TrackerConfig) and results go to sink (see ResultSink).
+    def __init__(self, config, sink, source=None, instrumentation=None, events=None, card_index_path=None):
+        self.config = config
+        self.sink = sink
+        # EventPublisher (events.py) streaming card changes to other tools, or None
+        self.events = events
+        # SessionRecorder (recording.py) saving the captured frames, or None
+        self.recorder = None
+        # ParallelAnalyzer (parallel.py) spreading card analysis over a thread
+        # pool, or None to analyze on this thread only
+        self.analyzer = None
+        # FrameSource to capture from; None opens a live mss source in run_loop
+        self.source = source
+        # Per-stage timings, disabled (no-op) unless the UI turns it on
+        self.instrumentation = instrumentation or Instrumentation()
         self.running = False
+        # Set by reset(), applied by the tracker thread at its next frame
+        self._reset_pending = False
         self.card_states = {} # (row, col) -> 'UNKNOWN', 'GOLD', 'OTHER'
-        self.best_gold_counts = {} # (row, col) -> max_count
+        # Per-card arrays (best gold counts, frame masks), see cardstate.CardBuffers
+        self.buffers = None
         
         # Color definitions
         # Gold: #C17E25 -> RGB(193, 126, 37)
         self.TARGET_COLOR = (193, 126, 37)
         self.COLOR_TOLERANCE = 5
+        # Scan strip palettes, compiled into one lookup table (cached on disk,
+        # memory-mapped)
+        self.classifier = ColorClassifier.load([PALETTES['gold']])
         
         # Brightness Threshold for Flipped vs Face Down
         # Face down is #040001 (very dark)
         # Flipped is "much brighter"
         self.BRIGHTNESS_THRESHOLD = 20 
+        
+        # Capture mode
+        # True: analyze the mss BGRA buffer in place (no copies)
+        # False: legacy PIL conversion to RGB (two full-frame copies)
+        self.zero_copy_capture = True
+        
+        # Stability: a card is analyzed once its signature has changed by less
+        # than STABLE_DIFF_THRESHOLD (mean pixel value, 2-3 is usually noise/minor
+        # shifts) for STABLE_FRAMES frames in a row
+        self.STABLE_DIFF_THRESHOLD = 5.0
+        self.STABLE_FRAMES = 2
+        self.stability = StabilityTracker(self.STABLE_DIFF_THRESHOLD, self.STABLE_FRAMES)
+        
+        # Incremental evaluation: idle (face down) and resolved cards only get
+        # a cheap change probe, full analysis runs on the rest (see cardstate.py).
+        # False analyzes every card every frame.
+        self.incremental = True
+        self.card_machine = CardStateMachine()
+        
+        # Frame pacing: ACTIVE_FPS while any card signature is changing (and for
+        # a second after), IDLE_FPS while the board sits still
+        self.ACTIVE_FPS = 30
+        self.IDLE_FPS = 5
+        self.scheduler = FrameScheduler(self.ACTIVE_FPS, self.IDLE_FPS)
+        self.motion = False
+        
+        # Card identity: faces are hashed once when they settle and looked up in
+        # the index at card_index_path (default: recognition.index_path()).
+        # Off without a readable index.
+        index = load_index(card_index_path)
+        self.recognizer = CardRecognizer(index) if index is not None else None
 
     def reset(self):
+        # Forget every card. Callable from any thread (the UI's RESET
+        # button): the per-card state is cleared at the start of the next
+        # frame, never under a frame in progress. The overlay clears now,
+        # and again with the state in case that frame still posted marks.
+        self._reset_pending = True
+        self.sink.clear_marks()
+
+    def _apply_reset(self):
+        self._reset_pending = False
         self.card_states = {}
-        self.best_gold_counts = {} # (row, col) -> max_count
-        self.stability_cache = {}
-        self.overlay.clear_marks()
+        self.buffers = None
+        self.stability.reset()
+        self.card_machine.reset()
+        if self.recognizer is not None:
+            self.recognizer.reset()
+        self.sink.clear_marks()
+        if self.events is not None:
+            self.events.publish('reset')
+
+    def apply_profile(self, profile):
+        # Thresholds and palettes of a profiles.Profile (the grid itself
+        # comes from config). Between frames only, e.g. before starting.
+        self.BRIGHTNESS_THRESHOLD = profile.thresholds['brightness']
+        self.STABLE_DIFF_THRESHOLD = profile.thresholds['stable_diff']
+        self.STABLE_FRAMES = profile.thresholds['stable_frames']
+        self.stability = StabilityTracker(self.STABLE_DIFF_THRESHOLD, self.STABLE_FRAMES)
+        self.classifier = profile.classifier()
+        if self.analyzer is not None:
+            from parallel import ParallelAnalyzer
+            self.analyzer.close()
+            self.analyzer = ParallelAnalyzer(self.classifier, self.analyzer.workers, self.analyzer.mode)
+        self.buffers = None
+        self.card_machine.reset()
 
     def start(self):
         self.running = True
@@ -33,139 +152,196 @@ class CardTracker:
 
     def stop(self):
         self.running = False
+        self.scheduler.interrupt()
 
     def run_loop(self):
-        with mss.mss() as sct:
+        source = self.source or MssFrameSource()
+        self.scheduler.reset()
+        with source:
             while self.running:
-                start_time = time.time()
-                
-                # Optimize: Capture the entire grid area once
-                # We need the bounding box of all cards
-                # Top-left of (0,0)
-                r0_c0 = self.overlay.get_card_region(0, 0)
-                # Bottom-right of (2,5)
-                r2_c5 = self.overlay.get_card_region(2, 5)
+                if not self.process_frame(source):
+                    # Finite source ran out of frames
+                    self.running = False
+                    break
                 
-                # mss monitor dict
-                monitor = {
-                    'top': r0_c0['top'],
-                    'left': r0_c0['left'],
-                    'width': (r2_c5['left'] + r2_c5['width']) - r0_c0['left'],
-                    'height': (r2_c5['top'] + r2_c5['height']) - r0_c0['top']
-                }
+                # Sleep until the next frame deadline (rate depends on motion)
+                self.scheduler.wait(self.motion)
+                self.instrumentation.dropped = self.scheduler.missed
+        
+        if self.analyzer is not None:
+            self.analyzer.close()
+
+    def process_frame(self, source):
+        if self._reset_pending:
+            self._apply_reset()
+        instr = self.instrumentation
+        instr.frame_start()
+        # One geometry snapshot per frame, published by the UI thread
+        # (no Tk calls from this thread)
+        geometry = self.config.card_geometry
+        
+        # Capture the entire grid area once
+        monitor = geometry.monitor
+        if self.zero_copy_capture:
+            # BGR view over the raw buffer, channels are reordered only for overlay crops
+            frame = source.grab(monitor)
+            if frame is None:
+                return False
+            instr.lap('capture')
+            if self.recorder is not None:
+                self.recorder.write(frame, geometry)
+            instr.lap('record')
+            full_grid_arr = frame[..., :3]
+            packed_grid = packed_bgra(frame)
+        else:
+            # Legacy PIL conversion, live mss source only (not recorded)
+            full_grid_img = self.capture_region(source.sct, monitor)
+            instr.lap('capture')
+            instr.lap('record')
+            full_grid_arr = np.array(full_grid_img)
+            packed_grid = pack_rgb(full_grid_arr)
+        instr.lap('convert')
+        
+        # (rows, cols, card_h, card_w, 3) view, cards follow at the cell pitch
+        cards = card_grid_view(full_grid_arr, *geometry.layout)
+        packed_cards = card_grid_view(packed_grid, *geometry.layout)
+        buffers = self.buffers
+        if buffers is None or buffers.best_gold.shape != cards.shape[:2]:
+            buffers = self.buffers = CardBuffers(cards.shape[:2], self.classifier.names)
+        instr.lap('crop')
+        
+        # --- Stability Check ---
+        # User requirement: "2 frames or more with very little change"
+        active = None
+        if self.incremental:
+            # Cards to analyze this frame; probed cards that moved start over
+            active = self.card_machine.probe(cards)
+            self.stability.restart(self.card_machine.fired)
+        stable = self.stability.update(cards, active)
+        self.motion = bool(self.stability.changed().any())
+        if active is not None:
+            self.motion |= bool(self.card_machine.fired.any())
+        instr.lap('stability')
+        
+        # --- Analysis ---
+        # Results and masks are written into the buffers, in place
+        if self.analyzer is not None:
+            result = self.analyzer.analyze(cards, packed_cards, geometry.scan_y_start, geometry.scan_y_end,
+                                           active, buffers.analysis)
+        else:
+            result = analyze_grid(cards, packed_cards, geometry.scan_y_start, geometry.scan_y_end, self.classifier,
+                                  active, out=buffers.analysis)
+        
+        # Only process if stable (to avoid ghosting) and flipped
+        face_up = np.greater(result.brightness, self.BRIGHTNESS_THRESHOLD, out=buffers.face_up)
+        if active is None:
+            settled = np.logical_and(stable, face_up, out=buffers.settled)
+        else:
+            settled = self.card_machine.update(cards, active, stable, face_up)
+        if self.events is not None:
+            self.publish_card_changes(active, stable, face_up, settled, buffers)
+        # If this is a "Gold" card (has significant gold pixels)
+        candidates = np.greater(result.gold_counts, geometry.gold_threshold, out=buffers.candidates)
+        np.logical_and(candidates, settled, out=candidates)
+        # If this frame has more gold detail than before, update the overlay
+        improved = np.greater(result.gold_counts, buffers.best_gold, out=buffers.improved)
+        np.logical_and(improved, candidates, out=improved)
+        labels = self.identify_settled(cards, settled, buffers) if self.recognizer is not None else None
+        instr.lap('classify')
+        
+        # Overlay images produced this frame, handed over in one batch
+        updates = []
+        if improved.any():
+            np.copyto(buffers.best_gold, result.gold_counts, where=improved)
+            for r, c in zip(*np.nonzero(improved)):
+                r, c = int(r), int(c)
+                self.card_states[(r, c)] = 'GOLD'
+                if self.events is not None:
+                    self.events.publish('gold', r, c, count=int(buffers.best_gold[r, c]))
                 
-                # Capture full grid
-                full_grid_img = self.capture_region(sct, monitor)
-                full_grid_arr = np.array(full_grid_img)
+                # Create faint overlay image
+                # Crop from scan_y_end to bottom (below the scan strip)
+                crop_y = geometry.scan_y_end
                 
-                # Iterate over all cards
-                for r in range(3):
-                    for c in range(6):
-                        # Calculate relative coordinates for cropping
-                        # We can't use get_card_region directly because it returns global coords
-                        # We need coords relative to the monitor['left'], monitor['top']
-                        
-                        # Re-calculate card position based on overlay config
-                        # This duplicates some logic but avoids threading issues with calling overlay methods too often
-                        # Ideally overlay should provide relative coords, but let's calculate:
-                        
-                        # Global coords of this card
-                        card_global = self.overlay.get_card_region(r, c)
-                        
-                        # Relative to captured grid
-                        rel_x = card_global['left'] - monitor['left']
-                        rel_y = card_global['top'] - monitor['top']
-                        rel_w = card_global['width']
-                        rel_h = card_global['height']
-                        
-                        # Crop card image
-                        # Check bounds
-                        if rel_x < 0 or rel_y < 0 or rel_x + rel_w > full_grid_arr.shape[1] or rel_y + rel_h > full_grid_arr.shape[0]:
-                            continue
-                            
-                        card_arr = full_grid_arr[rel_y:rel_y+rel_h, rel_x:rel_x+rel_w]
-                        img = Image.fromarray(card_arr) # Convert back to PIL for existing methods if needed, or keep as arr
-                        
-                        # --- Stability Check ---
-                        # Key: (r, c)
-                        # We store: {'last_arr': np_array, 'stable_frames': int}
-                        if not hasattr(self, 'stability_cache'):
-                            self.stability_cache = {}
-                            
-                        cache = self.stability_cache.get((r, c), {'last_arr': None, 'stable_frames': 0})
-                        
-                        is_stable = False
-                        is_stable = False
-                        if cache['last_arr'] is not None:
-                            # Check if shapes match (user might have changed config)
-                            if cache['last_arr'].shape == card_arr.shape:
-                                # Calculate difference
-                                # Simple mean absolute difference
-                                diff = np.mean(np.abs(card_arr - cache['last_arr']))
-                                
-                                # Threshold for "very little change". 
-                                # 2-3 pixel value average diff is usually noise/minor shifts.
-                                if diff < 5.0:
-                                    cache['stable_frames'] += 1
-                                else:
-                                    cache['stable_frames'] = 0
-                            else:
-                                # Shape mismatch, reset
-                                cache['stable_frames'] = 0
-                        else:
-                            cache['stable_frames'] = 0
-                            
-                        # Update cache
-                        cache['last_arr'] = card_arr
-                        self.stability_cache[(r, c)] = cache
-                        
-                        # User requirement: "2 frames or more with very little change"
-                        # So stable_frames >= 2
-                        if cache['stable_frames'] >= 2:
-                            is_stable = True
-                        
-                        # --- Analysis ---
-                        # Only process if stable (to avoid ghosting)
-                        if is_stable:
-                            is_flipped = self.check_flipped(card_arr) # Updated to accept array
-                            
-                            if is_flipped:
-                                gold_count = self.count_gold_pixels(card_arr) # Updated to accept array
-                                
-                                # If this is a "Gold" card (has significant gold pixels)
-                                if gold_count > self.overlay.gold_threshold:
-                                    current_best = self.best_gold_counts.get((r, c), 0)
-                                    
-                                    # If this frame has more gold detail than before, update the overlay
-                                    if gold_count > current_best:
-                                        self.best_gold_counts[(r, c)] = gold_count
-                                        self.card_states[(r, c)] = 'GOLD'
-                                        
-                                        # Create faint overlay image
-                                        # Crop from scan_y_end to bottom (below the scan strip)
-                                        crop_y = self.overlay.scan_y_end
-                                        
-                                        # Crop is relative to card height.
-                                        # card_arr is (h, w, 3)
-                                        if card_arr.shape[0] > crop_y:
-                                            crop_arr = card_arr[crop_y:, :, :]
-                                            overlay_img = Image.fromarray(crop_arr)
-                                            
-                                            # Add alpha channel for transparency (use configured alpha)
-                                            overlay_img.putalpha(self.overlay.overlay_alpha) 
-                                            
-                                            # Debug logic removed as requested
-                                            
-                                            self.overlay.update_card_image(r, c, overlay_img, y_offset=crop_y)
-                            else:
-                                # Card is face down
-                                pass
-                            
-                # Sleep to maintain ~30 FPS (0.033s)
-                elapsed = time.time() - start_time
-                if elapsed < 0.033:
-                    time.sleep(0.033 - elapsed)
-                # self.overlay.update() # Removed as we use after() in overlay
+                # Crop is relative to card height.
+                # card_arr is (h, w, 3)
+                card_arr = cards[r, c]
+                if card_arr.shape[0] > crop_y:
+                    crop_arr = card_arr[crop_y:, :, :]
+                    if self.zero_copy_capture:
+                        crop_arr = bgr_to_rgb(crop_arr)
+                    overlay_img = Image.fromarray(np.ascontiguousarray(crop_arr))
+                    
+                    # Add alpha channel for transparency (use configured alpha)
+                    overlay_img.putalpha(self.config.overlay_alpha)
+                    
+                    updates.append((r, c, overlay_img, crop_y))
+        
+        if updates:
+            self.sink.update_card_images(updates)
+        if labels:
+            self.sink.update_card_labels(labels)
+        instr.lap('dispatch')
+        instr.frame_end()
+        return True
+
+    def identify_settled(self, cards, settled, buffers):
+        # Hash cards that just settled face up, one attempt per settle; known
+        # positions come from the recognizer's session cache.
+        # Returns the full label list when a new card was identified.
+        tried, pending = buffers.tried, buffers.pending
+        np.logical_and(tried, settled, out=tried)
+        np.logical_not(tried, out=pending)
+        np.logical_and(pending, settled, out=pending)
+        np.logical_or(tried, settled, out=tried)
+        if not pending.any():
+            return None
+        
+        recognizer = self.recognizer
+        identified = False
+        for r, c in zip(*np.nonzero(pending)):
+            key = (int(r), int(c))
+            if key in recognizer.names:
+                continue
+            name = recognizer.identify(key, cards[key])
+            if name is not None:
+                identified = True
+                if self.events is not None:
+                    self.events.publish('name', *key, name=name)
+        if not identified:
+            return None
+        
+        # Matched pairs share a color
+        pair_colors = {name: PAIR_COLORS[i % len(PAIR_COLORS)] for i, name in enumerate(sorted(recognizer.pairs()))}
+        return [
+            (r, c, name, pair_colors.get(name, LABEL_COLOR))
+            for (r, c), name in sorted(recognizer.names.items())
+        ]
+
+    def publish_card_changes(self, active, stable, face_up, settled, buffers):
+        # Flip and settle events from this frame's masks. A card flipped when
+        # it comes to rest (analyzed and stable) showing the other face than at
+        # its last rest; the board starts out face down.
+        events = self.events
+        at_rest, changes = buffers.at_rest, buffers.changes
+        if active is None:
+            np.copyto(at_rest, stable)
+        else:
+            np.logical_and(stable, active, out=at_rest)
+        np.not_equal(buffers.resting_up, face_up, out=changes)
+        np.logical_and(changes, at_rest, out=changes)
+        if changes.any():
+            for r, c in zip(*np.nonzero(changes)):
+                events.publish('flip', int(r), int(c), up=bool(face_up[r, c]))
+            np.copyto(buffers.resting_up, face_up, where=at_rest)
+        
+        # Settled this frame but not the one before
+        np.logical_not(buffers.was_settled, out=changes)
+        np.logical_and(changes, settled, out=changes)
+        if changes.any():
+            for r, c in zip(*np.nonzero(changes)):
+                events.publish('settle', int(r), int(c))
+        np.copyto(buffers.was_settled, settled)
 
     def capture_region(self, sct, region):
         # mss region: {'top': y, 'left': x, 'width': w, 'height': h}
@@ -179,7 +355,7 @@ class CardTracker:
         else:
             arr = img_or_arr
             
-        avg_brightness = np.mean(arr)
+        avg_brightness = card_brightness(arr)
         return avg_brightness > self.BRIGHTNESS_THRESHOLD
 
     def count_gold_pixels(self, img_or_arr):
@@ -189,40 +365,9 @@ class CardTracker:
         else:
             arr = img_or_arr
         
-        h, w, _ = arr.shape
-        
-        # Get scan range from overlay config
-        scan_start = self.overlay.scan_y_start
-        scan_end = self.overlay.scan_y_end
-        
-        y_start = min(scan_start, h)
-        y_end = min(scan_end, h)
-        
-        if y_start == y_end:
-            return 0
-            
-        strip = arr[y_start:y_end, :, :]
-        
-        # Target Colors:
-        # 1. #B47834 -> RGB(180, 120, 52)
-        # 2. #C17E25 -> RGB(193, 126, 37)
-        # We will check if pixel matches ANY of these with tolerance
-        targets = [
-            (180, 120, 52),
-            (193, 126, 37)
-        ]
-        tolerance = 15 # Increased tolerance as requested ("much wider")
-        
-        combined_mask = np.zeros(strip.shape[:2], dtype=bool)
-        
-        for target in targets:
-            lower = np.array([max(0, c - tolerance) for c in target])
-            upper = np.array([min(255, c + tolerance) for c in target])
-            
-            mask = np.all((strip >= lower) & (strip <= upper), axis=-1)
-            combined_mask = combined_mask | mask
-            
-        return np.sum(combined_mask)
+        # Get scan range from the grid config
+        geometry = self.config.card_geometry
+        return gold_pixel_counts(arr, geometry.scan_y_start, geometry.scan_y_end)
 
     def check_gold(self, img):
         # Deprecated, using count_gold_pixels directly